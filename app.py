@@ -1,35 +1,264 @@
 print("Starting application...")
-from flask import Flask, request, jsonify, render_template, redirect, url_for, flash, session
+from flask import Flask, request, jsonify, render_template, redirect, url_for, flash, session, stream_with_context
 import hashlib
 import re
 import os
-import subprocess
 import threading
 import secrets
 import time
 import socket
-from datetime import datetime, timedelta
+import shutil
+import tempfile
+import json
+import math
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from datetime import datetime, timedelta, timezone
 from werkzeug.security import generate_password_hash, check_password_hash
-from models import db, User, Challenge, Submission, Hint, Achievement, Token
+from models import db, User, Challenge, Submission, Hint, Achievement, Token, TokenRevocation, Solve, hash_password
+from warm_pool import WarmPool
+from container_runtime import (create_runtime, ContainerRuntimeError, ContainerNotFound,
+                               remove_containers, remove_images, wait_running)
+from provisioning import ProvisioningQueue
+from port_allocator import PortAllocator
+from container_registry import ContainerRegistry
+from state_store import create_state_store
+from expiry_scheduler import ExpiryScheduler
+from container_events import ContainerEventMonitor
+from token_cache import TokenCache, MISSING
+from session_tokens import TokenRevocations, encode_token, decode_token, is_signed_token, encode_capability
+from rate_limit import RateLimiter
+from scoring import record_solve, get_solve, is_solved
+from leaderboard import Leaderboard
+from events import EventBroadcaster, format_event
+import queries
+from exports import EXPORT_FORMATS, export_chunks, ndjson_chunks, gzip_chunks
+import db_config
+from migrations import run_migrations
 print("Imports completed successfully")
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = secrets.token_hex(32)
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///ctf.db'
+db_config.configure_app(app)
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
 # Initialize the database
 db.init_app(app)
 
-# In-memory storage for container management
-active_containers = {}
+# Verified tokens are cached per worker, so a deactivated token or changed user is seen
+# by other workers within CTF_TOKEN_CACHE_TTL seconds
+token_cache = TokenCache(
+    max_size=int(os.environ.get('CTF_TOKEN_CACHE_SIZE', '10000')),
+    ttl=float(os.environ.get('CTF_TOKEN_CACHE_TTL', '60')),
+    negative_ttl=float(os.environ.get('CTF_TOKEN_CACHE_NEGATIVE_TTL', '5'))
+)
+
+# Login attempts are limited per client IP and per username with token buckets
+# (CTF_LOGIN_RATE_* tokens per second, bursts of CTF_LOGIN_BURST_*)
+login_ip_limiter = RateLimiter(
+    rate=float(os.environ.get('CTF_LOGIN_RATE_PER_IP', '1')),
+    burst=int(os.environ.get('CTF_LOGIN_BURST_PER_IP', '20'))
+)
+login_user_limiter = RateLimiter(
+    rate=float(os.environ.get('CTF_LOGIN_RATE_PER_USER', '0.2')),
+    burst=int(os.environ.get('CTF_LOGIN_BURST_PER_USER', '5'))
+)
+
+# Password hashing is CPU heavy, so at most this many hashes run at once and up to
+# CTF_PASSWORD_HASH_QUEUE more wait for their turn. Logins beyond that, or whose hash
+# hasn't finished within CTF_PASSWORD_HASH_TIMEOUT seconds, get a 503. This limits
+# how much hashing runs at once; it doesn't free the request thread, which still
+# waits for its hash.
+PASSWORD_HASH_WORKERS = int(os.environ.get('CTF_PASSWORD_HASH_WORKERS', '2'))
+PASSWORD_HASH_QUEUE = int(os.environ.get('CTF_PASSWORD_HASH_QUEUE', '8'))
+PASSWORD_HASH_TIMEOUT = float(os.environ.get('CTF_PASSWORD_HASH_TIMEOUT', '10'))
+password_hash_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="password-hash")
+password_hash_slots = threading.BoundedSemaphore(PASSWORD_HASH_WORKERS + PASSWORD_HASH_QUEUE)
+
+class PasswordHashingBusy(Exception):
+    """Raised when a password can't be hashed now because too many are waiting"""
+
+# Session tokens are either random strings stored in the Token table ("db") or
+# HMAC-signed tokens that are verified without a database lookup ("signed")
+TOKEN_MODE = os.environ.get('CTF_TOKEN_MODE', 'db')
+TOKEN_SECRET = os.environ.get('CTF_TOKEN_SECRET')
+TOKEN_LIFETIME = int(os.environ.get('CTF_TOKEN_LIFETIME', '86400'))
+
+# Expired and deactivated Token rows are deleted in batches by a background job
+TOKEN_PRUNE_INTERVAL = int(os.environ.get('CTF_TOKEN_PRUNE_INTERVAL', '3600'))
+TOKEN_PRUNE_BATCH_SIZE = int(os.environ.get('CTF_TOKEN_PRUNE_BATCH_SIZE', '1000'))
+if TOKEN_MODE not in ('db', 'signed'):
+    raise ValueError(f"Unknown token mode: {TOKEN_MODE}")
+if TOKEN_MODE == 'signed' and not TOKEN_SECRET:
+    print("Warning: CTF_TOKEN_SECRET is not set, signed tokens will not survive a restart "
+          "or work across worker processes")
+    TOKEN_SECRET = secrets.token_hex(32)
+
+def load_token_generations():
+    return db.session.query(TokenRevocation.user_id, TokenRevocation.generation).all()
+
+token_revocations = TokenRevocations(load_token_generations,
+                                     refresh_interval=float(os.environ.get('CTF_TOKEN_REVOCATION_REFRESH', '30')))
+
+def load_leaderboard():
+    solves = db.session.query(
+        Solve.user_id,
+        db.func.count(Solve.id).label('solved'),
+        db.func.max(Solve.solved_at).label('last_solve_at')
+    ).group_by(Solve.user_id).subquery()
+    rows = db.session.query(
+        User.id, User.username, User.points, solves.c.solved, solves.c.last_solve_at
+    ).outerjoin(solves, User.id == solves.c.user_id).all()
+    return rows, db.session.query(db.func.max(Solve.id)).scalar(), db.session.query(db.func.max(User.id)).scalar()
+
+def load_leaderboard_changes(last_solve_id, last_user_id):
+    new_users = db.session.query(User.id, User.username).filter(User.id > last_user_id).order_by(User.id).all()
+    new_solves = db.session.query(
+        Solve.id, Solve.user_id, Solve.points_awarded, Solve.solved_at
+    ).filter(Solve.id > last_solve_id).order_by(Solve.id).all()
+    return new_users, new_solves
+
+# The leaderboard is kept in memory and updated from new solves, so reads don't
+# aggregate submissions. Solves from other workers show up within
+# CTF_LEADERBOARD_SYNC_INTERVAL seconds; it is rebuilt from scratch every
+# CTF_LEADERBOARD_REBUILD_INTERVAL seconds. Each sync re-reads the last
+# CTF_LEADERBOARD_SYNC_LOOKBACK solve IDs, for solves that committed out of order.
+LEADERBOARD_SIZE = 10
+LEADERBOARD_REBUILD_INTERVAL = int(os.environ.get('CTF_LEADERBOARD_REBUILD_INTERVAL', '300'))
+leaderboard_cache = Leaderboard(load_leaderboard, load_leaderboard_changes,
+                                sync_interval=float(os.environ.get('CTF_LEADERBOARD_SYNC_INTERVAL', '2')),
+                                lookback=int(os.environ.get('CTF_LEADERBOARD_SYNC_LOOKBACK', '100')))
+
+# Active challenge containers, indexed by container ID, by user and challenge, and by expiry.
+# They are kept in a shared state store (CTF_STATE_BACKEND) so every worker process sees
+# the same containers and they survive a restart.
+STATE_REFRESH_INTERVAL = float(os.environ.get('CTF_STATE_REFRESH_INTERVAL', '2'))
+state_store = create_state_store(os.path.join(app.instance_path, "container_state"))
+container_registry = ContainerRegistry(state_store, refresh_interval=STATE_REFRESH_INTERVAL)
+container_registry.refresh()
 
 # Challenge timeout in seconds (5 minutes for better user experience)
 CHALLENGE_TIMEOUT = 300
 
+# Users can extend a running challenge a few times
+CHALLENGE_EXTENSION = int(os.environ.get('CTF_CHALLENGE_EXTENSION', '300'))
+MAX_EXTENSIONS = int(os.environ.get('CTF_MAX_EXTENSIONS', '2'))
+
+# Live updates are pushed to the players' browsers over server-sent events (/events).
+# A publisher thread in each worker compares the leaderboard and the containers of
+# the connected users every CTF_EVENTS_INTERVAL seconds and publishes what changed.
+# Users are warned CTF_EXPIRY_WARNING seconds before their container expires.
+# Each stream holds a server thread, so a worker serves at most CTF_EVENTS_MAX_STREAMS
+# of them (keep it below the threads of a gthread worker, see gunicorn.conf.py) and
+# the other clients poll. Streams end after CTF_EVENTS_MAX_AGE seconds and the browser
+# reconnects, so an abandoned stream doesn't hold its thread for long.
+EVENTS_INTERVAL = float(os.environ.get('CTF_EVENTS_INTERVAL', '1'))
+EVENTS_KEEPALIVE = float(os.environ.get('CTF_EVENTS_KEEPALIVE', '15'))
+EVENTS_MAX_AGE = float(os.environ.get('CTF_EVENTS_MAX_AGE', '300'))
+EXPIRY_WARNING = int(os.environ.get('CTF_EXPIRY_WARNING', '60'))
+# Without the container event monitor, liveness is asked of the runtime at most this often
+EVENTS_LIVENESS_INTERVAL = float(os.environ.get('CTF_EVENTS_LIVENESS_INTERVAL', '5'))
+event_broadcaster = EventBroadcaster(max_queue=int(os.environ.get('CTF_EVENTS_QUEUE_SIZE', '100')),
+                                     max_subscriptions=int(os.environ.get('CTF_EVENTS_MAX_STREAMS', '16')))
+
+# Number of containers or images removed at once by the bulk cleanups
+TEARDOWN_WORKERS = int(os.environ.get('CTF_TEARDOWN_WORKERS', '16'))
+
+# Expired containers are stopped in parallel by this many threads. A slow safety sweep
+# catches containers the scheduler of this process doesn't know about.
+EXPIRY_WORKERS = int(os.environ.get('CTF_EXPIRY_WORKERS', '8'))
+EXPIRY_SWEEP_INTERVAL = int(os.environ.get('CTF_EXPIRY_SWEEP_INTERVAL', '60'))
+
+# How long a started container may take to be reported as running
+CONTAINER_START_TIMEOUT = float(os.environ.get('CTF_CONTAINER_START_TIMEOUT', '5'))
+
+# Host ports that challenge containers are published on. A container whose port turns
+# out to be taken by something else is started on another one, up to this many times.
+PORT_CONFLICT_RETRIES = int(os.environ.get('CTF_PORT_CONFLICT_RETRIES', '3'))
+PORT_RANGE_START = int(os.environ.get('CTF_PORT_RANGE_START', '10000'))
+PORT_RANGE_END = int(os.environ.get('CTF_PORT_RANGE_END', '19999'))
+# Leases and free ports are kept in the shared state store, so workers don't hand out the same port
+port_allocator = PortAllocator(
+    PORT_RANGE_START, PORT_RANGE_END,
+    leases=create_state_store(os.path.join(app.instance_path, "container_state"), namespace="port"),
+    free=create_state_store(os.path.join(app.instance_path, "container_state"), namespace="free_port")
+)
+
+def register_container(container_id, port, challenge_id, user_id, image_tag, capability_key=None):
+    """Add a started container to the registry"""
+    start_time = datetime.now()
+    expires_at = start_time + timedelta(seconds=CHALLENGE_TIMEOUT)
+    container_registry.add(container_id, {
+        "port": port,
+        "challenge": challenge_id,
+        "user": user_id,  # Store which user started this container
+        "start_time": start_time,  # Store when the container was started
+        "expires_at": expires_at,
+        "extensions": 0,
+        "running": True,  # Kept up to date by the container event monitor
+        "image_tag": image_tag,
+        "capability_key": capability_key  # Signs the capability cookie checked inside the container
+    })
+    port_allocator.assign(port, container_id)
+    expiry_scheduler.schedule(container_id, expires_at)
+
+def public_container_info(info):
+    """Container info without the secrets that must not leave the server"""
+    return {key: value for key, value in info.items() if key != 'capability_key'}
+
+def set_capability_cookie(response, container_id):
+    """Let the user into their challenge container without a callback to /verify-token"""
+    info = container_registry.get(container_id)
+    if not info or not info.get('capability_key') or not info.get('expires_at'):
+        return response
+    capability = encode_capability(info['capability_key'], info['user'], info['challenge'],
+                                   info['expires_at'].timestamp())
+    max_age = max(0, int((info['expires_at'] - datetime.now()).total_seconds()))
+    response.set_cookie(f"ctf_cap_{info['challenge']}", capability, httponly=True, max_age=max_age)
+    return response
+
+def forget_container(container_id):
+    """Remove a container from the registry and release its port"""
+    expiry_scheduler.cancel(container_id)
+    info = container_registry.remove(container_id)
+    if info:
+        port_allocator.release(info.get('port'))
+    return info
+
 # Challenge base directory
 CHALLENGE_BASE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "challenges")
 
+# Build one image per challenge and share it between all users. The per-user
+# flag, token and user ID are only passed in at `docker run` time.
+# Set CTF_SHARED_IMAGES=0 to go back to building one image per user.
+SHARED_CHALLENGE_IMAGES = os.environ.get('CTF_SHARED_IMAGES', '1') != '0'
+
+# Shared image tags that are known to be built, keyed by challenge ID
+shared_images = {}
+shared_image_locks = {}
+shared_image_locks_guard = threading.Lock()
+
+# Bootstrap script that warm pool containers run until they are handed to a user
+BOOTSTRAP_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bootstrap.py")
+
+# Number of idle containers kept ready per challenge (0 disables the warm pool).
+# Sizes for single challenges can be set with CTF_WARM_POOL_SIZES="web-basic=5,web-sqli=2"
+WARM_POOL_SIZE = int(os.environ.get('CTF_WARM_POOL_SIZE', '0'))
+WARM_POOL_SIZES = {
+    name.strip(): int(size)
+    for name, size in (
+        item.split('=', 1) for item in os.environ.get('CTF_WARM_POOL_SIZES', '').split(',') if '=' in item
+    )
+}
+
+# Address the platform uses to reach the bootstrap channel of pool containers
+BOOTSTRAP_HOST = os.environ.get('CTF_BOOTSTRAP_HOST', '127.0.0.1')
+
+# Containers are built and started by background jobs. These limit how many run
+# at once in total and for a single challenge, to keep the Docker daemon responsive.
+PROVISION_WORKERS = int(os.environ.get('CTF_PROVISION_WORKERS', '4'))
+PROVISION_PER_CHALLENGE = int(os.environ.get('CTF_PROVISION_PER_CHALLENGE', '2'))
+
 # Function to get the host IP address
 def get_host_ip():
     try:
@@ -48,23 +277,139 @@ def get_host_ip():
 HOST_IP = get_host_ip()
 print(f"Host IP address: {HOST_IP}")
 
-# Check for Docker availability
-def check_docker_availability():
+def get_main_site_url():
+    """URL of the main site that challenge containers redirect back to"""
+    host_port = request.host.split(':')[-1] if ':' in request.host else "5010"
+    return f"http://{HOST_IP}:{host_port}/"
+
+def check_login_rate(username):
+    """Return a 429 response if the client or the username is over the login rate limit, otherwise None"""
+    for limiter, key in ((login_ip_limiter, request.remote_addr), (login_user_limiter, username.lower())):
+        allowed, retry_after = limiter.allow(key)
+        if not allowed:
+            response = jsonify({"error": "Too many login attempts, please try again later"})
+            response.status_code = 429
+            response.headers['Retry-After'] = str(math.ceil(retry_after))
+            return response
+    return None
+
+def run_password_hashing(fn, *args):
+    """Run a password hashing function on the hashing pool and wait for its result.
+
+    Raises PasswordHashingBusy if the queue is full or the hash took too long.
+    """
+    if not password_hash_slots.acquire(blocking=False):
+        raise PasswordHashingBusy()
     try:
-        # Check if docker is installed
-        subprocess.run(["docker", "--version"], capture_output=True, check=True)
-        
-        # Check if we have permissions to talk to the daemon
-        subprocess.run(["docker", "ps"], capture_output=True, check=True)
-        return True
-    except (FileNotFoundError, subprocess.CalledProcessError):
-        return False
+        future = password_hash_executor.submit(fn, *args)
+    except Exception:
+        password_hash_slots.release()
+        raise
+    future.add_done_callback(lambda f: password_hash_slots.release())
+    try:
+        return future.result(timeout=PASSWORD_HASH_TIMEOUT)
+    except FutureTimeoutError:
+        # Nobody waits for it any more, so drop it unless it is already running
+        future.cancel()
+        raise PasswordHashingBusy()
+
+def get_request_token():
+    """Token of the current request, from the Authorization header or the ctf_token cookie"""
+    if request.headers.get('Authorization'):
+        return request.headers.get('Authorization')
+    return request.cookies.get('ctf_token', '')
+
+# Container runtime that builds and runs challenge containers. This talks to the
+# Docker Engine API over its socket; set CTF_CONTAINER_RUNTIME=fake to run
+# without Docker.
+runtime = create_runtime()
 
-DOCKER_AVAILABLE = check_docker_availability()
+# Check for Docker availability
+DOCKER_AVAILABLE = runtime.ping()
 if not DOCKER_AVAILABLE:
-    print("WARNING: Docker is not installed, not available in the PATH, or the current user does not have permissions to access it.")
+    print("WARNING: Docker is not running, or the current user does not have permissions to access its socket.")
     print("Challenge containers cannot be started without Docker.")
 
+def container_labels(challenge_id, user_id=None):
+    """Labels that mark containers as managed by the platform"""
+    labels = {"ctf.managed": "true", "ctf.challenge": challenge_id}
+    if user_id:
+        labels["ctf.user"] = user_id
+    return labels
+
+def remove_container(container_id, stop_timeout=10):
+    """Stop and remove a container. Returns False if it no longer exists."""
+    try:
+        runtime.stop_container(container_id, timeout=stop_timeout)
+    except ContainerNotFound:
+        return False
+    except ContainerRuntimeError as e:
+        print(f"Warning: Failed to stop container {container_id}: {e}")
+    try:
+        runtime.remove_container(container_id, force=True)
+    except ContainerNotFound:
+        return False
+    return True
+
+def discard_container(container_id):
+    """Force-remove a container that failed to start. Returns whether it is gone."""
+    try:
+        runtime.remove_container(container_id, force=True)
+    except ContainerNotFound:
+        pass
+    except ContainerRuntimeError as e:
+        print(f"Warning: Failed to remove container {container_id}: {e}")
+        return False
+    return True
+
+def container_is_running(container_id, info=None):
+    """Whether a container is running.
+
+    While the event monitor is connected this is a lookup of the state it
+    keeps in the registry, otherwise the runtime is asked.
+    """
+    if event_monitor.connected:
+        if info is None:
+            info = container_registry.get(container_id)
+        return bool(info) and info.get('running', True)
+    return runtime.is_running(container_id)
+
+def is_port_conflict(error):
+    """Whether a runtime error means the host port is taken by something else"""
+    message = str(error).lower()
+    return "port is already allocated" in message or "address already in use" in message
+
+def report_teardown(what, report):
+    """Log the outcome of a bulk removal"""
+    for result in report["results"]:
+        if not result["ok"]:
+            print(f"Error removing {what} {result['id']}: {result['error']}")
+    print(f"Removed {report['succeeded']} {what}(s), {report['failed']} failed, in {report['elapsed']:.2f}s")
+
+def remove_user_challenge_containers(challenge_id, user_id):
+    """Stop and remove every running container of a user for a challenge.
+
+    Warm pool containers are labelled before they have a user, so the
+    containers the registry holds for the user are removed as well.
+    """
+    container_ids = [container_id for container_id, info in container_registry.for_user(user_id)
+                     if info.get('challenge') == challenge_id]
+    try:
+        for container in runtime.list_containers(labels=container_labels(challenge_id, user_id)):
+            if container["id"] not in container_ids:
+                container_ids.append(container["id"])
+    except Exception as e:
+        print(f"Error finding containers by label: {e}")
+
+    for container_id in container_ids:
+        print(f"Found container {container_id} for challenge {challenge_id}, stopping it")
+        try:
+            remove_container(container_id)
+        except ContainerRuntimeError as e:
+            print(f"Error stopping container {container_id}: {e}")
+            continue
+        forget_container(container_id)
+
 # Docker template for challenges
 DOCKER_TEMPLATE = """
 FROM python:3.9-slim
@@ -94,31 +439,93 @@ class ChallengeLoader:
         sanitized_user_id = re.sub(r'[^a-z0-9_.-]', '_', user_id.lower())
         return f"ctf_{self.challenge_id}_{sanitized_user_id}"
 
+    def list_challenge_files(self):
+        """List the top-level challenge files that go into the image"""
+        return sorted(
+            file_name for file_name in os.listdir(self.path)
+            if not file_name.startswith("instance_") and os.path.isfile(os.path.join(self.path, file_name))
+        )
+
+    def copy_challenge_files(self, dst_dir):
+        """Copy the challenge files into a build directory"""
+        for file_name in self.list_challenge_files():
+            shutil.copyfile(os.path.join(self.path, file_name), os.path.join(dst_dir, file_name))
+
+    def get_content_hash(self):
+        """Hash the challenge files so the shared image changes whenever they do"""
+        digest = hashlib.sha256()
+        file_names = self.list_challenge_files()
+        for file_name in file_names:
+            digest.update(file_name.encode() + b"\0")
+            with open(os.path.join(self.path, file_name), "rb") as f:
+                digest.update(f.read())
+            digest.update(b"\0")
+
+        # The default Dockerfile and the pool bootstrap are part of the image too
+        if "Dockerfile" not in file_names:
+            digest.update(DOCKER_TEMPLATE.encode())
+        with open(BOOTSTRAP_SCRIPT, "rb") as f:
+            digest.update(f.read())
+        return digest.hexdigest()
+
+    def get_shared_image_tag(self):
+        return f"ctf_{self.challenge_id}:{self.get_content_hash()[:16]}"
+
+    def build_shared_image(self):
+        """Build the challenge image once and reuse it for every user"""
+        image_tag = self.get_shared_image_tag()
+        if shared_images.get(self.challenge_id) == image_tag:
+            return image_tag
+
+        # Only one build per challenge at a time, concurrent starts wait for it
+        with shared_image_locks_guard:
+            lock = shared_image_locks.setdefault(self.challenge_id, threading.Lock())
+
+        with lock:
+            if shared_images.get(self.challenge_id) == image_tag:
+                return image_tag
+
+            # The image may be left over from a previous run of the platform
+            if runtime.image_exists(image_tag):
+                print(f"Reusing existing shared image {image_tag}")
+            else:
+                # Build from a clean copy so old per-user instance directories stay out of the context
+                build_dir = tempfile.mkdtemp(prefix=f"ctf_build_{self.challenge_id}_")
+                try:
+                    self.copy_challenge_files(build_dir)
+                    if not os.path.exists(os.path.join(build_dir, "bootstrap.py")):
+                        shutil.copyfile(BOOTSTRAP_SCRIPT, os.path.join(build_dir, "bootstrap.py"))
+                    dockerfile_path = os.path.join(build_dir, "Dockerfile")
+                    if not os.path.exists(dockerfile_path):
+                        with open(dockerfile_path, "w") as f:
+                            f.write(DOCKER_TEMPLATE)
+
+                    print(f"Building shared Docker image {image_tag}")
+                    runtime.build_image(image_tag, build_dir, labels=container_labels(self.challenge_id))
+                except ContainerRuntimeError as e:
+                    print(f"Docker build failed with error:\n{e}")
+                    raise Exception(f"Docker build failed: {e}")
+                finally:
+                    shutil.rmtree(build_dir, ignore_errors=True)
+                print(f"Docker build succeeded for {image_tag}")
+
+            shared_images[self.challenge_id] = image_tag
+        return image_tag
+
     def build_container(self, flag, user_id):
         if not DOCKER_AVAILABLE:
             print("Skipping container build because Docker is not available")
             return
 
+        if SHARED_CHALLENGE_IMAGES:
+            return self.path, self.build_shared_image()
+
         # Create a user-specific directory for this challenge
         user_challenge_dir = os.path.join(self.path, f"instance_{user_id}")
         os.makedirs(user_challenge_dir, exist_ok=True)
 
         # Copy all files from the challenge directory to the user-specific directory
-        for file_name in os.listdir(self.path):
-            if file_name.startswith("instance_"):
-                continue  # Skip other user instances
-
-            src_path = os.path.join(self.path, file_name)
-            if os.path.isfile(src_path):
-                dst_path = os.path.join(user_challenge_dir, file_name)
-                try:
-                    # Try to open the file as text first
-                    with open(src_path, "r") as src_file, open(dst_path, "w") as dst_file:
-                        dst_file.write(src_file.read())
-                except UnicodeDecodeError:
-                    # If it fails, it's probably a binary file
-                    with open(src_path, "rb") as src_file, open(dst_path, "wb") as dst_file:
-                        dst_file.write(src_file.read())
+        self.copy_challenge_files(user_challenge_dir)
 
         # We no longer need to inject the flag into the challenge file
         # as it will be passed as an environment variable
@@ -139,210 +546,289 @@ class ChallengeLoader:
             else:
                 print(f"Failed to create Dockerfile at {dockerfile_path}")
 
-        # Build Docker image with a user-specific tag
         # Build Docker image with a user-specific tag
         image_tag = self.get_image_tag(user_id)
         print(f"Building Docker image {image_tag}")
-        result = subprocess.run([
-            "docker", "build", "-t",
-            image_tag, "."
-        ], cwd=user_challenge_dir, capture_output=True, text=True)
-
-        if result.returncode != 0:
-            print(f"Docker build failed with error:\n{result.stderr}")
-            raise Exception(f"Docker build failed: {result.stderr}")
-        else:
-            print(f"Docker build succeeded for {image_tag}")
-
-        return user_challenge_dir, image_tag
-
-    def find_available_port(self, start_port=10000, max_attempts=100):
-        """Find an available port starting from start_port"""
-        import socket
-        import random
-
-        # Also check if any active containers are already using ports
-        used_ports = set()
-        for container_info in active_containers.values():
-            used_ports.add(container_info.get('port', 0))
-
-        # Check Docker to see if any ports are already bound
         try:
-            result = subprocess.run(
-                ["docker", "ps", "--format", "{{.Ports}}"],
-                capture_output=True, text=True, check=True
-            )
-            # Parse port mappings from Docker output
-            for line in result.stdout.strip().split('\n'):
-                if line and '->5000/tcp' in line:
-                    parts = line.split(':', 1)
-                    if len(parts) > 1:
-                        port_part = parts[1].split('->', 1)[0]
-                        try:
-                            used_ports.add(int(port_part))
-                        except ValueError:
-                            pass
-        except Exception as e:
-            print(f"Warning: Could not check Docker ports: {e}")
-
-        # Try ports in a randomized order to reduce collision chance in multi-user scenarios
-        port_range = list(range(start_port, start_port + max_attempts))
-        random.shuffle(port_range)
+            runtime.build_image(image_tag, user_challenge_dir, labels=container_labels(self.challenge_id, user_id))
+        except ContainerRuntimeError as e:
+            print(f"Docker build failed with error:\n{e}")
+            raise Exception(f"Docker build failed: {e}")
+        print(f"Docker build succeeded for {image_tag}")
 
-        for port in port_range:
-            if port in used_ports:
-                continue
+        return user_challenge_dir, image_tag
 
-            # Check if port is available using socket
-            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-                try:
-                    s.bind(("0.0.0.0", port))
-                    print(f"Found available port: {port}")
-                    return port
-                except OSError:
-                    print(f"Port {port} is not available, trying next port")
-                    continue
+    def resolve_image(self, flag, user_id):
+        """Return the image to run for this user, building it if it is missing"""
+        if SHARED_CHALLENGE_IMAGES:
+            return self.build_shared_image()
 
-        raise RuntimeError(f"Could not find an available port after {max_attempts} attempts")
+        image_tag = self.get_image_tag(user_id)
+        if not runtime.image_exists(image_tag):
+            print(f"[DEBUG] Image {image_tag} not found, rebuilding...")
+            self.build_container(flag, user_id)
+        return image_tag
 
-    def run_container(self, user_id, flag):
+    def run_container(self, user_id, flag, main_site, user_token):
         if not DOCKER_AVAILABLE:
             raise RuntimeError("Docker is not available. Cannot run container.")
 
         print(f"[DEBUG] Running container for user {user_id}, challenge {self.challenge_id}")
         # Check if this specific user already has a container for this challenge
-        for container_id, info in active_containers.items():
-            if info.get('challenge') == self.challenge_id and info.get('user') == user_id:
-                try:
-                    # Check if container is still running
-                    print(f"[DEBUG] Checking if container {container_id} is running")
-                    result = subprocess.run(["docker", "inspect", "-f", "{{.State.Running}}", container_id],
-                                           capture_output=True, text=True)
-                    print(f"[DEBUG] Docker inspect result: {result.stdout}")
-                    if "true" in result.stdout.lower():
-                        port = info.get('port')
-                        print(f"User {user_id} already has challenge {self.challenge_id} running on port {port}")
-                        return port, container_id
-                    else:
-                        # Container exists but is not running, remove it
-                        print(f"Container {container_id} exists but is not running, removing it")
-                        subprocess.run(["docker", "rm", container_id], capture_output=True, check=False)
-                        active_containers.pop(container_id, None)
-                except subprocess.CalledProcessError as e:
-                    # Container doesn't exist anymore, remove from active_containers
-                    print(f"Container {container_id} no longer exists, error: {e}")
-                    active_containers.pop(container_id, None)
-
-        # Find an available port
-        port = self.find_available_port()
+        existing = container_registry.find(user_id, self.challenge_id)
+        if existing:
+            container_id, info = existing
+            try:
+                # Check if container is still running
+                print(f"[DEBUG] Checking if container {container_id} is running")
+                if container_is_running(container_id, info):
+                    port = info.get('port')
+                    print(f"User {user_id} already has challenge {self.challenge_id} running on port {port}")
+                    return port, container_id
+                else:
+                    # Container exists but is not running, remove it
+                    print(f"Container {container_id} exists but is not running, removing it")
+                    runtime.remove_container(container_id, force=True)
+                    forget_container(container_id)
+            except ContainerRuntimeError as e:
+                # Container doesn't exist anymore, remove it from the registry
+                print(f"Container {container_id} no longer exists, error: {e}")
+                forget_container(container_id)
+
+        # Lease a host port for the container
+        port = port_allocator.reserve(f"{self.challenge_id}/{user_id}")
         print(f"Starting container for user {user_id}, challenge {self.challenge_id} on port {port}")
-
+        capability_key = secrets.token_hex(32)
+        environment = {
+            "CTF_FLAG": flag,  # Flag environment variable
+            "MAIN_SITE": main_site,  # Main site URL for redirect
+            "CHALLENGE_ID": self.challenge_id,  # Challenge ID
+            "USER_TOKEN": user_token,  # User token for authentication
+            "USER_ID": user_id,  # User ID for verification
+            "CTF_CAPABILITY_KEY": capability_key  # Key for checking capability cookies locally
+        }
+
+        container_id = None
         try:
-            # Check if the image exists
-            # Check if the image exists
-            image_tag = self.get_image_tag(user_id)
-            image_check = subprocess.run(["docker", "images", image_tag, "--format", "{{.ID}}"],
-                                        capture_output=True, text=True)
-            print(f"[DEBUG] Image check result: {image_check.stdout}")
-
-            if not image_check.stdout.strip():
-                print(f"[DEBUG] Image {image_tag} not found, rebuilding...")
-                self.build_container(flag, user_id)
+            # Make sure the image exists
+            image_tag = self.resolve_image(flag, user_id)
 
             # Pass the flag as an environment variable to the container
-            print(f"[DEBUG] Running Docker container with command: docker run -d -p {port}:5000 -e CTF_FLAG={flag} {image_tag}")
-
-            # Get the host URL using the actual host IP instead of localhost
-            host_port = request.host.split(':')[-1] if ':' in request.host else "5010"
-            host_url = f"http://{HOST_IP}:{host_port}/"
-
-            # Get user token if available
-            user_token = ''
-            if hasattr(request, 'headers') and request.headers.get('Authorization'):
-                user_token = request.headers.get('Authorization')
-            elif request.cookies.get('ctf_token'):
-                user_token = request.cookies.get('ctf_token')
+            print(f"[DEBUG] Running Docker container from {image_tag} on port {port}")
 
             # If no token, this is a security issue - we shouldn't start a container without authentication
             if not user_token:
                 print("WARNING: No user token found when starting container. This is a security risk.")
 
-            # Run the container first
-            container_id = subprocess.check_output([
-                "docker", "run",
-                "-d",  # Detached mode
-                "--restart", "unless-stopped",  # Restart policy
-                "-p", f"{port}:5000",  # Port mapping
-                "-e", f"CTF_FLAG={flag}",  # Flag environment variable
-                "-e", f"MAIN_SITE={host_url}",  # Main site URL for redirect
-                "-e", f"CHALLENGE_ID={self.challenge_id}",  # Challenge ID
-                "-e", f"USER_TOKEN={user_token}",  # User token for authentication
-                "-e", f"USER_ID={user_id}",  # User ID for verification
-                "--memory", "256m",  # Memory limit
-                "--cpus", "0.5",  # CPU limit
-                image_tag
-            ]).decode().strip()
+            # Run the container first, on another port if something outside the platform holds this one
+            for attempt in range(PORT_CONFLICT_RETRIES + 1):
+                try:
+                    container_id = runtime.run_container(
+                        image_tag,
+                        ports={5000: port},  # Port mapping
+                        environment=environment,
+                        labels=container_labels(self.challenge_id, user_id),
+                        memory=256 * 1024 * 1024,  # Memory limit
+                        cpus=0.5,  # CPU limit
+                        restart_policy="unless-stopped"
+                    )
+                    break
+                except ContainerRuntimeError as e:
+                    if not is_port_conflict(e) or attempt == PORT_CONFLICT_RETRIES:
+                        raise
+                    # Keep it leased so it isn't handed out again
+                    print(f"Port {port} is already in use on the host, retrying on another port")
+                    port_allocator.assign(port, "external")
+                    port = port_allocator.reserve(f"{self.challenge_id}/{user_id}")
 
             # Now that we have the container ID, update it with the ID as an environment variable
             try:
-                subprocess.run([
-                    "docker", "exec", container_id,
+                runtime.exec_run(container_id, [
                     "sh", "-c", f"echo 'export CONTAINER_ID={container_id}' >> /etc/environment"
-                ], check=True)
+                ])
             except Exception as e:
                 print(f"Warning: Failed to set CONTAINER_ID in container: {e}")
 
             print(f"Container started with ID: {container_id}")
 
-            # Wait a moment for the container to start
-            time.sleep(1)
-
             # Verify container is running
-            verify_result = subprocess.run(["docker", "ps", "--filter", f"id={container_id}", "--format", "{{.ID}}"],
-                                          capture_output=True, text=True)
-            print(f"[DEBUG] Verify container running: {verify_result.stdout}")
-
-            if not verify_result.stdout.strip():
+            if not wait_running(runtime, container_id, timeout=CONTAINER_START_TIMEOUT):
                 # Container failed to start, check logs
-                logs = subprocess.run(["docker", "logs", container_id], capture_output=True, text=True)
-                print(f"[DEBUG] Container logs: {logs.stdout}\nErrors: {logs.stderr}")
-                raise Exception(f"Container failed to start: {logs.stderr}")
+                logs = runtime.logs(container_id)
+                print(f"[DEBUG] Container logs: {logs}")
+                raise Exception(f"Container failed to start: {logs}")
 
-            active_containers[container_id] = {
-                "port": port,
-                "challenge": self.challenge_id,
-                "user": user_id,  # Store which user started this container
-                "start_time": datetime.now(),  # Store when the container was started
-                "image_tag": image_tag
-            }
+            register_container(container_id, port, self.challenge_id, user_id, image_tag, capability_key)
             return port, container_id
-        except subprocess.CalledProcessError as e:
+        except ContainerRuntimeError as e:
             print(f"Error starting container: {e}")
-            print(f"Error output: {e.output.decode() if e.output else 'None'}")
+            if is_port_conflict(e):
+                port_allocator.assign(port, "external")
+                raise
+
+            # The first container holds the port, so it has to go before the retry
+            if container_id and not discard_container(container_id):
+                port_allocator.assign(port, container_id)
+                raise
+            container_id = None
+
             # Try to rebuild the image and try again
             try:
                 print(f"[DEBUG] Attempting to rebuild image and retry...")
-                self.build_container(flag, user_id)
+                shared_images.pop(self.challenge_id, None)
+                _, image_tag = self.build_container(flag, user_id)
 
                 # Try running the container again with basic options
-                container_id = subprocess.check_output([
-                    "docker", "run", "-d", "-p",
-                    f"{port}:5000", "-e", f"CTF_FLAG={flag}", self.get_image_tag(user_id)
-                ]).decode().strip()
+                container_id = runtime.run_container(
+                    image_tag,
+                    ports={5000: port},
+                    environment=environment,
+                    labels=container_labels(self.challenge_id, user_id)
+                )
 
                 print(f"Container started with ID (retry): {container_id}")
 
-                active_containers[container_id] = {
-                    "port": port,
-                    "challenge": self.challenge_id,
-                    "user": user_id,
-                    "start_time": datetime.now(),
-                    "image_tag": self.get_image_tag(user_id)
-                }
+                register_container(container_id, port, self.challenge_id, user_id, image_tag, capability_key)
                 return port, container_id
             except Exception as retry_error:
                 print(f"Retry failed: {retry_error}")
+                self.release_failed_port(port, container_id, retry_error)
                 raise
+        except Exception as e:
+            self.release_failed_port(port, container_id, e)
+            raise
+
+    def release_failed_port(self, port, container_id, error):
+        """Give up the port of a container that failed to start, unless it is still in use"""
+        if isinstance(error, ContainerRuntimeError) and is_port_conflict(error):
+            # Used by something outside the platform
+            port_allocator.assign(port, "external")
+        elif container_id and not discard_container(container_id):
+            port_allocator.assign(port, container_id)
+        else:
+            port_allocator.release(port)
+
+    def start_pool_container(self):
+        """Start a neutral container for the warm pool that waits for a user"""
+        image_tag = self.build_shared_image()
+        port = port_allocator.reserve(f"pool/{self.challenge_id}")
+        bootstrap_secret = secrets.token_urlsafe(32)
+
+        try:
+            container_id = runtime.run_container(
+                image_tag,
+                name=f"ctf_pool_{self.challenge_id}_{secrets.token_hex(4)}",
+                ports={5000: port},
+                environment={
+                    "CTF_BOOTSTRAP_SECRET": bootstrap_secret,
+                    "CHALLENGE_ID": self.challenge_id
+                },
+                labels=container_labels(self.challenge_id),
+                memory=256 * 1024 * 1024,
+                cpus=0.5,
+                command=["python", "bootstrap.py"]
+            )
+        except ContainerRuntimeError as e:
+            if is_port_conflict(e):
+                port_allocator.assign(port, "external")
+            else:
+                port_allocator.release(port)
+            raise
+        port_allocator.assign(port, container_id)
+
+        entry = {
+            "container_id": container_id,
+            "port": port,
+            "challenge": self.challenge_id,
+            "bootstrap_secret": bootstrap_secret,
+            "image_tag": image_tag
+        }
+
+        # Only hand out containers whose bootstrap channel is up
+        deadline = time.time() + 30
+        while True:
+            try:
+                with urllib.request.urlopen(f"http://{BOOTSTRAP_HOST}:{port}/__bootstrap", timeout=1) as response:
+                    if response.status == 200:
+                        return entry
+            except OSError:
+                pass
+            if time.time() > deadline:
+                discard_pool_container(entry)
+                raise RuntimeError(f"Pool container {container_id} did not become ready")
+            time.sleep(0.2)
+
+    def hand_off_pool_container(self, entry, user_id, flag, main_site, user_token):
+        """Give a warm pool container to a user through its bootstrap channel"""
+        container_id = entry["container_id"]
+        port = entry["port"]
+        capability_key = secrets.token_hex(32)
+        payload = json.dumps({
+            "CTF_FLAG": flag,
+            "MAIN_SITE": main_site,
+            "CHALLENGE_ID": self.challenge_id,
+            "USER_TOKEN": user_token,
+            "USER_ID": user_id,
+            "CONTAINER_ID": container_id,
+            "CTF_CAPABILITY_KEY": capability_key
+        }).encode()
+
+        bootstrap_request = urllib.request.Request(
+            f"http://{BOOTSTRAP_HOST}:{port}/__bootstrap",
+            data=payload,
+            headers={"Content-Type": "application/json", "X-Bootstrap-Secret": entry["bootstrap_secret"]},
+            method="POST"
+        )
+        # The container has no ctf.user label, so the registry is the only record of
+        # whose it is. Register it before it starts serving the user.
+        register_container(container_id, port, self.challenge_id, user_id, entry["image_tag"], capability_key)
+        try:
+            with urllib.request.urlopen(bootstrap_request, timeout=2) as response:
+                if response.status != 200:
+                    raise RuntimeError(f"Bootstrap of pool container {container_id} failed with status {response.status}")
+        except Exception:
+            forget_container(container_id)
+            raise
+
+        print(f"Handed pool container {container_id} to user {user_id} on port {port}")
+        return port, container_id
+
+def discard_pool_container(entry):
+    try:
+        runtime.remove_container(entry["container_id"], force=True)
+    except ContainerNotFound:
+        pass
+    port_allocator.release(entry["port"])
+
+def provision_challenge(job, loader, user_id, flag, main_site, user_token):
+    """Build and start a challenge container for a provisioning job"""
+    job.set_status("building")
+    print(f"Building container for user {user_id} with flag {flag}")
+    loader.build_container(flag, user_id)
+
+    job.set_status("starting")
+    print(f"Running container for user {user_id}")
+    port, container_id = loader.run_container(user_id, flag, main_site, user_token)
+    print(f"Container started on port {port} with ID {container_id}")
+
+    return {
+        "message": "Challenge started",
+        "port": port,
+        "containerId": container_id,
+        "flag": flag,  # Remove this in production!
+        "timeout": CHALLENGE_TIMEOUT,
+        "startTime": container_registry.get(container_id)["start_time"].isoformat(),
+        "main_site": main_site
+    }
+
+provisioning = ProvisioningQueue(max_workers=PROVISION_WORKERS, per_challenge_limit=PROVISION_PER_CHALLENGE)
+
+warm_pool = WarmPool(
+    start_fn=lambda challenge_id: ChallengeLoader(challenge_id).start_pool_container(),
+    discard_fn=discard_pool_container,
+    default_size=WARM_POOL_SIZE if SHARED_CHALLENGE_IMAGES else 0,
+    sizes=WARM_POOL_SIZES if SHARED_CHALLENGE_IMAGES else {}
+)
 
 @app.route("/login", methods=["POST"])
 def login():
@@ -353,33 +839,40 @@ def login():
     if not username or not password:
         return jsonify({"error": "Username and password are required"}), 400
 
+    limited = check_login_rate(username)
+    if limited:
+        return limited
+
     # Check if user exists
     user = User.query.filter_by(username=username).first()
 
-    # If user doesn't exist, create a new one
-    if not user:
-        user = User(username=username)
-        user.set_password(password)
-        db.session.add(user)
-        db.session.commit()
-    elif not user.check_password(password):
-        return jsonify({"error": "Invalid credentials"}), 401
+    try:
+        # If user doesn't exist, create a new one
+        if not user:
+            user = User(username=username)
+            user.password_hash = run_password_hashing(hash_password, password)
+            db.session.add(user)
+            db.session.commit()
+        elif not run_password_hashing(check_password_hash, user.password_hash, password):
+            return jsonify({"error": "Invalid credentials"}), 401
+        elif user.password_needs_rehash():
+            # The hash parameters changed, upgrade the stored hash while we have the password
+            user.password_hash = run_password_hashing(hash_password, password)
+    except PasswordHashingBusy:
+        return jsonify({"error": "Server is busy, please try again"}), 503
 
     # Update last login time
     user.last_login = datetime.utcnow()
     db.session.commit()
 
     # Create a new token
-    token_value = secrets.token_urlsafe(32)
-    token = Token(user_id=user.id, token=token_value)
-    db.session.add(token)
-    db.session.commit()
+    token_value = issue_token(user)
 
     # Create response with token in JSON
     response = jsonify({"token": token_value, "user_id": user.id, "username": user.username, "points": user.points, "is_admin": user.is_admin})
 
     # Set a cookie with the token for use with redirects from challenge containers
-    response.set_cookie('ctf_token', token_value, httponly=True, max_age=86400)  # 24 hours
+    response.set_cookie('ctf_token', token_value, httponly=True, max_age=TOKEN_LIFETIME)  # 24 hours by default
 
     return response
 
@@ -392,11 +885,21 @@ def admin_login():
     if not username or not password:
         return jsonify({"error": "Username and password are required"}), 400
 
+    limited = check_login_rate(username)
+    if limited:
+        return limited
+
     # Check if user exists and is an admin
     user = User.query.filter_by(username=username).first()
 
-    if not user or not user.check_password(password):
-        return jsonify({"error": "Invalid credentials"}), 401
+    try:
+        if not user or not run_password_hashing(check_password_hash, user.password_hash, password):
+            return jsonify({"error": "Invalid credentials"}), 401
+        if user.password_needs_rehash():
+            # The hash parameters changed, upgrade the stored hash while we have the password
+            user.password_hash = run_password_hashing(hash_password, password)
+    except PasswordHashingBusy:
+        return jsonify({"error": "Server is busy, please try again"}), 503
 
     if not user.is_admin:
         return jsonify({"error": "Unauthorized: Not an admin user"}), 403
@@ -406,35 +909,117 @@ def admin_login():
     db.session.commit()
 
     # Create a new token
-    token_value = secrets.token_urlsafe(32)
-    token = Token(user_id=user.id, token=token_value)
-    db.session.add(token)
-    db.session.commit()
+    token_value = issue_token(user)
 
     # Create response with token in JSON
     response = jsonify({"token": token_value, "user_id": user.id, "username": user.username, "is_admin": True})
 
     # Set a cookie with the token for use with redirects
-    response.set_cookie('ctf_admin_token', token_value, httponly=True, max_age=86400)  # 24 hours
+    response.set_cookie('ctf_admin_token', token_value, httponly=True, max_age=TOKEN_LIFETIME)  # 24 hours by default
 
     return response
 
-def verify_token(token_value):
-    """Verify if a token is valid and return the associated user"""
+def token_identity(user, expires_at=None):
+    """Identity of a user as kept in the token cache"""
+    return {
+        "user_id": user.id,
+        "username": user.username,
+        "is_admin": user.is_admin,
+        "expires_at": expires_at
+    }
+
+def issue_token(user):
+    """Create a session token for a user"""
+    if TOKEN_MODE == 'signed':
+        return encode_token(TOKEN_SECRET, user.id, user.username, user.is_admin, TOKEN_LIFETIME,
+                            generation=token_revocations.generation(user.id))
+
+    token_value = secrets.token_urlsafe(32)
+    token = Token(user_id=user.id, token=token_value,
+                  expires_at=datetime.utcnow() + timedelta(seconds=TOKEN_LIFETIME))
+    db.session.add(token)
+    db.session.commit()
+    token_cache.put(token_value, token_identity(user, token.expires_at))
+    return token_value
+
+def lookup_token(token_value):
+    """Return the identity of a valid token as a dict with user_id, username,
+    is_admin and expires_at, or None. Served from the token cache when possible."""
     if not token_value:
         return None
 
-    token = Token.query.filter_by(token=token_value, is_active=True).first()
-    if not token:
+    # Signed tokens are checked in-process against the revocation generations
+    if TOKEN_MODE == 'signed' and is_signed_token(token_value):
+        claims = decode_token(TOKEN_SECRET, token_value)
+        if not claims or token_revocations.is_revoked(claims):
+            return None
+        return {
+            "user_id": claims["uid"],
+            "username": claims["usr"],
+            "is_admin": claims["adm"],
+            "expires_at": datetime.utcfromtimestamp(claims["exp"])
+        }
+
+    identity = token_cache.get(token_value)
+    if identity is MISSING:
+        row = db.session.query(Token.expires_at, User.id, User.username, User.is_admin).join(
+            User, Token.user_id == User.id
+        ).filter(Token.token == token_value, Token.is_active == True).first()
+        identity = {
+            "user_id": row.id,
+            "username": row.username,
+            "is_admin": row.is_admin,
+            "expires_at": row.expires_at
+        } if row else None
+        token_cache.put(token_value, identity)
+
+    if not identity:
         return None
 
     # Check if token is expired
-    if token.expires_at and token.expires_at < datetime.now():
-        token.is_active = False
-        db.session.commit()
+    if identity["expires_at"] and identity["expires_at"] < datetime.utcnow():
+        deactivate_token(token_value)
         return None
 
-    return token.user
+    return identity
+
+def deactivate_token(token_value):
+    Token.query.filter_by(token=token_value).update({"is_active": False})
+    db.session.commit()
+    token_cache.invalidate(token_value)
+
+def revoke_user_tokens(user_id):
+    """Revoke every session token of a user, signed or stored"""
+    revocation = db.session.get(TokenRevocation, user_id)
+    if not revocation:
+        revocation = TokenRevocation(user_id=user_id, generation=0)
+        db.session.add(revocation)
+    revocation.generation += 1
+    revocation.revoked_at = datetime.utcnow()
+    Token.query.filter_by(user_id=user_id, is_active=True).update({"is_active": False})
+    db.session.commit()
+
+    token_revocations.set(user_id, revocation.generation)
+    token_cache.invalidate_user(user_id)
+
+class CurrentUser:
+    """The user a session token belongs to, as cached with the token.
+
+    Only carries id, username and is_admin, so checking a token doesn't load
+    the User row; handlers that need more of the user, or change it, load it.
+    """
+
+    def __init__(self, identity):
+        self.id = identity["user_id"]
+        self.username = identity["username"]
+        self.is_admin = identity["is_admin"]
+
+def verify_token(token_value):
+    """Verify if a token is valid and return the associated user as a CurrentUser"""
+    identity = lookup_token(token_value)
+    if not identity:
+        return None
+    return CurrentUser(identity)
 
 @app.route("/challenge/<challenge_id>/start", methods=["POST"])
 def start_challenge(challenge_id):
@@ -455,112 +1040,133 @@ def start_challenge(challenge_id):
     user_id = user.username  # Use username for backward compatibility with Docker
 
     # Check if user already has this challenge running
-    for container_id, info in active_containers.items():
-        if info.get('challenge') == challenge_id and info.get('user') == user_id:
-            try:
-                # Check if container is still running
-                result = subprocess.run(["docker", "inspect", "-f", "{{.State.Running}}", container_id],
-                                        capture_output=True, text=True)
-                if "true" in result.stdout.lower():
-                    print(f"User {user_id} already has challenge {challenge_id} running on container {container_id}")
-                    port = info.get('port')
-                    flag = generate_flag(user_id, challenge_id)  # Regenerate the flag for consistency
-
-                    # Check if user has already solved this challenge
-                    challenge = Challenge.query.filter_by(challenge_id=challenge_id).first()
-                    if challenge:
-                        previous_correct = Submission.query.filter_by(
-                            user_id=user.id,
-                            challenge_id=challenge.id,
-                            is_correct=True
-                        ).first()
-
-                        # Get the main site URL for redirection using the actual host IP
-                        host_port = request.host.split(':')[-1] if ':' in request.host else "5010"
-                        main_site = f"http://{HOST_IP}:{host_port}/"
-
-                        # Include solved status in response
-                        return jsonify({
-                            "message": "Challenge already running",
-                            "port": port,
-                            "containerId": container_id,
-                            "flag": flag,
-                            "already_solved": previous_correct is not None,
-                            "timeout": CHALLENGE_TIMEOUT,
-                            "startTime": info.get('start_time').isoformat() if info.get('start_time') else datetime.now().isoformat(),
-                            "main_site": main_site
-                        })
-                    else:
-                        # Get the main site URL for redirection using the actual host IP
-                        host_port = request.host.split(':')[-1] if ':' in request.host else "5010"
-                        main_site = f"http://{HOST_IP}:{host_port}/"
-
-                        return jsonify({
-                            "message": "Challenge already running",
-                            "port": port,
-                            "containerId": container_id,
-                            "flag": flag,
-                            "already_solved": False,
-                            "timeout": CHALLENGE_TIMEOUT,
-                            "startTime": info.get('start_time').isoformat() if info.get('start_time') else datetime.now().isoformat(),
-                            "main_site": main_site
-                        })
-            except Exception as e:
-                print(f"Error checking container status: {e}")
-                # Continue with starting a new container
+    existing = container_registry.find(user_id, challenge_id)
+    if existing:
+        container_id, info = existing
+        try:
+            # Check if container is still running
+            if container_is_running(container_id, info):
+                print(f"User {user_id} already has challenge {challenge_id} running on container {container_id}")
+                port = info.get('port')
+                flag = generate_flag(user_id, challenge_id)  # Regenerate the flag for consistency
+
+                # Check if user has already solved this challenge
+                challenge = Challenge.query.filter_by(challenge_id=challenge_id).first()
+                if challenge:
+                    already_solved = is_solved(user.id, challenge.id)
+
+                    # Get the main site URL for redirection using the actual host IP
+                    main_site = get_main_site_url()
+
+                    # Include solved status in response
+                    return set_capability_cookie(jsonify({
+                        "message": "Challenge already running",
+                        "port": port,
+                        "containerId": container_id,
+                        "flag": flag,
+                        "already_solved": already_solved,
+                        "timeout": CHALLENGE_TIMEOUT,
+                        "startTime": info.get('start_time').isoformat() if info.get('start_time') else datetime.now().isoformat(),
+                        "main_site": main_site
+                    }), container_id)
+                else:
+                    # Get the main site URL for redirection using the actual host IP
+                    main_site = get_main_site_url()
+
+                    return set_capability_cookie(jsonify({
+                        "message": "Challenge already running",
+                        "port": port,
+                        "containerId": container_id,
+                        "flag": flag,
+                        "already_solved": False,
+                        "timeout": CHALLENGE_TIMEOUT,
+                        "startTime": info.get('start_time').isoformat() if info.get('start_time') else datetime.now().isoformat(),
+                        "main_site": main_site
+                    }), container_id)
+        except Exception as e:
+            print(f"Error checking container status: {e}")
+            # Continue with starting a new container
 
     flag = generate_flag(user_id, challenge_id)
 
-    # Process challenge template
-    print(f"Processing challenge template for {challenge_id}")
+    # Get the main site URL for redirection using the actual host IP
+    main_site = get_main_site_url()
+
     loader = ChallengeLoader(challenge_id)
-    print(f"Building container for user {user_id} with flag {flag}")
-    loader.build_container(flag, user_id)
-    print(f"Running container for user {user_id}")
-    port, container_id = loader.run_container(user_id, flag)
-    print(f"Container started on port {port} with ID {container_id}")
 
-    # Get the main site URL for redirection using the actual host IP
-    host_port = request.host.split(':')[-1] if ':' in request.host else "5010"
-    main_site = f"http://{HOST_IP}:{host_port}/"
+    # Hand over a pre-started container from the warm pool if one is ready
+    pooled = warm_pool.claim(challenge_id)
+    if pooled:
+        try:
+            port, container_id = loader.hand_off_pool_container(pooled, user_id, flag, main_site, get_request_token())
+            print(f"Container started on port {port} with ID {container_id}")
+            return set_capability_cookie(jsonify({
+                "message": "Challenge started",
+                "status": "ready",
+                "port": port,
+                "containerId": container_id,
+                "flag": flag,  # Remove this in production!
+                "timeout": CHALLENGE_TIMEOUT,
+                "startTime": container_registry.get(container_id)["start_time"].isoformat(),
+                "main_site": main_site
+            }), container_id)
+        except Exception as e:
+            print(f"Error handing off pool container {pooled['container_id']}: {e}")
+            warm_pool.discard(pooled)
+
+    # Otherwise build and start the container in the background, the client polls the job
+    print(f"Queueing provisioning of challenge {challenge_id} for user {user_id}")
+    user_token = get_request_token()
+    job = provisioning.submit(
+        user_id, challenge_id,
+        lambda job: provision_challenge(job, loader, user_id, flag, main_site, user_token)
+    )
+    return jsonify(job.to_dict()), 202
 
-    return jsonify({
-        "message": "Challenge started",
-        "port": port,
-        "containerId": container_id,
-        "flag": flag,  # Remove this in production!
-        "timeout": CHALLENGE_TIMEOUT,
-        "startTime": datetime.now().isoformat(),
-        "main_site": main_site
-    })
+@app.route("/jobs/<job_id>", methods=["GET"])
+def get_provisioning_job(job_id):
+    """Progress of a challenge provisioning job"""
+    token_value = request.headers.get("Authorization")
+    user = verify_token(token_value)
+
+    if not user:
+        return jsonify({"error": "Unauthorized"}), 401
+
+    job = provisioning.get(job_id)
+    if not job or job.user_id != user.username:
+        return jsonify({"error": "Job not found"}), 404
+
+    response = jsonify(job.to_dict())
+    if job.status == "ready" and job.result:
+        set_capability_cookie(response, job.result["containerId"])
+    return response
 
 @app.route("/containers", methods=["GET"])
 def list_containers():
-    return jsonify(active_containers)
+    return jsonify({container_id: public_container_info(info)
+                    for container_id, info in container_registry.snapshot()})
 
 @app.route("/challenge/<container_id>/status", methods=["GET"])
 def check_container_status(container_id):
     # Check if container exists in our records
-    if container_id not in active_containers:
+    container_info = container_registry.get(container_id)
+    if not container_info:
         return jsonify({"status": "not_found", "message": "Container not found"}), 404
 
-    container_info = active_containers[container_id]
     start_time = container_info.get('start_time')
+    expires_at = container_info.get('expires_at')
 
-    if not start_time:
+    if not start_time or not expires_at:
         return jsonify({"status": "unknown", "message": "Container start time unknown"}), 400
 
-    # Calculate remaining time
+    # Calculate remaining time, including any extensions
     now = datetime.now()
     elapsed_seconds = (now - start_time).total_seconds()
-    remaining_seconds = max(0, CHALLENGE_TIMEOUT - elapsed_seconds)
+    remaining_seconds = max(0, (expires_at - now).total_seconds())
 
-    # Check if container is still running in Docker
+    # Check if container is still running
     try:
-        result = subprocess.run(["docker", "inspect", "-f", "{{.State.Running}}", container_id],
-                              capture_output=True, text=True)
-
-        if result.returncode != 0 or "true" not in result.stdout.lower():
+        if not container_is_running(container_id, container_info):
             # Container is not running
             return jsonify({
                 "status": "stopped",
@@ -577,25 +1183,69 @@ def check_container_status(container_id):
         "status": "running" if remaining_seconds > 0 else "expired",
         "elapsed": elapsed_seconds,
         "remaining": remaining_seconds,
-        "timeout": CHALLENGE_TIMEOUT,
+        "timeout": (expires_at - start_time).total_seconds(),
+        "expires_at": expires_at.isoformat(),
+        "extensions": container_info.get('extensions', 0),
+        "max_extensions": MAX_EXTENSIONS,
         "user": container_info.get('user'),
         "challenge": container_info.get('challenge'),
         "port": container_info.get('port')
     })
 
+@app.route("/challenge/<container_id>/extend", methods=["POST"])
+def extend_challenge(container_id):
+    """Give the user more time on a running challenge"""
+    token_value = request.headers.get("Authorization")
+    user = verify_token(token_value)
+
+    if not user:
+        return jsonify({"error": "Unauthorized"}), 401
+
+    container_info = container_registry.get(container_id)
+    if not container_info or container_info.get('user') != user.username:
+        return jsonify({"error": "Container not found"}), 404
+
+    now = datetime.now()
+    expires_at = container_info.get('expires_at')
+    extensions = container_info.get('extensions', 0)
+    if not expires_at or expires_at <= now:
+        return jsonify({"error": "This challenge has already expired"}), 409
+    if extensions >= MAX_EXTENSIONS:
+        return jsonify({
+            "error": f"This challenge can only be extended {MAX_EXTENSIONS} times",
+            "extensions": extensions,
+            "max_extensions": MAX_EXTENSIONS
+        }), 409
+
+    expires_at += timedelta(seconds=CHALLENGE_EXTENSION)
+    container_registry.set_expiry(container_id, expires_at, extensions=extensions + 1)
+    expiry_scheduler.schedule(container_id, expires_at)
+    print(f"User {user.username} extended container {container_id} until {expires_at.isoformat()}")
+
+    return set_capability_cookie(jsonify({
+        "message": "Challenge extended",
+        "expires_at": expires_at.isoformat(),
+        "remaining": (expires_at - now).total_seconds(),
+        "timeout": (expires_at - container_info['start_time']).total_seconds(),
+        "extensions": extensions + 1,
+        "max_extensions": MAX_EXTENSIONS
+    }), container_id)
+
 @app.route("/challenge/<container_id>/stop", methods=["POST"])
 def stop_challenge(container_id):
-    # Check if container exists in our records
-    if container_id not in active_containers:
+    # Check if container exists in our records. The copy taken here is used
+    # below, since the event monitor may forget the container once it is removed.
+    challenge_info = container_registry.get(container_id)
+    if not challenge_info:
         # Check if it exists in Docker anyway and try to remove it
         try:
-            result = subprocess.run(["docker", "inspect", container_id],
-                                   capture_output=True, text=True)
-            if result.returncode == 0:
-                print(f"Container {container_id} exists in Docker but not in our records, stopping it")
-                subprocess.run(["docker", "stop", container_id], check=True)
-                subprocess.run(["docker", "rm", container_id], check=True)
-                return jsonify({"message": "Container stopped and removed"})
+            runtime.inspect_container(container_id)
+            print(f"Container {container_id} exists in Docker but not in our records, stopping it")
+            runtime.stop_container(container_id)
+            runtime.remove_container(container_id)
+            return jsonify({"message": "Container stopped and removed"})
+        except ContainerNotFound:
+            pass
         except Exception as e:
             print(f"Error checking container: {e}")
 
@@ -603,24 +1253,21 @@ def stop_challenge(container_id):
 
     try:
         print(f"Stopping container {container_id}")
-        # Use capture_output to suppress Docker output
-        subprocess.run(["docker", "stop", container_id],
-                      capture_output=True, check=True)
-        subprocess.run(["docker", "rm", container_id],
-                      capture_output=True, check=True)
+        runtime.stop_container(container_id)
+        runtime.remove_container(container_id)
 
-        challenge_info = active_containers.pop(container_id)
+        forget_container(container_id)
         print(f"Container {container_id} stopped and removed")
         return jsonify({
             "message": "Challenge stopped",
             "challenge": challenge_info["challenge"]
         })
-    except subprocess.CalledProcessError as e:
-        print(f"Error stopping container: {e}")
+    except ContainerNotFound:
         # If the container doesn't exist anymore, remove it from our records
-        if "No such container" in str(e.stderr):
-            active_containers.pop(container_id, None)
-            return jsonify({"message": "Container was already removed"})
+        forget_container(container_id)
+        return jsonify({"message": "Container was already removed"})
+    except ContainerRuntimeError as e:
+        print(f"Error stopping container: {e}")
         return jsonify({"error": "Failed to stop container"}), 500
 
 @app.route("/")
@@ -663,8 +1310,8 @@ def index():
             return redirect('/login.html')
 
         # Verify that this user is the one who started the challenge
-        if container_id and container_id in active_containers:
-            container_info = active_containers.get(container_id)
+        container_info = container_registry.get(container_id) if container_id else None
+        if container_info:
             if container_info.get('user') != user.username:
                 # This user didn't start this challenge
                 flash("You cannot claim points for a challenge started by another user.", "error")
@@ -676,14 +1323,8 @@ def index():
         if challenge:
             context['challenge_name'] = challenge.name
 
-            # Check if this is the first correct submission for this challenge
-            previous_correct = Submission.query.filter_by(
-                user_id=user.id,
-                challenge_id=challenge.id,
-                is_correct=True
-            ).first()
-
-            if not previous_correct:
+            # Award the points unless this user already solved the challenge
+            if record_solve(user.id, challenge.id, challenge.points) is not None:
                 # Record the submission
                 submission = Submission(
                     user_id=user.id,
@@ -693,10 +1334,8 @@ def index():
                     points_awarded=challenge.points
                 )
                 db.session.add(submission)
-
-                # Award points to the user
-                user.points += challenge.points
                 db.session.commit()
+                leaderboard_cache.invalidate()
 
                 # Add points to context
                 context['points_earned'] = challenge.points
@@ -705,14 +1344,9 @@ def index():
                 flash(f"Congratulations! You earned {challenge.points} points for solving {challenge.name}!", "success")
             else:
                 # Even if already solved, we need to show the points that were earned
-                previous_submission = Submission.query.filter_by(
-                    user_id=user.id,
-                    challenge_id=challenge.id,
-                    is_correct=True
-                ).first()
-
-                if previous_submission:
-                    context['points_earned'] = previous_submission.points_awarded
+                previous_solve = get_solve(user.id, challenge.id)
+                if previous_solve:
+                    context['points_earned'] = previous_solve.points_awarded
                 else:
                     context['points_earned'] = challenge.points
 
@@ -726,64 +1360,37 @@ def index():
                     print(f"Stopping container {container_id} after successful flag submission")
                     try:
                         # Force stop and remove the container
-                        subprocess.check_call(["docker", "stop", container_id])
-                        subprocess.check_call(["docker", "rm", "-f", container_id])
+                        remove_container(container_id)
                         print(f"Container {container_id} has been stopped and removed")
 
                         # Remove from active containers
-                        if container_id in active_containers:
-                            active_containers.pop(container_id, None)
+                        if forget_container(container_id):
                             print(f"Removed container {container_id} from active containers")
-                    except subprocess.CalledProcessError as e:
+                    except ContainerRuntimeError as e:
                         print(f"Error stopping container: {e}")
-                        # Try to find the container by name/ID pattern
-                        try:
-                            # Get all containers for this challenge and user
-                            result = subprocess.check_output(["docker", "ps", "-q", "--filter", f"name={challenge_id}-{user.username}"], text=True)
-                            container_ids = result.strip().split('\n')
-                            for c_id in container_ids:
-                                if c_id:
-                                    print(f"Found container {c_id} for challenge {challenge_id}, stopping it")
-                                    subprocess.call(["docker", "stop", c_id])
-                                    subprocess.call(["docker", "rm", "-f", c_id])
-                        except Exception as inner_e:
-                            print(f"Error finding containers by pattern: {inner_e}")
+                        # Try to find the container by its labels
+                        remove_user_challenge_containers(challenge_id, user.username)
                 else:
                     # Find the container for this user and challenge
-                    found = False
-                    for c_id, info in list(active_containers.items()):
-                        if info.get('challenge') == challenge_id and info.get('user') == user.username:
-                            container_id = c_id
-                            context['container_id'] = container_id
-                            found = True
-
-                            # Stop and remove the container
-                            print(f"Stopping container {container_id} after successful flag submission")
-                            try:
-                                subprocess.check_call(["docker", "stop", container_id])
-                                subprocess.check_call(["docker", "rm", "-f", container_id])
-                                print(f"Container {container_id} has been stopped and removed")
-                            except subprocess.CalledProcessError as e:
-                                print(f"Error stopping container: {e}")
-
-                            # Remove from active containers
-                            active_containers.pop(container_id, None)
-                            print(f"Removed container {container_id} from active containers")
-                            break
+                    existing = container_registry.find(user.username, challenge_id)
+                    if existing:
+                        container_id = existing[0]
+                        context['container_id'] = container_id
 
-                    # If not found in active_containers, try to find by pattern
-                    if not found:
+                        # Stop and remove the container
+                        print(f"Stopping container {container_id} after successful flag submission")
                         try:
-                            # Get all containers for this challenge and user
-                            result = subprocess.check_output(["docker", "ps", "-q", "--filter", f"name={challenge_id}-{user.username}"], text=True)
-                            container_ids = result.strip().split('\n')
-                            for c_id in container_ids:
-                                if c_id:
-                                    print(f"Found container {c_id} for challenge {challenge_id}, stopping it")
-                                    subprocess.call(["docker", "stop", c_id])
-                                    subprocess.call(["docker", "rm", "-f", c_id])
-                        except Exception as inner_e:
-                            print(f"Error finding containers by pattern: {inner_e}")
+                            remove_container(container_id)
+                            print(f"Container {container_id} has been stopped and removed")
+                        except ContainerRuntimeError as e:
+                            print(f"Error stopping container: {e}")
+
+                        # Remove from active containers
+                        forget_container(container_id)
+                        print(f"Removed container {container_id} from active containers")
+                    else:
+                        # If not in the registry, try to find it by its labels
+                        remove_user_challenge_containers(challenge_id, user.username)
             except Exception as e:
                 print(f"Error stopping container: {e}")
 
@@ -800,52 +1407,118 @@ def admin_panel():
 @app.route("/leaderboard")
 def leaderboard():
     """Get the leaderboard of top users by points"""
-    # Use a more efficient query with a subquery to count solved challenges
-    from sqlalchemy import func, distinct
-
-    # Get the count of distinct challenges solved by each user
-    solved_challenges_subquery = db.session.query(
-        Submission.user_id,
-        func.count(distinct(Submission.challenge_id)).label('solved_count')
-    ).filter(Submission.is_correct == True).group_by(Submission.user_id).subquery()
-
-    # Join with the User table and order by points
-    leaderboard_query = db.session.query(
-        User,
-        solved_challenges_subquery.c.solved_count
-    ).outerjoin(
-        solved_challenges_subquery,
-        User.id == solved_challenges_subquery.c.user_id
-    ).order_by(User.points.desc(), solved_challenges_subquery.c.solved_count.desc())
-
-    # Get top 10 users
-    top_users = leaderboard_query.limit(10).all()
-
-    # Format the response
-    leaderboard_data = [{
-        'username': user.username,
-        'points': user.points,
-        'solved_challenges': solved_count if solved_count is not None else 0,
-        'rank': index + 1  # Add rank based on position
-    } for index, (user, solved_count) in enumerate(top_users)]
+    body, etag = leaderboard_cache.render(LEADERBOARD_SIZE)
+    response = app.response_class(body, mimetype='application/json')
+    # Browsers revalidate with If-None-Match and get a 304 while the board is unchanged
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
+
+def leaderboard_rows():
+    """The top LEADERBOARD_SIZE rows, as served by /leaderboard"""
+    return json.loads(leaderboard_cache.render(LEADERBOARD_SIZE)[0])
+
+def leaderboard_event(rows, reset=False):
+    """A leaderboard update: the rows (as served by /leaderboard) that changed,
+    or all of them with ``reset``, and the length of the board"""
+    return {"size": len(rows), "rows": rows, "reset": reset}
+
+def profile_event(user_id):
+    """Points and rank of a user, or None for a user not on the leaderboard"""
+    standing = leaderboard_cache.standing(user_id)
+    if standing is None:
+        return None
+    return {"points": standing["points"], "rank": standing["rank"], "solved_challenges": standing["solved"]}
+
+def container_event(container_id, info, running=True, now=None):
+    """Status of a container, with the fields of /challenge/<container_id>/status"""
+    now = now or datetime.now()
+    start_time, expires_at = info['start_time'], info['expires_at']
+    remaining = max(0, (expires_at - now).total_seconds())
+    if not running:
+        status, remaining = "stopped", 0
+    else:
+        status = "running" if remaining > 0 else "expired"
+    return {
+        "container_id": container_id,
+        "challenge": info.get('challenge'),
+        "status": status,
+        "remaining": remaining,
+        "timeout": (expires_at - start_time).total_seconds(),
+        "expires_at": expires_at.isoformat(),
+        "extensions": info.get('extensions', 0),
+        "max_extensions": MAX_EXTENSIONS
+    }
+
+@app.route("/events")
+def event_stream():
+    """Stream leaderboard, profile and container updates to the current user.
+
+    EventSource can't set headers, so browsers are authenticated by the
+    ctf_token cookie. The stream starts with a snapshot of everything it
+    covers; after that only changes are sent (see start_event_thread).
+    """
+    identity = lookup_token(get_request_token())
+    if not identity:
+        return jsonify({"error": "Unauthorized"}), 401
+
+    # Subscribe before taking the snapshot, so no change can fall between the two
+    subscription = event_broadcaster.subscribe(identity["user_id"], identity["username"])
+    if subscription is None:
+        # The browser gives up on a refused stream and polls instead
+        response = jsonify({"error": "Too many live update streams"})
+        response.headers['Retry-After'] = '60'
+        return response, 503
+    ensure_event_thread()
+    try:
+        snapshot = [format_event("leaderboard", leaderboard_event(leaderboard_rows(), reset=True))]
+        profile = profile_event(identity["user_id"])
+        if profile:
+            snapshot.append(format_event("profile", profile))
+        for container_id, info in container_registry.for_user(identity["username"]):
+            if info.get('start_time') and info.get('expires_at'):
+                try:
+                    running = container_is_running(container_id, info)
+                except Exception as e:
+                    print(f"Error checking container status: {e}")
+                    running = True
+                snapshot.append(format_event("container", container_event(container_id, info, running)))
+    except Exception:
+        event_broadcaster.unsubscribe(subscription)
+        raise
+
+    token_expires_at = identity["expires_at"]
 
-    return jsonify(leaderboard_data)
+    # Runs after the request context is gone, so it must not touch the database
+    def stream():
+        try:
+            yield from snapshot
+            for message in subscription.messages(keepalive=EVENTS_KEEPALIVE, max_age=EVENTS_MAX_AGE):
+                # Make the client reconnect, and be refused, once its token has expired
+                if token_expires_at and token_expires_at < datetime.utcnow():
+                    break
+                yield message
+        finally:
+            event_broadcaster.unsubscribe(subscription)
+
+    response = app.response_class(stream(), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    # Don't let a reverse proxy buffer the stream
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
 
 @app.route("/user/profile")
 def user_profile():
     """Get the profile of the current user"""
     token_value = request.headers.get("Authorization")
-    user = verify_token(token_value)
+    current_user = verify_token(token_value)
+    user = db.session.get(User, current_user.id) if current_user else None
 
     if not user:
         return jsonify({"error": "Unauthorized"}), 401
 
-    # Get solved challenges
-    solved_submissions = Submission.query.filter_by(user_id=user.id, is_correct=True).all()
-    solved_challenge_ids = [sub.challenge_id for sub in solved_submissions]
-
     # Get challenges the user has solved
-    solved_challenges = Challenge.query.filter(Challenge.id.in_(solved_challenge_ids)).all() if solved_challenge_ids else []
+    solved_challenges = queries.solved_challenges(user.id)
 
     # Get user achievements
     achievements = [{
@@ -855,29 +1528,15 @@ def user_profile():
         'points': achievement.points
     } for achievement in user.achievements]
 
-    # Get recent submissions
-    recent_submissions = Submission.query.filter_by(user_id=user.id).order_by(Submission.submitted_at.desc()).limit(5).all()
-
-    # Get user's rank
-    from sqlalchemy import func, distinct
-
-    # Count users with more points than the current user
-    rank_query = db.session.query(func.count(User.id) + 1).filter(User.points > user.points)
-    user_rank = rank_query.scalar()
+    # Get recent submissions with their challenge names
+    recent_submissions = queries.recent_submissions(limit=5, user_id=user.id)
 
-    # If there are users with the same points, use solved challenges as a tiebreaker
-    if user_rank == 1:
-        # Check if there are other users with the same points
-        same_points_users = User.query.filter(User.points == user.points, User.id != user.id).all()
-        if same_points_users:
-            # Count solved challenges for current user
-            user_solved_count = Submission.query.filter_by(user_id=user.id, is_correct=True).distinct(Submission.challenge_id).count()
-
-            # Count users with same points but more solved challenges
-            for other_user in same_points_users:
-                other_solved_count = Submission.query.filter_by(user_id=other_user.id, is_correct=True).distinct(Submission.challenge_id).count()
-                if other_solved_count > user_solved_count:
-                    user_rank += 1
+    # Get user's rank, ordered and tie-broken the same way as the leaderboard
+    user_rank = leaderboard_cache.rank(user.id)
+    if user_rank is None:
+        # Registered since the board last synced
+        leaderboard_cache.sync(force=True)
+        user_rank = leaderboard_cache.rank(user.id)
 
     return jsonify({
         'username': user.username,
@@ -892,13 +1551,65 @@ def user_profile():
         } for challenge in solved_challenges],
         'achievements': achievements,
         'recent_submissions': [{
-            'challenge_name': Challenge.query.get(sub.challenge_id).name if Challenge.query.get(sub.challenge_id) else 'Unknown',
+            'challenge_name': challenge_name or 'Unknown',
             'is_correct': sub.is_correct,
             'points_awarded': sub.points_awarded,
             'submitted_at': sub.submitted_at.strftime('%Y-%m-%d %H:%M:%S')
-        } for sub in recent_submissions]
+        } for sub, _, challenge_name in recent_submissions]
     })
 
+# Page sizes of the admin lists
+ADMIN_PAGE_SIZE = 100
+ADMIN_MAX_PAGE_SIZE = 1000
+
+# Rows fetched per round trip by streaming exports
+EXPORT_BATCH_SIZE = int(os.environ.get('CTF_EXPORT_BATCH_SIZE', '1000'))
+SCOREBOARD_EXPORT_FIELDS = ['rank', 'user_id', 'username', 'points', 'solved_challenges', 'last_solve_at']
+
+def parse_page_limit(args):
+    """Return the requested page size, raising ValueError if it is invalid"""
+    limit = int(args.get('limit', ADMIN_PAGE_SIZE))
+    if not 1 <= limit <= ADMIN_MAX_PAGE_SIZE:
+        raise ValueError(f"limit must be between 1 and {ADMIN_MAX_PAGE_SIZE}")
+    return limit
+
+def parse_utc_datetime(value):
+    """Parse an ISO 8601 time as a naive UTC datetime, as stored in the database"""
+    parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+def parse_submission_filters(args):
+    """Return the submission filters of a request, raising ValueError for invalid values"""
+    filters = {}
+    if args.get('user_id'):
+        filters['user_id'] = int(args['user_id'])
+    if args.get('user'):
+        filters['username'] = args['user']
+    if args.get('challenge'):
+        filters['challenge'] = args['challenge']
+    if args.get('correct'):
+        if args['correct'].lower() not in ('true', 'false', '1', '0'):
+            raise ValueError("correct must be true or false")
+        filters['is_correct'] = args['correct'].lower() in ('true', '1')
+    if args.get('since'):
+        filters['since'] = parse_utc_datetime(args['since'])
+    if args.get('until'):
+        filters['until'] = parse_utc_datetime(args['until'])
+    return filters
+
+def submission_json(row):
+    s, username, challenge_name = row
+    return {
+        'id': s.id,
+        'username': username or 'Unknown',
+        'challenge_name': challenge_name or 'Unknown',
+        'is_correct': s.is_correct,
+        'points_awarded': s.points_awarded,
+        'submitted_at': s.submitted_at.strftime('%Y-%m-%d %H:%M:%S')
+    }
+
 @app.route("/admin/users")
 def admin_users():
     """Get all users for admin panel"""
@@ -908,41 +1619,48 @@ def admin_users():
     if not user or not user.is_admin:
         return jsonify({"error": "Unauthorized"}), 401
 
-    # Use a more efficient query with a subquery to count solved challenges
-    from sqlalchemy import func, distinct
-
-    # Get the count of distinct challenges solved by each user
-    solved_challenges_subquery = db.session.query(
-        Submission.user_id,
-        func.count(distinct(Submission.challenge_id)).label('solved_count')
-    ).filter(Submission.is_correct == True).group_by(Submission.user_id).subquery()
-
-    # Join with the User table and order by points
-    users_query = db.session.query(
-        User,
-        solved_challenges_subquery.c.solved_count
-    ).outerjoin(
-        solved_challenges_subquery,
-        User.id == solved_challenges_subquery.c.user_id
-    ).order_by(User.points.desc(), solved_challenges_subquery.c.solved_count.desc())
-
-    # Get all users
-    users_with_counts = users_query.all()
+    try:
+        limit = parse_page_limit(request.args)
+        after = queries.decode_cursor(request.args['cursor']) if request.args.get('cursor') else None
+        if after is not None:
+            points, solved, last_solve_at, user_id = after
+            after = (int(points), int(solved), datetime.fromisoformat(last_solve_at) if last_solve_at else None, int(user_id))
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": f"Invalid parameter: {e}"}), 400
+
+    # Order, ranks and solve counts come from the leaderboard, brought up to date first.
+    # Pages are keyed on the leaderboard sort key of the last user of the previous page.
+    leaderboard_cache.sync(force=True)
+    entries, total = leaderboard_cache.page(limit, after)
+    users_by_id = {u.id: u for u in User.query.filter(User.id.in_([entry['user_id'] for entry in entries]))}
 
     # Format the response with ranks
-    user_data = [{
-        'id': u.id,
-        'username': u.username,
-        'email': u.email,
-        'points': u.points,
-        'created_at': u.created_at.strftime('%Y-%m-%d %H:%M:%S'),
-        'last_login': u.last_login.strftime('%Y-%m-%d %H:%M:%S') if u.last_login else None,
-        'is_admin': u.is_admin,
-        'solved_challenges': solved_count if solved_count is not None else 0,
-        'rank': index + 1  # Add rank based on position
-    } for index, (u, solved_count) in enumerate(users_with_counts)]
-
-    return jsonify(user_data)
+    user_data = []
+    for entry in entries:
+        u = users_by_id.get(entry['user_id'])
+        if not u:
+            continue
+        user_data.append({
+            'id': u.id,
+            'username': u.username,
+            'email': u.email,
+            'points': u.points,
+            'created_at': u.created_at.strftime('%Y-%m-%d %H:%M:%S'),
+            'last_login': u.last_login.strftime('%Y-%m-%d %H:%M:%S') if u.last_login else None,
+            'is_admin': u.is_admin,
+            'solved_challenges': entry['solved'],
+            'rank': entry['rank']
+        })
+
+    response = jsonify(user_data)
+    response.headers['X-Total-Count'] = str(total)
+    if entries and entries[-1]['rank'] < total:
+        last = entries[-1]
+        response.headers['X-Next-Cursor'] = queries.encode_cursor([
+            last['points'], last['solved'],
+            last['last_solve_at'].isoformat() if last['last_solve_at'] else None, last['user_id']
+        ])
+    return response
 
 @app.route("/admin/challenges")
 def admin_challenges():
@@ -954,6 +1672,7 @@ def admin_challenges():
         return jsonify({"error": "Unauthorized"}), 401
 
     challenges = Challenge.query.all()
+    solve_counts = queries.challenge_solve_counts()
 
     challenge_data = [{
         'id': c.id,
@@ -965,11 +1684,31 @@ def admin_challenges():
         'challenge_id': c.challenge_id,
         'is_active': c.is_active,
         'created_at': c.created_at.strftime('%Y-%m-%d %H:%M:%S'),
-        'solve_count': Submission.query.filter_by(challenge_id=c.id, is_correct=True).count()
+        'solve_count': solve_counts.get(c.id, 0)
     } for c in challenges]
 
     return jsonify(challenge_data)
 
+@app.route("/admin/stats")
+def admin_stats():
+    """Get the state of the container, port and cache machinery of this worker"""
+    token_value = request.headers.get("Authorization")
+    user = verify_token(token_value)
+
+    if not user or not user.is_admin:
+        return jsonify({"error": "Unauthorized"}), 401
+
+    return jsonify({
+        'worker_pid': os.getpid(),
+        'containers': len(container_registry),
+        'scheduled_expiries': len(expiry_scheduler),
+        'ports': port_allocator.stats(),
+        'provisioning': provisioning.stats(),
+        'warm_pool': warm_pool.stats(),
+        'token_cache': token_cache.stats(),
+        'event_streams': len(event_broadcaster)
+    })
+
 @app.route("/admin/submissions")
 def admin_submissions():
     """Get recent submissions for admin panel"""
@@ -979,18 +1718,99 @@ def admin_submissions():
     if not user or not user.is_admin:
         return jsonify({"error": "Unauthorized"}), 401
 
-    submissions = Submission.query.order_by(Submission.submitted_at.desc()).limit(100).all()
+    try:
+        filters = parse_submission_filters(request.args)
+        limit = parse_page_limit(request.args)
+    except ValueError as e:
+        return jsonify({"error": f"Invalid parameter: {e}"}), 400
+
+    # Submissions with their user and challenge names, newest first
+    query = queries.filtered_submissions(**filters)
 
-    submission_data = [{
-        'id': s.id,
-        'username': User.query.get(s.user_id).username if User.query.get(s.user_id) else 'Unknown',
-        'challenge_name': Challenge.query.get(s.challenge_id).name if Challenge.query.get(s.challenge_id) else 'Unknown',
-        'is_correct': s.is_correct,
-        'points_awarded': s.points_awarded,
-        'submitted_at': s.submitted_at.strftime('%Y-%m-%d %H:%M:%S')
-    } for s in submissions]
+    # NDJSON streams every matching submission
+    if request.args.get('format') == 'ndjson':
+        rows = queries.iter_rows(query.order_by(Submission.submitted_at.desc(), Submission.id.desc()),
+                                 EXPORT_BATCH_SIZE)
+        return export_response(ndjson_chunks(submission_json(row) for row in rows), 'ndjson')
+
+    try:
+        rows, next_cursor = queries.submission_page(query, limit, request.args.get('cursor'))
+    except ValueError as e:
+        return jsonify({"error": f"Invalid parameter: {e}"}), 400
+
+    response = jsonify([submission_json(row) for row in rows])
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor
+    return response
+
+def export_response(chunks, export_format, filename=None):
+    """Stream export chunks, gzip-compressed if the client accepts it and didn't pass compress=0"""
+    headers = {'Vary': 'Accept-Encoding'}
+    if filename:
+        headers['Content-Disposition'] = f'attachment; filename="{filename}.{export_format}"'
+    if 'gzip' in request.accept_encodings and request.args.get('compress') != '0':
+        chunks = gzip_chunks(chunks)
+        headers['Content-Encoding'] = 'gzip'
+    return app.response_class(stream_with_context(chunks), mimetype=EXPORT_FORMATS[export_format], headers=headers)
+
+def scoreboard_records():
+    """Yield the whole scoreboard in rank order, one leaderboard page at a time"""
+    after = None
+    while True:
+        entries, _ = leaderboard_cache.page(EXPORT_BATCH_SIZE, after)
+        for entry in entries:
+            yield {
+                'rank': entry['rank'],
+                'user_id': entry['user_id'],
+                'username': entry['username'],
+                'points': entry['points'],
+                'solved_challenges': entry['solved'],
+                'last_solve_at': entry['last_solve_at'].isoformat() if entry['last_solve_at'] else None
+            }
+        if len(entries) < EXPORT_BATCH_SIZE:
+            break
+        last = entries[-1]
+        after = (last['points'], last['solved'], last['last_solve_at'], last['user_id'])
+
+@app.route("/admin/export/scoreboard")
+def export_scoreboard():
+    """Export the full scoreboard as CSV or NDJSON"""
+    # Downloads are plain links, which send the admin cookie but no Authorization header
+    token_value = request.headers.get("Authorization") or request.cookies.get('ctf_admin_token')
+    user = verify_token(token_value)
 
-    return jsonify(submission_data)
+    if not user or not user.is_admin:
+        return jsonify({"error": "Unauthorized"}), 401
+
+    export_format = request.args.get('format', 'csv')
+    if export_format not in EXPORT_FORMATS:
+        return jsonify({"error": f"Invalid parameter: format must be one of {', '.join(EXPORT_FORMATS)}"}), 400
+
+    leaderboard_cache.sync(force=True)
+    chunks = export_chunks(scoreboard_records(), SCOREBOARD_EXPORT_FIELDS, export_format)
+    return export_response(chunks, export_format, "scoreboard")
+
+@app.route("/admin/export/submissions")
+def export_submissions():
+    """Export every submission, oldest first, as CSV or NDJSON. Takes the same filters as /admin/submissions."""
+    # Downloads are plain links, which send the admin cookie but no Authorization header
+    token_value = request.headers.get("Authorization") or request.cookies.get('ctf_admin_token')
+    user = verify_token(token_value)
+
+    if not user or not user.is_admin:
+        return jsonify({"error": "Unauthorized"}), 401
+
+    export_format = request.args.get('format', 'csv')
+    try:
+        if export_format not in EXPORT_FORMATS:
+            raise ValueError(f"format must be one of {', '.join(EXPORT_FORMATS)}")
+        filters = parse_submission_filters(request.args)
+    except ValueError as e:
+        return jsonify({"error": f"Invalid parameter: {e}"}), 400
+
+    records = queries.export_submissions(batch_size=EXPORT_BATCH_SIZE, **filters)
+    chunks = export_chunks(records, queries.SUBMISSION_EXPORT_FIELDS, export_format)
+    return export_response(chunks, export_format, "submissions")
 
 @app.route("/admin/toggle-challenge/<int:challenge_id>", methods=["POST"])
 def toggle_challenge(challenge_id):
@@ -1030,12 +1850,36 @@ def make_admin(user_id):
     user.is_admin = True
     db.session.commit()
 
+    # Cached tokens of the user still say they aren't an admin
+    token_cache.invalidate_user(user.id)
+
     return jsonify({
         'id': user.id,
         'username': user.username,
         'is_admin': user.is_admin
     })
 
+@app.route("/admin/revoke-tokens/<int:user_id>", methods=["POST"])
+def revoke_tokens(user_id):
+    """Log a user out everywhere by revoking all their session tokens"""
+    token_value = request.headers.get("Authorization")
+    admin_user = verify_token(token_value)
+
+    if not admin_user or not admin_user.is_admin:
+        return jsonify({"error": "Unauthorized"}), 401
+
+    user = User.query.get(user_id)
+    if not user:
+        return jsonify({"error": "User not found"}), 404
+
+    revoke_user_tokens(user.id)
+
+    return jsonify({
+        'id': user.id,
+        'username': user.username,
+        'tokens_revoked': True
+    })
+
 @app.route("/admin/add-challenge", methods=["POST"])
 def add_challenge():
     """Add a new challenge"""
@@ -1424,27 +2268,28 @@ def verify_token_endpoint():
         if not token_value:
             return jsonify({"valid": False, "error": "No token provided"}), 401
 
-    # Verify the token
-    user = verify_token(token_value)
-    if not user:
+    # Verify the token. Challenge containers call this on every request, so it is
+    # answered from the token cache without loading the user.
+    identity = lookup_token(token_value)
+    if not identity:
         return jsonify({"valid": False, "error": "Invalid or expired token"}), 401
 
     # If container_id is provided, verify container ownership
-    if request.method == "POST" and container_id and container_id in active_containers:
-        container_info = active_containers.get(container_id)
-        if container_info.get("user") != user.username:
+    container_info = container_registry.get(container_id) if request.method == "POST" and container_id else None
+    if container_info:
+        if container_info.get("user") != identity["username"]:
             return jsonify({
                 "valid": False,
                 "error": "Container not owned by this user",
-                "username": user.username
+                "username": identity["username"]
             }), 403
 
     # Token is valid and container ownership verified (if applicable)
     return jsonify({
         "valid": True,
-        "user_id": user.id,
-        "username": user.username,
-        "is_admin": user.is_admin
+        "user_id": identity["user_id"],
+        "username": identity["username"],
+        "is_admin": identity["is_admin"]
     })
 
 @app.route("/submit-flag-main", methods=["POST"])
@@ -1463,10 +2308,12 @@ def submit_flag_main():
     if not flag or not challenge_id:
         return jsonify({"error": "Flag and challenge ID are required"}), 400
 
-    # Verify user token
-    user = verify_token(token_value)
-    if not user:
+    # Verify user token. The identity is enough here, so the user row isn't loaded.
+    identity = lookup_token(token_value)
+    if not identity:
         return jsonify({"error": "Unauthorized - invalid or expired token"}), 401
+    user_id = identity["user_id"]
+    username = identity["username"]
 
     # Get the challenge
     challenge = Challenge.query.filter_by(challenge_id=challenge_id).first()
@@ -1474,9 +2321,9 @@ def submit_flag_main():
         return jsonify({"error": "Challenge not found"}), 404
 
     # Verify that this user is the one who started the challenge
-    if container_id and container_id in active_containers:
-        container_info = active_containers.get(container_id)
-        if container_info.get('user') != user.username:
+    container_info = container_registry.get(container_id) if container_id else None
+    if container_info:
+        if container_info.get('user') != username:
             return jsonify({
                 "success": False,
                 "message": "You cannot submit a flag for a challenge started by another user."
@@ -1489,48 +2336,42 @@ def submit_flag_main():
         }), 400
 
     # Generate the expected flag
-    expected_flag = generate_flag(user.username, challenge_id)
+    expected_flag = generate_flag(username, challenge_id)
 
     # Check if the flag is correct
     is_correct = (flag == expected_flag)
 
-    # Record the submission
-    submission = Submission(
-        user_id=user.id,
-        challenge_id=challenge.id,
+    # One transaction: the solve insert (skipped if already solved), the
+    # submission insert and the score update
+    challenge_pk, points = challenge.id, challenge.points  # Read before the commit expires them
+    total_points = record_solve(user_id, challenge_pk, points) if is_correct else None
+    db.session.add(Submission(
+        user_id=user_id,
+        challenge_id=challenge_pk,
         flag=flag,
         is_correct=is_correct,
-        points_awarded=challenge.points if is_correct else 0
-    )
-    db.session.add(submission)
+        points_awarded=points if total_points is not None else 0
+    ))
+    db.session.commit()
 
-    # If correct, award points to the user
     if is_correct:
-        # Check if this is the first correct submission for this challenge
-        previous_correct = Submission.query.filter_by(
-            user_id=user.id,
-            challenge_id=challenge.id,
-            is_correct=True
-        ).first()
-
-        if not previous_correct:
-            user.points += challenge.points
-            db.session.commit()
+        if total_points is not None:
+            leaderboard_cache.invalidate()
             return jsonify({
                 "success": True,
-                "message": f"Congratulations! You earned {challenge.points} points!",
-                "points_earned": challenge.points,
-                "total_points": user.points
+                "message": f"Congratulations! You earned {points} points!",
+                "points_earned": points,
+                "total_points": total_points
             })
         else:
+            total_points = db.session.query(User.points).filter(User.id == user_id).scalar()
             return jsonify({
                 "success": True,
                 "message": "Correct flag! You've already solved this challenge.",
                 "points_earned": 0,
-                "total_points": user.points
+                "total_points": total_points
             })
     else:
-        db.session.commit()
         return jsonify({
             "success": False,
             "message": "Incorrect flag. Try again!"
@@ -1562,88 +2403,71 @@ def get_challenges():
 
     return jsonify(challenge_list)
 
-def cleanup_expired_containers():
-    if not DOCKER_AVAILABLE:
+def expire_container(container_id):
+    """Stop and remove a container whose time is up"""
+    # Make sure we see extensions made through other workers
+    container_registry.refresh(container_registry.miss_refresh_interval)
+    info = container_registry.get(container_id)
+    if not info:
         return
 
-    """Check for expired containers and stop them"""
-    now = datetime.now()
-    expired_containers = []
-
-    # Find expired containers
-    for container_id, info in list(active_containers.items()):
-        start_time = info.get('start_time')
-        if start_time:
-            elapsed_seconds = (now - start_time).total_seconds()
-            print(f"Container {container_id} for user {info.get('user')} has been running for {elapsed_seconds:.1f} seconds (timeout: {CHALLENGE_TIMEOUT}s)")
-
-            if elapsed_seconds > CHALLENGE_TIMEOUT:
-                expired_containers.append((container_id, info))
-
-    # Clean up expired containers
-    for container_id, info in expired_containers:
-        try:
-            # First check if the container is still running
-            check_result = subprocess.run(["docker", "inspect", "-f", "{{.State.Running}}", container_id],
-                                         capture_output=True, text=True, check=False)
-
-            if check_result.returncode != 0 or "true" not in check_result.stdout.lower():
-                print(f"Container {container_id} is not running, just removing from active list")
-                active_containers.pop(container_id, None)
-                continue
-
-            print(f"Container {container_id} has expired (timeout: {CHALLENGE_TIMEOUT}s), stopping and removing...")
-
-            # Gracefully stop the container
-            stop_result = subprocess.run(["docker", "stop", "--time=10", container_id],
-                                       capture_output=True, text=True, check=False)
-
-            if stop_result.returncode != 0:
-                print(f"Warning: Failed to stop container {container_id}: {stop_result.stderr}")
+    expires_at = info.get('expires_at')
+    if expires_at and expires_at > datetime.now():
+        expiry_scheduler.schedule(container_id, expires_at)
+        return
 
-            # Only try to remove if stop was successful
-            if stop_result.returncode == 0:
-                rm_result = subprocess.run(["docker", "rm", container_id],
-                                         capture_output=True, text=True, check=False)
+    print(f"Container {container_id} for user {info.get('user')} has expired, stopping and removing...")
+    try:
+        if not remove_container(container_id):
+            print(f"Container {container_id} no longer exists, just removing from active list")
+    except ContainerRuntimeError as e:
+        print(f"Warning: Failed to remove container {container_id}: {e}")
 
-                if rm_result.returncode != 0:
-                    print(f"Warning: Failed to remove container {container_id}: {rm_result.stderr}")
+    # Remove from the registry but preserve user session data
+    forget_container(container_id)
+    print(f"Successfully cleaned up expired container {container_id} for user {info.get('user')}")
 
-                # Don't remove images immediately to avoid issues with other containers
-                # We'll do image cleanup separately
+expiry_scheduler = ExpiryScheduler(expire_container, max_workers=EXPIRY_WORKERS)
 
-            # Remove from active_containers but preserve user session data
-            active_containers.pop(container_id, None)
+def cleanup_expired_containers():
+    if not DOCKER_AVAILABLE:
+        return
 
-            print(f"Successfully cleaned up expired container {container_id} for user {info.get('user')}")
-        except Exception as e:
-            print(f"Error cleaning up expired container {container_id}: {e}")
+    """Hand expired containers to the expiry scheduler in case it missed them,
+    e.g. because another worker started them"""
+    for container_id, info in container_registry.pop_expired(datetime.now()):
+        expiry_scheduler.schedule(container_id, info['expires_at'])
 
 def cleanup_stale_containers():
     if not DOCKER_AVAILABLE:
         return
 
-    """Clean up any containers that might have been left running from previous sessions"""
+    """Clean up containers left over from previous sessions that are no longer tracked.
+
+    Containers recorded in the state store are kept running, so a restart
+    doesn't kill the challenges users are working on.
+    """
     try:
-        # Get all containers with our CTF prefix
-        result = subprocess.run(
-            ["docker", "ps", "-a", "--filter", "name=ctf_", "--format", "{{.ID}}"],
-            capture_output=True, text=True
-        )
+        # Get all containers labelled as managed by the platform
+        containers = runtime.list_containers(all=True, labels={"ctf.managed": "true"})
+        running_ids = {c["id"] for c in containers if c["running"]}
 
-        if result.returncode == 0 and result.stdout.strip():
-            container_ids = result.stdout.strip().split('\n')
+        # Forget tracked containers that are gone or no longer running
+        for container_id, info in container_registry.snapshot():
+            if container_id not in running_ids:
+                print(f"Tracked container {container_id} for user {info.get('user')} is no longer running, forgetting it")
+                forget_container(container_id)
+
+        tracked = set(dict(container_registry.snapshot()))
+        container_ids = [c["id"] for c in containers if c["id"] not in tracked]
+        print(f"Keeping {len(tracked)} tracked containers")
+
+        if container_ids:
             print(f"Found {len(container_ids)} stale containers, cleaning up...")
 
-            for container_id in container_ids:
-                try:
-                    print(f"Stopping and removing container {container_id}")
-                    subprocess.run(["docker", "stop", container_id],
-                                  capture_output=True, check=False)
-                    subprocess.run(["docker", "rm", container_id],
-                                  capture_output=True, check=False)
-                except Exception as e:
-                    print(f"Error cleaning up container {container_id}: {e}")
+            # Nobody is using these, so they are force-removed without a graceful stop
+            report = remove_containers(runtime, container_ids, max_workers=TEARDOWN_WORKERS)
+            report_teardown("stale container", report)
     except Exception as e:
         print(f"Error during container cleanup: {e}")
 
@@ -1654,64 +2478,107 @@ def cleanup_unused_images():
     """Remove Docker images that are not associated with running containers"""
     try:
         # Get a list of all images
-        result = subprocess.run(["docker", "images", "--format", "{{.Repository}}:{{.Tag}} {{.ID}}"],
-                              capture_output=True, text=True, check=False)
-
-        if result.returncode != 0:
-            print(f"Warning: Failed to list Docker images: {result.stderr}")
+        try:
+            images = runtime.list_images()
+        except ContainerRuntimeError as e:
+            print(f"Warning: Failed to list Docker images: {e}")
             return
 
-        # Find CTF images that aren't being used by active containers
-        active_images = set()
-        for info in active_containers.values():
+        # Find CTF images that aren't being used by active containers.
+        # The current shared image of each active challenge is always kept, whether
+        # or not this process has started the challenge since it came up.
+        active_images = set(shared_images.values())
+        with app.app_context():
+            challenge_ids = [challenge_id for challenge_id, in
+                             db.session.query(Challenge.challenge_id).filter_by(is_active=True)]
+        for challenge_id in challenge_ids:
+            try:
+                active_images.add(ChallengeLoader(challenge_id).get_shared_image_tag())
+            except OSError as e:
+                print(f"Warning: Could not hash challenge {challenge_id}: {e}")
+        for _, info in container_registry.snapshot():
             if 'image_tag' in info:
                 active_images.add(info['image_tag'])
+                # Docker lists untagged builds as <name>:latest
+                if ':' not in info['image_tag']:
+                    active_images.add(f"{info['image_tag']}:latest")
+
+        # Only clean up CTF images
+        unused_tags = [image_tag for image in images for image_tag in image["tags"]
+                       if image_tag.startswith('ctf_') and image_tag not in active_images]
+        if unused_tags:
+            print(f"Removing {len(unused_tags)} unused images...")
+            report = remove_images(runtime, unused_tags, max_workers=TEARDOWN_WORKERS)
+            report_teardown("unused image", report)
+    except Exception as e:
+        print(f"Error cleaning up unused images: {e}")
 
-        # Parse the image list
-        for line in result.stdout.strip().split('\n'):
-            if not line:
-                continue
+def handle_container_event(event):
+    """Update the registry from a container lifecycle event"""
+    container_id = event["id"]
+    action = event["action"]
+    if container_id not in container_registry:
+        return
 
-            parts = line.split(' ')
-            if len(parts) != 2:
-                continue
+    if action == "start":
+        container_registry.update(container_id, running=True)
+    elif action in ("die", "stop", "kill", "oom"):
+        if container_registry.update(container_id, running=False):
+            print(f"Container {container_id} of user {event['labels'].get('ctf.user')} stopped ({action})")
+    elif action == "destroy":
+        forget_container(container_id)
+        print(f"Container {container_id} of user {event['labels'].get('ctf.user')} was removed")
+
+def sync_container_states():
+    """Bring the registry in line with a full listing of the managed containers"""
+    containers = {c["id"]: c for c in runtime.list_containers(all=True, labels={"ctf.managed": "true"})}
+    for container_id, info in container_registry.snapshot():
+        container = containers.get(container_id)
+        if container is None:
+            forget_container(container_id)
+        else:
+            container_registry.update(container_id, running=container["running"])
 
-            image_tag, image_id = parts
+event_monitor = ContainerEventMonitor(runtime, handle_container_event, sync_container_states,
+                                      labels={"ctf.managed": "true"})
 
-            # Only clean up CTF images
-            if image_tag.startswith('ctf_') and image_tag not in active_images:
-                print(f"Removing unused image {image_tag} ({image_id})")
-                subprocess.run(["docker", "rmi", image_id],
-                              capture_output=True, check=False)
-    except Exception as e:
-        print(f"Error cleaning up unused images: {e}")
+def reconcile_ports():
+    """Mark host ports used by running containers so they are not leased again"""
+    used_ports = {info.get('port'): container_id for container_id, info in container_registry.snapshot()}
+    try:
+        for container in runtime.list_containers():
+            for port in container["ports"]:
+                used_ports.setdefault(port, container["id"])
+    except ContainerRuntimeError as e:
+        print(f"Warning: Could not list container ports: {e}")
+    port_allocator.reconcile(used_ports)
+    print(f"Port allocator ready: {port_allocator.stats()}")
 
 def start_cleanup_thread():
-    """Start a background thread to periodically check for expired containers"""
+    """Start the expiry scheduler and a background thread for periodic cleanup"""
+    # Containers are stopped by the scheduler right at their deadline
+    for container_id, info in container_registry.snapshot():
+        if info.get('expires_at'):
+            expiry_scheduler.schedule(container_id, info['expires_at'])
+    expiry_scheduler.start()
+
     def cleanup_thread():
         # Sleep first to allow the application to start up
         time.sleep(5)
 
-        # Counter for image cleanup (do it less frequently)
-        image_cleanup_counter = 0
+        last_image_cleanup = time.time()
 
         while True:
             try:
-                print("Running periodic cleanup of expired containers...")
                 cleanup_expired_containers()
 
-                # Increment counter and check if we should clean up images
-                image_cleanup_counter += 1
-                if image_cleanup_counter >= 10:  # Clean up images every ~5 minutes
+                # Clean up images less frequently
+                if time.time() - last_image_cleanup >= 300:  # Clean up images every ~5 minutes
                     print("Running cleanup of unused images...")
                     cleanup_unused_images()
-                    image_cleanup_counter = 0
+                    last_image_cleanup = time.time()
 
-                # Use a longer check interval to reduce server load
-                # This won't affect user experience since UI handles expiration
-                check_interval = 30
-                print(f"Next cleanup check in {check_interval} seconds")
-                time.sleep(check_interval)
+                time.sleep(EXPIRY_SWEEP_INTERVAL)
             except Exception as e:
                 print(f"Error in cleanup thread: {e}")
                 # Don't crash the thread on error
@@ -1720,9 +2587,171 @@ def start_cleanup_thread():
     # Start the cleanup thread as a daemon so it doesn't block application shutdown
     thread = threading.Thread(target=cleanup_thread, daemon=True)
     thread.start()
-    print(f"Started background cleanup thread (checking every 30 seconds)")
+    print(f"Started expiry scheduler and background cleanup thread (sweeping every {EXPIRY_SWEEP_INTERVAL} seconds)")
     return thread
 
+def prune_tokens():
+    """Delete expired and inactive tokens in batches, so the table stays small
+    and no single transaction holds the database lock for long"""
+    deleted = 0
+    while True:
+        now = datetime.utcnow()
+        ids = [row.id for row in db.session.query(Token.id).filter(db.or_(
+            Token.is_active == False,
+            Token.expires_at < now,
+            # Tokens from before tokens had an expiry time
+            db.and_(Token.expires_at == None, Token.created_at < now - timedelta(seconds=TOKEN_LIFETIME))
+        )).limit(TOKEN_PRUNE_BATCH_SIZE)]
+        if not ids:
+            break
+        Token.query.filter(Token.id.in_(ids)).delete(synchronize_session=False)
+        db.session.commit()
+        deleted += len(ids)
+        if len(ids) < TOKEN_PRUNE_BATCH_SIZE:
+            break
+    if deleted:
+        print(f"Pruned {deleted} expired or inactive tokens")
+    return deleted
+
+def start_token_pruning_thread():
+    """Start a background thread that periodically prunes the token table"""
+    def pruning_thread():
+        while True:
+            try:
+                with app.app_context():
+                    prune_tokens()
+            except Exception as e:
+                print(f"Error pruning tokens: {e}")
+            time.sleep(TOKEN_PRUNE_INTERVAL)
+
+    thread = threading.Thread(target=pruning_thread, daemon=True)
+    thread.start()
+    print(f"Started token pruning thread (every {TOKEN_PRUNE_INTERVAL} seconds)")
+    return thread
+
+def start_leaderboard_thread():
+    """Start a background thread that periodically rebuilds the leaderboard"""
+    def rebuild_thread():
+        while True:
+            time.sleep(LEADERBOARD_REBUILD_INTERVAL)
+            try:
+                with app.app_context():
+                    leaderboard_cache.rebuild()
+            except Exception as e:
+                print(f"Error rebuilding leaderboard: {e}")
+
+    thread = threading.Thread(target=rebuild_thread, daemon=True)
+    thread.start()
+    print(f"Started leaderboard rebuild thread (every {LEADERBOARD_REBUILD_INTERVAL} seconds)")
+    return thread
+
+def publish_leaderboard_changes(state, users):
+    """Publish the leaderboard rows, and the points and ranks of ``users``
+    ({username: user_id}), that changed since the last call"""
+    leaderboard_cache.sync()
+    if leaderboard_cache.version == state.get("leaderboard_version"):
+        return
+    state["leaderboard_version"] = leaderboard_cache.version
+
+    rows = leaderboard_rows()
+    previous = state.get("leaderboard", [])
+    changed = [row for index, row in enumerate(rows) if index >= len(previous) or previous[index] != row]
+    if changed or len(rows) != len(previous):
+        event_broadcaster.publish("leaderboard", leaderboard_event(changed))
+    state["leaderboard"] = rows
+
+    previous = state.get("profiles", {})
+    profiles = {}
+    for username, user_id in users.items():
+        profiles[user_id] = profile_event(user_id)
+        if profiles[user_id] and profiles[user_id] != previous.get(user_id):
+            event_broadcaster.publish("profile", profiles[user_id], username=username)
+    state["profiles"] = profiles
+
+def publish_container_changes(state, users, check_runtime):
+    """Publish the containers of ``users`` that started, changed, are about
+    to expire or went away since the last call"""
+    now = datetime.now()
+    previous = state.get("containers", {})  # container_id -> (username, event, expires_at, warned)
+    containers = {}
+    for username in users:
+        for container_id, info in container_registry.for_user(username):
+            expires_at = info.get('expires_at')
+            if not info.get('start_time') or not expires_at:
+                continue
+            last = previous.get(container_id)
+            running = last is None or last[1]["status"] != "stopped"
+            if event_monitor.connected or check_runtime or last is None:
+                try:
+                    running = container_is_running(container_id, info)
+                except Exception as e:
+                    print(f"Error checking container status: {e}")
+
+            event = container_event(container_id, info, running, now)
+            if last is None or any(last[1][key] != event[key] for key in ("status", "expires_at", "extensions")):
+                event_broadcaster.publish("container", event, username=username)
+
+            # Warn once per expiry time, so an extension re-arms the warning
+            warned = last[3] if last else None
+            if event["status"] == "running" and event["remaining"] <= EXPIRY_WARNING and warned != expires_at:
+                event_broadcaster.publish("expiring", {
+                    "container_id": container_id,
+                    "challenge": event["challenge"],
+                    "remaining": event["remaining"]
+                }, username=username)
+                warned = expires_at
+            containers[container_id] = (username, event, expires_at, warned)
+
+    # Containers that went away while running; stopped ones were already published
+    for container_id, (username, event, expires_at, warned) in previous.items():
+        if container_id not in containers and username in users and event["status"] == "running":
+            event_broadcaster.publish("container", dict(
+                event, status="expired" if expires_at <= now else "stopped", remaining=0
+            ), username=username)
+    state["containers"] = containers
+
+def start_event_thread():
+    """Start a background thread that publishes live updates to the connected clients.
+
+    The clients of other workers are served by the publishers of those
+    workers, which see the same leaderboard and containers through the
+    database and the shared state store.
+    """
+    def publisher_thread():
+        state = {}
+        last_runtime_check = 0
+        while True:
+            time.sleep(EVENTS_INTERVAL)
+            users = event_broadcaster.users()
+            if not users:
+                continue
+            check_runtime = time.monotonic() - last_runtime_check >= EVENTS_LIVENESS_INTERVAL
+            if check_runtime:
+                last_runtime_check = time.monotonic()
+            try:
+                with app.app_context():
+                    publish_leaderboard_changes(state, users)
+                publish_container_changes(state, users, check_runtime)
+            except Exception as e:
+                print(f"Error publishing events: {e}")
+
+    thread = threading.Thread(target=publisher_thread, daemon=True)
+    thread.start()
+    print(f"Started event publisher thread (every {EVENTS_INTERVAL} seconds)")
+    return thread
+
+# The publisher is started by the first /events subscription of a worker, so it
+# runs however the app is served (flask run, gunicorn or python app.py)
+event_thread = None
+event_thread_lock = threading.Lock()
+
+def ensure_event_thread():
+    """Start the event publisher thread of this worker unless it is running"""
+    global event_thread
+    with event_thread_lock:
+        if event_thread is None or not event_thread.is_alive():
+            event_thread = start_event_thread()
+
 def init_challenges():
     """Initialize challenges from the challenges directory"""
     print(f"Challenge base directory: {CHALLENGE_BASE}")
@@ -1805,19 +2834,24 @@ def init_challenges():
             db.session.commit()
             print("Challenges initialized in the database.")
 
-if __name__ == "__main__":
-    # Parse command line arguments
-    import argparse
-    parser = argparse.ArgumentParser(description='CTF Platform')
-    parser.add_argument('--port', type=int, default=5010, help='Port to run the server on')
-    args = parser.parse_args()
+def setup_platform():
+    """One-time setup of a deployment: migrate the database, create the admin
+    user and the challenges, and clean up after the previous run.
 
-    # Clean up any stale containers from previous runs
+    Runs once per deployment, not once per worker: from ``python app.py``,
+    ``flask --app app setup``, or the gunicorn master (see gunicorn.conf.py),
+    which sets CTF_SETUP_DONE for its workers.
+    """
+    # Clean up stale containers from previous runs, keeping the tracked ones
     cleanup_stale_containers()
 
+    # Don't lease ports that are still published by other containers
+    reconcile_ports()
+
     # Create database tables
     with app.app_context():
         db.create_all()
+        run_migrations(db.engine)
         print("Database tables created.")
 
         # Create admin user if it doesn't exist
@@ -1837,9 +2871,64 @@ if __name__ == "__main__":
 
     # Initialize challenges
     init_challenges()
+    os.environ['CTF_SETUP_DONE'] = '1'
+
+@app.cli.command("setup")
+def setup_command():
+    """Migrate the database and create the admin user and challenges"""
+    setup_platform()
+
+def start_background_services():
+    """Start the threads every worker process needs"""
+    # Follow container events so liveness checks don't have to ask Docker
+    if DOCKER_AVAILABLE:
+        event_monitor.start()
+
+    # Start filling the warm pool of challenge containers
+    if DOCKER_AVAILABLE and warm_pool.enabled:
+        with app.app_context():
+            warm_pool.start([c.challenge_id for c in Challenge.query.filter_by(is_active=True).all()])
+
+    # Start the expiry scheduler and the cleanup thread
+    start_cleanup_thread()
+
+    # Keep the token table from growing forever
+    start_token_pruning_thread()
+
+    # Reconcile the in-memory leaderboard with the database now and then
+    start_leaderboard_thread()
+
+# Threads don't survive a fork, so the services are started by the first
+# request of each process, however the app is served
+background_services_pid = None
+background_services_lock = threading.Lock()
+
+def ensure_background_services():
+    """Set up the platform if nobody has, and start the background services
+    of this process unless they are running"""
+    global background_services_pid
+    if background_services_pid == os.getpid():
+        return
+    with background_services_lock:
+        if background_services_pid == os.getpid():
+            return
+        if not os.environ.get('CTF_SETUP_DONE'):
+            setup_platform()
+        start_background_services()
+        background_services_pid = os.getpid()
+
+@app.before_request
+def start_background_services_on_first_request():
+    ensure_background_services()
+
+if __name__ == "__main__":
+    # Parse command line arguments
+    import argparse
+    parser = argparse.ArgumentParser(description='CTF Platform')
+    parser.add_argument('--port', type=int, default=5010, help='Port to run the server on')
+    args = parser.parse_args()
 
-    # Start the cleanup thread
-    cleanup_thread = start_cleanup_thread()
+    ensure_background_services()
 
     # Start the Flask application
     print(f"Challenge timeout set to {CHALLENGE_TIMEOUT} seconds ({CHALLENGE_TIMEOUT/60} minutes)")
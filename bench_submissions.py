@@ -0,0 +1,80 @@
+"""Measure the database cost of flag submissions.
+
+Runs first solves, repeated solves and wrong flags through /submit-flag-main
+against a scratch database and prints the time and the number of SQL
+statements per submission. Uses the fake container runtime, so Docker isn't
+needed:
+
+    python bench_submissions.py --users 500
+"""
+import argparse
+import os
+import tempfile
+import time
+
+os.environ.setdefault('CTF_CONTAINER_RUNTIME', 'fake')
+os.environ.setdefault('CTF_STATE_BACKEND', 'memory')
+# The database is set up here, not by the platform setup on the first request
+os.environ['CTF_SETUP_DONE'] = '1'
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark flag submissions")
+    parser.add_argument("--users", type=int, default=200, help="number of users submitting")
+    parser.add_argument("--database-url", help="database to use instead of a scratch SQLite file")
+    args = parser.parse_args()
+
+    if args.database_url:
+        os.environ['DATABASE_URL'] = args.database_url
+    else:
+        os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db')
+
+    # Imported here so DATABASE_URL is set before the engine is configured
+    from sqlalchemy import event
+    from app import app, issue_token, generate_flag
+    from models import db, User, Challenge
+    from migrations import run_migrations
+
+    with app.app_context():
+        db.create_all()
+        run_migrations(db.engine)
+        challenge = Challenge(name="Benchmark", description="Benchmark challenge", category="misc",
+                              difficulty="easy", points=100, challenge_id=f"bench-{int(time.time())}")
+        db.session.add(challenge)
+        users = [User(username=f"bench-{challenge.challenge_id}-{i}", password_hash="x") for i in range(args.users)]
+        db.session.add_all(users)
+        db.session.commit()
+        challenge_id = challenge.challenge_id
+        # Issuing the tokens also caches them, as after a user's first request
+        submitters = [(issue_token(user), generate_flag(user.username, challenge_id)) for user in users]
+        engine = db.engine
+
+    statements = [0]
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def count_statement(conn, cursor, statement, parameters, context, executemany):
+        statements[0] += 1
+
+    client = app.test_client()
+
+    def run(name, wrong=False):
+        statements[0] = 0
+        started = time.perf_counter()
+        for token, flag in submitters:
+            response = client.post('/submit-flag-main', headers={'Authorization': token}, json={
+                'flag': 'wrong' if wrong else flag,
+                'challenge_id': challenge_id
+            })
+            assert response.status_code == 200, response.get_data(as_text=True)
+        elapsed = time.perf_counter() - started
+        print(f"{name:<16} {elapsed / len(submitters) * 1000:8.3f} ms  "
+              f"{statements[0] / len(submitters):5.1f} statements per submission")
+
+    print(f"{len(submitters)} submissions each against {engine.url.render_as_string(hide_password=True)}")
+    run("first solve")
+    run("repeated solve")
+    run("wrong flag", wrong=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+# Bootstrap for warm pool challenge containers
+#
+# Pool containers run this script instead of challenge.py. It waits on the
+# challenge port until the platform hands the container to a user, then runs
+# the challenge with that user's flag, token and IDs in its environment.
+import hmac
+import json
+import os
+import runpy
+import sys
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+# Secret the platform must present to hand the container over
+BOOTSTRAP_SECRET = os.environ.get('CTF_BOOTSTRAP_SECRET', '')
+PORT = int(os.environ.get('PORT', 5000))
+
+# Import Flask up front so the hand-off doesn't have to wait for it
+try:
+    import flask  # noqa: F401
+except ImportError:
+    pass
+
+
+class BootstrapHandler(BaseHTTPRequestHandler):
+    def send_json(self, status, data):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        # Readiness check used by the platform while filling the pool
+        if self.path == '/__bootstrap':
+            self.send_json(200, {'status': 'waiting'})
+        else:
+            self.send_json(503, {'error': 'Challenge is starting, please retry in a moment'})
+
+    def do_POST(self):
+        if self.path != '/__bootstrap':
+            self.send_json(404, {'error': 'Not found'})
+            return
+
+        secret = self.headers.get('X-Bootstrap-Secret', '')
+        if not BOOTSTRAP_SECRET or not hmac.compare_digest(secret, BOOTSTRAP_SECRET):
+            self.send_json(403, {'error': 'Invalid bootstrap secret'})
+            return
+
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            env = json.loads(self.rfile.read(length))
+        except ValueError:
+            self.send_json(400, {'error': 'Invalid bootstrap payload'})
+            return
+
+        self.server.bootstrap_env = {str(key): str(value) for key, value in env.items()}
+        self.send_json(200, {'status': 'ok'})
+
+    def log_message(self, format, *args):
+        pass
+
+
+def main():
+    server = HTTPServer(('0.0.0.0', PORT), BootstrapHandler)
+    server.bootstrap_env = None
+    print(f"Waiting for bootstrap on port {PORT}")
+    while server.bootstrap_env is None:
+        server.handle_request()
+    server.server_close()
+
+    # Hand over to the challenge with the user's environment
+    os.environ.update(server.bootstrap_env)
+    os.environ.pop('CTF_BOOTSTRAP_SECRET', None)
+    print(f"Bootstrapped for user {os.environ.get('USER_ID', '')}, starting challenge")
+    sys.argv = ['challenge.py']
+    runpy.run_path('challenge.py', run_name='__main__')
+
+
+if __name__ == '__main__':
+    main()
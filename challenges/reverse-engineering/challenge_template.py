@@ -3,6 +3,10 @@ from flask import Flask, request, render_template_string, jsonify, redirect, abo
 import os
 import requests
 import json
+import base64
+import hashlib
+import hmac
+import time
 
 app = Flask(__name__)
 
@@ -16,9 +20,39 @@ CONTAINER_ID = os.environ.get('CONTAINER_ID', '')
 # Get user token and ID for verification
 USER_TOKEN = os.environ.get('USER_TOKEN', '')
 USER_ID = os.environ.get('USER_ID', '')
+# Key for checking the capability cookie the main site sets when the challenge starts
+CAPABILITY_KEY = os.environ.get('CTF_CAPABILITY_KEY', '')
+
+# Callbacks to the main site reuse one connection pool, time out and are cached
+VERIFY_TIMEOUT = float(os.environ.get('CTF_VERIFY_TIMEOUT', '3'))
+VERIFY_CACHE_TTL = float(os.environ.get('CTF_VERIFY_CACHE_TTL', '30'))
+verify_session = requests.Session()
+verify_cache = {}  # token -> (result, expires)
+
+def verify_capability(capability):
+    """Check a capability cookie signed with this container's key, without calling the main site"""
+    if not CAPABILITY_KEY or not capability or not capability.startswith('cap1.'):
+        return False
+
+    payload, _, signature = capability.rpartition('.')
+    expected = hmac.new(CAPABILITY_KEY.encode(), payload.encode(), hashlib.sha256).digest()
+    try:
+        if not hmac.compare_digest(base64.urlsafe_b64decode(signature + '=' * (-len(signature) % 4)), expected):
+            return False
+        encoded_claims = payload[len('cap1.'):]
+        claims = json.loads(base64.urlsafe_b64decode(encoded_claims + '=' * (-len(encoded_claims) % 4)))
+    except (ValueError, TypeError):
+        return False
+
+    return (claims.get('usr') == USER_ID and claims.get('cid') == CHALLENGE_ID
+            and claims.get('exp', 0) > time.time())
 
 def verify_access():
     """Verify that the user has permission to access this challenge"""
+    # A valid capability cookie is enough, no need to ask the main site
+    if verify_capability(request.cookies.get(f'ctf_cap_{CHALLENGE_ID}')):
+        return True
+
     # Get token from cookie or Authorization header
     token = None
     if request.cookies.get('ctf_token'):
@@ -35,27 +69,39 @@ def verify_access():
     if not token:
         return False
 
+    # Reuse a recent answer from the main site
+    cached = verify_cache.get(token)
+    if cached and cached[1] > time.time():
+        return cached[0]
+
     # Verify token with main site
     try:
         # Make a request to the main site to verify the token and container ownership
-        response = requests.post(
+        response = verify_session.post(
             f"{MAIN_SITE}verify-token",
             json={
                 'token': token,
                 'user_id': USER_ID,
                 'container_id': CONTAINER_ID,
                 'challenge_id': CHALLENGE_ID
-            }
+            },
+            timeout=VERIFY_TIMEOUT
         )
 
+        result = False
         if response.status_code == 200:
             data = response.json()
             # Check if this is the user who started the challenge
             if data.get('valid') and data.get('username') == USER_ID:
-                return True
-            print(f"Token verification failed: {data}")
+                result = True
+            else:
+                print(f"Token verification failed: {data}")
 
-        return False
+        # Keep rejections for a shorter time, so a user who just logged in isn't locked out
+        if len(verify_cache) > 1000:
+            verify_cache.clear()
+        verify_cache[token] = (result, time.time() + (VERIFY_CACHE_TTL if result else min(5, VERIFY_CACHE_TTL)))
+        return result
     except Exception as e:
         print(f"Error verifying token: {e}")
         # If verification fails, fall back to comparing with the stored token
@@ -0,0 +1,68 @@
+import threading
+import time
+
+from container_runtime import ContainerRuntimeError
+
+
+class ContainerEventMonitor:
+    """Follows the container runtime's event stream in a background thread.
+
+    Every event is passed to ``on_event(event)``. Before (re)subscribing,
+    ``resync()`` is called so state that changed while the stream was down
+    is picked up from a full listing. ``connected`` is True while the stream
+    is up, so callers know whether state fed by it can be trusted.
+    """
+
+    def __init__(self, runtime, on_event, resync, labels=None, reconnect_delay=1, max_reconnect_delay=30):
+        self.runtime = runtime
+        self.on_event = on_event
+        self.resync = resync
+        self.labels = labels
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+        self.connected = False
+        self.thread = None
+
+    def run_once(self):
+        """Subscribe, resync and handle events until the stream ends"""
+        # DockerRuntime.events is a generator, so the subscription is only sent on
+        # the first next(), after the listing. Nothing happening in between is
+        # missed because the daemon replays every event from ``since`` on; those
+        # may repeat what the listing saw, so on_event must be idempotent.
+        since = time.time()
+        stream = self.runtime.events(labels=self.labels, since=since)
+        self.resync()
+        self.connected = True
+        try:
+            for event in stream:
+                try:
+                    self.on_event(event)
+                except Exception as e:
+                    print(f"Error handling container event {event.get('action')} for {event.get('id')}: {e}")
+        finally:
+            self.connected = False
+            stream.close()
+
+    def start(self):
+        """Start the monitor thread"""
+        def monitor_thread():
+            delay = self.reconnect_delay
+            while True:
+                started = time.time()
+                try:
+                    self.run_once()
+                except ContainerRuntimeError as e:
+                    print(f"Container event stream disconnected: {e}")
+                except Exception as e:
+                    print(f"Error in container event monitor: {e}")
+
+                # Back off while the runtime keeps failing, reset once a stream stayed up
+                if time.time() - started > self.max_reconnect_delay:
+                    delay = self.reconnect_delay
+                time.sleep(delay)
+                delay = min(delay * 2, self.max_reconnect_delay)
+
+        self.thread = threading.Thread(target=monitor_thread, daemon=True)
+        self.thread.start()
+        print("Started container event monitor")
+        return self.thread
@@ -0,0 +1,216 @@
+import collections
+import heapq
+import threading
+import time
+from datetime import datetime
+
+# Fields stored as ISO 8601 strings in the shared state store
+DATETIME_FIELDS = ("start_time", "expires_at")
+
+
+def encode_info(info):
+    data = dict(info)
+    for field in DATETIME_FIELDS:
+        if isinstance(data.get(field), datetime):
+            data[field] = data[field].isoformat()
+    return data
+
+
+def decode_info(data):
+    info = dict(data)
+    for field in DATETIME_FIELDS:
+        if isinstance(info.get(field), str):
+            info[field] = datetime.fromisoformat(info[field])
+    return info
+
+
+class ContainerRegistry:
+    """Thread-safe record of active challenge containers.
+
+    Containers are keyed by container ID, with secondary indexes by
+    (user, challenge), by user and by expiry time so request handlers and the
+    cleanup thread never have to scan every container.
+
+    With a ``store`` (see state_store.py) every change is written through to
+    it, and the local copy is reloaded from it when it is older than
+    ``refresh_interval`` seconds or when a lookup misses, so all workers
+    share one view of the running containers.
+    """
+
+    def __init__(self, store=None, refresh_interval=2.0, miss_refresh_interval=0.25):
+        self.lock = threading.RLock()
+        self.containers = {}
+        self.by_user_challenge = {}
+        self.by_user = collections.defaultdict(set)
+        # Heap of (expires_at, container_id). Entries whose container was
+        # removed or rescheduled are skipped when they reach the top.
+        self.expiry_heap = []
+        self.store = store
+        self.refresh_interval = refresh_interval
+        self.miss_refresh_interval = miss_refresh_interval
+        self.last_refresh = 0
+
+    def __contains__(self, container_id):
+        return self.get(container_id) is not None
+
+    def __len__(self):
+        self.refresh(self.refresh_interval)
+        with self.lock:
+            return len(self.containers)
+
+    def add(self, container_id, info):
+        """Add or replace a container. ``info`` must have user, challenge and expires_at."""
+        with self.lock:
+            self._unindex(container_id)
+            self._index(container_id, dict(info))
+            self._store_put(container_id)
+
+    def get(self, container_id):
+        """Return a copy of a container's info, or None"""
+        for max_age in (self.refresh_interval, self.miss_refresh_interval):
+            self.refresh(max_age)
+            with self.lock:
+                info = self.containers.get(container_id)
+                if info is not None:
+                    return dict(info)
+        return None
+
+    def remove(self, container_id):
+        """Remove a container and return its info, or None if it wasn't registered"""
+        with self.lock:
+            info = self._unindex(container_id)
+            if self.store is not None:
+                try:
+                    self.store.delete(container_id)
+                except Exception as e:
+                    print(f"Warning: Failed to remove container {container_id} from the state store: {e}")
+            return info
+
+    def find(self, user, challenge):
+        """Return (container_id, info) of a user's container for a challenge, or None"""
+        for max_age in (self.refresh_interval, self.miss_refresh_interval):
+            self.refresh(max_age)
+            with self.lock:
+                container_id = self.by_user_challenge.get((user, challenge))
+                if container_id is not None:
+                    return container_id, dict(self.containers[container_id])
+        return None
+
+    def for_user(self, user):
+        """Return [(container_id, info)] of every container of a user"""
+        self.refresh(self.refresh_interval)
+        with self.lock:
+            return [(container_id, dict(self.containers[container_id]))
+                    for container_id in self.by_user.get(user, ())]
+
+    def update(self, container_id, **fields):
+        """Update fields of a container's info. Returns False if it isn't registered."""
+        with self.lock:
+            info = self.containers.get(container_id)
+            if info is None:
+                return False
+            if any(info.get(key) != value for key, value in fields.items()):
+                info.update(fields)
+                self._store_put(container_id)
+            return True
+
+    def set_expiry(self, container_id, expires_at, **fields):
+        """Move a container's expiry time, updating any other ``fields`` with it"""
+        with self.lock:
+            info = self.containers.get(container_id)
+            if info is None:
+                return False
+            info.update(fields)
+            info["expires_at"] = expires_at
+            heapq.heappush(self.expiry_heap, (expires_at, container_id))
+            self._store_put(container_id)
+            return True
+
+    def refresh(self, max_age=0):
+        """Reload the registry from the store if it was last loaded over ``max_age`` seconds ago"""
+        if self.store is None:
+            return False
+        with self.lock:
+            if time.monotonic() - self.last_refresh < max_age:
+                return False
+            # Count failed loads as well, so an unreachable store isn't hammered
+            self.last_refresh = time.monotonic()
+            try:
+                items = self.store.load_all()
+            except Exception as e:
+                print(f"Warning: Failed to load containers from the state store: {e}")
+                return False
+
+            self.containers = {}
+            self.by_user_challenge = {}
+            self.by_user = collections.defaultdict(set)
+            self.expiry_heap = []
+            for container_id, data in items.items():
+                self._index(container_id, decode_info(data))
+        return True
+
+    def pop_expired(self, now):
+        """Return [(container_id, info)] of containers that expired at or before ``now``.
+
+        Returned containers are taken off the expiry index but stay registered
+        until they are removed. Use set_expiry to put one back.
+        """
+        self.refresh(self.refresh_interval)
+        expired = []
+        with self.lock:
+            while self.expiry_heap and self.expiry_heap[0][0] <= now:
+                expires_at, container_id = heapq.heappop(self.expiry_heap)
+                info = self.containers.get(container_id)
+                if info is not None and info.get("expires_at") == expires_at:
+                    expired.append((container_id, dict(info)))
+        return expired
+
+    def snapshot(self):
+        """Return a consistent list of (container_id, info) that is safe to iterate"""
+        self.refresh(self.refresh_interval)
+        with self.lock:
+            return [(container_id, dict(info)) for container_id, info in self.containers.items()]
+
+    def _index(self, container_id, info):
+        # Called with the lock held
+        self.containers[container_id] = info
+
+        # The newest container of a user for a challenge is the one that is found
+        key = (info.get("user"), info.get("challenge"))
+        current = self.by_user_challenge.get(key)
+        if current is None or (self.containers[current].get("start_time") or datetime.min) <= (info.get("start_time") or datetime.min):
+            self.by_user_challenge[key] = container_id
+        self.by_user[info.get("user")].add(container_id)
+
+        if info.get("expires_at"):
+            heapq.heappush(self.expiry_heap, (info["expires_at"], container_id))
+
+    def _store_put(self, container_id):
+        # Called with the lock held
+        if self.store is None:
+            return
+        try:
+            self.store.put(container_id, encode_info(self.containers[container_id]))
+        except Exception as e:
+            print(f"Warning: Failed to save container {container_id} to the state store: {e}")
+
+    def _unindex(self, container_id):
+        # Called with the lock held
+        info = self.containers.pop(container_id, None)
+        if info is None:
+            return None
+        key = (info.get("user"), info.get("challenge"))
+        if self.by_user_challenge.get(key) == container_id:
+            del self.by_user_challenge[key]
+        user_containers = self.by_user.get(info.get("user"))
+        if user_containers is not None:
+            user_containers.discard(container_id)
+            if not user_containers:
+                del self.by_user[info.get("user")]
+
+        # Drop stale heap entries once they make up most of the heap
+        if len(self.expiry_heap) > 2 * len(self.containers) + 64:
+            self.expiry_heap = [(expires_at, cid) for expires_at, cid in self.expiry_heap
+                                if cid in self.containers and self.containers[cid].get("expires_at") == expires_at]
+            heapq.heapify(self.expiry_heap)
+        return info
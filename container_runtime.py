@@ -0,0 +1,666 @@
+"""Container runtimes used to build and run challenge containers.
+
+DockerRuntime talks to the Docker Engine API over its Unix socket and reuses
+a pool of persistent HTTP connections instead of starting a `docker` CLI
+process per call. FakeRuntime keeps images and containers in memory so the
+platform can be run, tested and benchmarked on a machine without Docker.
+"""
+import http.client
+import io
+import json
+import os
+import queue
+import secrets
+import select
+import socket
+import tarfile
+import threading
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_DOCKER_SOCKET = "/var/run/docker.sock"
+
+# Passed as a request timeout to use the client's default, as None means no timeout
+DEFAULT_TIMEOUT = object()
+
+# Errors that mean a pooled keep-alive connection was closed by the daemon
+STALE_CONNECTION_ERRORS = (http.client.RemoteDisconnected, BrokenPipeError, ConnectionResetError)
+
+# Requests that can be sent again if the connection drops before the response arrives
+IDEMPOTENT_METHODS = ("GET", "HEAD")
+
+
+def connection_closed(conn):
+    """Whether the peer closed an idle connection, without blocking"""
+    if conn.sock is None:
+        return True
+    try:
+        readable, _, _ = select.select([conn.sock], [], [], 0)
+        # An idle keep-alive connection is only readable once the peer closed it
+        return bool(readable) and conn.sock.recv(1, socket.MSG_PEEK) == b""
+    except (OSError, ValueError):
+        return True
+
+# Container lifecycle events the platform follows
+CONTAINER_EVENTS = ("start", "die", "stop", "kill", "oom", "destroy")
+
+
+class ContainerRuntimeError(Exception):
+    """Raised when the container runtime rejects or fails a request"""
+
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        self.status = status
+
+
+class ContainerNotFound(ContainerRuntimeError):
+    """Raised when a container or image does not exist"""
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    """HTTP connection over a Unix domain socket"""
+
+    def __init__(self, socket_path, timeout=60):
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        sock.connect(self.socket_path)
+        self.sock = sock
+
+
+class DockerRuntime:
+    """Docker Engine API client with a pool of keep-alive connections"""
+
+    name = "docker"
+
+    def __init__(self, socket_path=DEFAULT_DOCKER_SOCKET, pool_size=16, timeout=60):
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self.pool = queue.LifoQueue(maxsize=pool_size)
+
+    def _get_connection(self, fresh=False):
+        while not fresh:
+            try:
+                conn = self.pool.get_nowait()
+            except queue.Empty:
+                break
+            if not connection_closed(conn):
+                return conn, True
+            conn.close()
+        return UnixHTTPConnection(self.socket_path, timeout=self.timeout), False
+
+    def _release_connection(self, conn, response):
+        if response.will_close:
+            conn.close()
+            return
+        try:
+            self.pool.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    def request(self, method, path, params=None, body=None, headers=None, timeout=DEFAULT_TIMEOUT):
+        """Send a request to the Engine API and return (status, body bytes).
+
+        ``timeout`` overrides the socket timeout for this request; None disables it.
+        """
+        url = path
+        if params:
+            url += "?" + urllib.parse.urlencode(params)
+        headers = dict(headers or {})
+        if isinstance(body, (dict, list)):
+            body = json.dumps(body).encode()
+            headers["Content-Type"] = "application/json"
+
+        fresh = False
+        while True:
+            conn, reused = self._get_connection(fresh)
+            sent = False
+            try:
+                if timeout is not DEFAULT_TIMEOUT:
+                    conn.timeout = timeout
+                    if conn.sock:
+                        conn.sock.settimeout(timeout)
+                conn.request(method, url, body=body, headers=headers)
+                sent = True
+                response = conn.getresponse()
+            except (http.client.HTTPException, OSError) as e:
+                conn.close()
+                # A pooled connection the daemon closed fails before any of the response
+                # arrives. Retry that once on a new connection, unless the request was
+                # written and isn't safe to send twice. Timeouts are never retried.
+                if (reused and isinstance(e, STALE_CONNECTION_ERRORS)
+                        and (not sent or method in IDEMPOTENT_METHODS)):
+                    fresh = True
+                    continue
+                raise ContainerRuntimeError(f"Docker API request {method} {path} failed: {e}")
+            try:
+                data = response.read()
+            except (http.client.HTTPException, OSError) as e:
+                conn.close()
+                raise ContainerRuntimeError(f"Docker API request {method} {path} failed: {e}")
+
+            if timeout is not DEFAULT_TIMEOUT:
+                conn.timeout = self.timeout
+                if conn.sock:
+                    conn.sock.settimeout(self.timeout)
+            self._release_connection(conn, response)
+            return response.status, data
+
+    def _call(self, method, path, params=None, body=None, headers=None, timeout=DEFAULT_TIMEOUT, ok=(200, 201, 204)):
+        status, data = self.request(method, path, params=params, body=body, headers=headers, timeout=timeout)
+        if status in ok:
+            return data
+        try:
+            message = json.loads(data).get("message", data.decode(errors="replace"))
+        except (ValueError, AttributeError):
+            message = data.decode(errors="replace")
+        if status == 404:
+            raise ContainerNotFound(message, status)
+        raise ContainerRuntimeError(message, status)
+
+    def _json(self, data):
+        return json.loads(data) if data else None
+
+    def ping(self):
+        try:
+            return self._call("GET", "/_ping", timeout=5) == b"OK"
+        except ContainerRuntimeError:
+            return False
+
+    # Images
+
+    def image_exists(self, tag):
+        try:
+            self._call("GET", f"/images/{urllib.parse.quote(tag, safe='')}/json")
+            return True
+        except ContainerNotFound:
+            return False
+
+    def build_image(self, tag, context_dir, labels=None):
+        """Build an image from a directory and return the build output"""
+        context = io.BytesIO()
+        with tarfile.open(fileobj=context, mode="w") as tar:
+            tar.add(context_dir, arcname=".")
+
+        params = {"t": tag, "rm": "1"}
+        if labels:
+            params["labels"] = json.dumps(labels)
+        data = self._call("POST", "/build", params=params, body=context.getvalue(),
+                          headers={"Content-Type": "application/x-tar"}, timeout=None)
+
+        # The build output is a stream of JSON messages, one of which may be an error
+        output = []
+        for line in data.decode(errors="replace").splitlines():
+            try:
+                message = json.loads(line)
+            except ValueError:
+                continue
+            if message.get("error"):
+                raise ContainerRuntimeError(message["error"])
+            if message.get("stream"):
+                output.append(message["stream"])
+        return "".join(output)
+
+    def list_images(self):
+        """List images as dicts with the image ID and its tags"""
+        images = self._json(self._call("GET", "/images/json")) or []
+        return [{"id": image["Id"], "tags": image.get("RepoTags") or []} for image in images]
+
+    def remove_image(self, image_id, force=False):
+        self._call("DELETE", f"/images/{urllib.parse.quote(image_id, safe='')}",
+                   params={"force": "1" if force else "0"})
+
+    # Containers
+
+    def run_container(self, image, ports=None, environment=None, labels=None, name=None,
+                      command=None, memory=256 * 1024 * 1024, cpus=0.5, restart_policy=None):
+        """Create and start a container and return its ID.
+
+        ``ports`` maps container ports to host ports, e.g. {5000: 10001}.
+        """
+        ports = ports or {}
+        config = {
+            "Image": image,
+            "Env": [f"{key}={value}" for key, value in (environment or {}).items()],
+            "Labels": labels or {},
+            "ExposedPorts": {f"{container_port}/tcp": {} for container_port in ports},
+            "HostConfig": {
+                "PortBindings": {
+                    f"{container_port}/tcp": [{"HostPort": str(host_port)}]
+                    for container_port, host_port in ports.items()
+                },
+                "Memory": memory,
+                "NanoCpus": int(cpus * 1e9),
+            },
+        }
+        if command:
+            config["Cmd"] = list(command)
+        if restart_policy:
+            config["HostConfig"]["RestartPolicy"] = {"Name": restart_policy}
+
+        params = {"name": name} if name else None
+        container_id = self._json(self._call("POST", "/containers/create", params=params, body=config))["Id"]
+        try:
+            self._call("POST", f"/containers/{container_id}/start", ok=(204, 304))
+        except ContainerRuntimeError:
+            self.remove_container(container_id, force=True)
+            raise
+        return container_id
+
+    def inspect_container(self, container_id):
+        return self._json(self._call("GET", f"/containers/{container_id}/json"))
+
+    def is_running(self, container_id):
+        try:
+            return bool(self.inspect_container(container_id)["State"]["Running"])
+        except ContainerNotFound:
+            return False
+
+    def list_containers(self, all=False, labels=None):
+        """List containers as dicts with their ID, name, state, labels and published ports"""
+        params = {"all": "1" if all else "0"}
+        if labels:
+            params["filters"] = json.dumps({"label": [f"{key}={value}" for key, value in labels.items()]})
+        containers = self._json(self._call("GET", "/containers/json", params=params)) or []
+        return [{
+            "id": container["Id"],
+            "name": (container.get("Names") or [""])[0].lstrip("/"),
+            "state": container.get("State"),
+            "running": container.get("State") == "running",
+            "labels": container.get("Labels") or {},
+            "ports": [port["PublicPort"] for port in container.get("Ports") or [] if port.get("PublicPort")],
+        } for container in containers]
+
+    def stop_container(self, container_id, timeout=10):
+        # 304 means the container was already stopped
+        self._call("POST", f"/containers/{container_id}/stop", params={"t": timeout},
+                   ok=(204, 304), timeout=self.timeout + timeout)
+
+    def remove_container(self, container_id, force=False):
+        self._call("DELETE", f"/containers/{container_id}", params={"force": "1" if force else "0"})
+
+    def events(self, labels=None, since=None):
+        """Stream container lifecycle events as dicts (see parse_event).
+
+        The stream uses its own connection and blocks until the next event.
+        It raises ContainerRuntimeError when the connection is lost.
+        """
+        filters = {"type": ["container"], "event": list(CONTAINER_EVENTS)}
+        if labels:
+            filters["label"] = [f"{key}={value}" for key, value in labels.items()]
+        params = {"filters": json.dumps(filters)}
+        if since is not None:
+            params["since"] = str(int(since))
+
+        conn = UnixHTTPConnection(self.socket_path, timeout=None)
+        try:
+            try:
+                conn.request("GET", "/events?" + urllib.parse.urlencode(params))
+                response = conn.getresponse()
+            except (http.client.HTTPException, OSError) as e:
+                raise ContainerRuntimeError(f"Could not subscribe to Docker events: {e}")
+            if response.status != 200:
+                raise ContainerRuntimeError(f"Could not subscribe to Docker events: {response.read()!r}",
+                                            response.status)
+
+            while True:
+                try:
+                    line = response.readline()
+                except (http.client.HTTPException, OSError) as e:
+                    raise ContainerRuntimeError(f"Docker event stream failed: {e}")
+                if not line:
+                    raise ContainerRuntimeError("Docker event stream closed")
+                try:
+                    yield parse_event(json.loads(line))
+                except ValueError:
+                    continue
+        finally:
+            conn.close()
+
+    def exec_run(self, container_id, command):
+        """Run a command inside a running container without waiting for it"""
+        exec_id = self._json(self._call("POST", f"/containers/{container_id}/exec",
+                                        body={"Cmd": list(command)}))["Id"]
+        self._call("POST", f"/exec/{exec_id}/start", body={"Detach": True}, ok=(200, 204))
+
+    def logs(self, container_id):
+        data = self._call("GET", f"/containers/{container_id}/logs", params={"stdout": "1", "stderr": "1"})
+
+        # Logs of containers without a TTY are multiplexed into 8 byte header frames
+        output = []
+        while len(data) >= 8 and data[0] in (0, 1, 2) and data[1:4] == b"\0\0\0":
+            size = int.from_bytes(data[4:8], "big")
+            output.append(data[8:8 + size])
+            data = data[8 + size:]
+        output.append(data)
+        return b"".join(output).decode(errors="replace")
+
+
+class FakeRuntime:
+    """In-process runtime that tracks images and containers without running anything.
+
+    ``latency`` adds a delay to every call to simulate a real daemon. Changes
+    to containers are published to ``events`` subscribers like Docker does,
+    and events recorded from a real daemon can be played back with
+    ``replay_events``.
+    """
+
+    name = "fake"
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.images = {}
+        self.containers = {}
+        self.calls = 0
+        self.subscribers = []
+
+    def _call(self):
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _get(self, container_id):
+        # Like Docker, accept any unique prefix of the container ID
+        container = self.containers.get(container_id)
+        if container is None:
+            matches = [c for cid, c in self.containers.items() if cid.startswith(container_id)]
+            if len(matches) != 1:
+                raise ContainerNotFound(f"No such container: {container_id}", 404)
+            container = matches[0]
+        return container
+
+    def ping(self):
+        self._call()
+        return True
+
+    def image_exists(self, tag):
+        self._call()
+        return tag in self.images
+
+    def build_image(self, tag, context_dir, labels=None):
+        self._call()
+        if not os.path.isdir(context_dir):
+            raise ContainerRuntimeError(f"Build context {context_dir} does not exist")
+        with self.lock:
+            self.images[tag] = {"id": "sha256:" + secrets.token_hex(32), "labels": dict(labels or {})}
+        return f"Successfully tagged {tag}\n"
+
+    def list_images(self):
+        self._call()
+        with self.lock:
+            by_id = {}
+            for tag, image in self.images.items():
+                by_id.setdefault(image["id"], []).append(tag)
+        return [{"id": image_id, "tags": tags} for image_id, tags in by_id.items()]
+
+    def remove_image(self, image_id, force=False):
+        self._call()
+        with self.lock:
+            tags = [tag for tag, image in self.images.items() if image["id"] == image_id or tag == image_id]
+            if not tags:
+                raise ContainerNotFound(f"No such image: {image_id}", 404)
+            for tag in tags:
+                del self.images[tag]
+
+    def run_container(self, image, ports=None, environment=None, labels=None, name=None,
+                      command=None, memory=256 * 1024 * 1024, cpus=0.5, restart_policy=None):
+        self._call()
+        with self.lock:
+            if image not in self.images:
+                raise ContainerNotFound(f"No such image: {image}", 404)
+            host_ports = [int(port) for port in (ports or {}).values()]
+            for container in self.containers.values():
+                if container["running"] and set(container["ports"]) & set(host_ports):
+                    raise ContainerRuntimeError("port is already allocated", 500)
+            container_id = secrets.token_hex(32)
+            self.containers[container_id] = {
+                "id": container_id,
+                "name": name or f"fake_{container_id[:12]}",
+                "image": image,
+                "running": True,
+                "ports": host_ports,
+                "environment": dict(environment or {}),
+                "labels": dict(labels or {}),
+                "command": list(command or []),
+            }
+            self._emit("start", self.containers[container_id])
+        return container_id
+
+    def inspect_container(self, container_id):
+        self._call()
+        with self.lock:
+            container = self._get(container_id)
+            return {
+                "Id": container["id"],
+                "Name": "/" + container["name"],
+                "State": {"Running": container["running"], "Status": "running" if container["running"] else "exited"},
+                "Config": {"Labels": dict(container["labels"])},
+            }
+
+    def is_running(self, container_id):
+        try:
+            return self.inspect_container(container_id)["State"]["Running"]
+        except ContainerNotFound:
+            return False
+
+    def list_containers(self, all=False, labels=None):
+        self._call()
+        with self.lock:
+            return [{
+                "id": container["id"],
+                "name": container["name"],
+                "state": "running" if container["running"] else "exited",
+                "running": container["running"],
+                "labels": dict(container["labels"]),
+                "ports": list(container["ports"]) if container["running"] else [],
+            } for container in self.containers.values()
+                if (all or container["running"])
+                and all_labels_match(container["labels"], labels)]
+
+    def stop_container(self, container_id, timeout=10):
+        self._call()
+        with self.lock:
+            container = self._get(container_id)
+            if container["running"]:
+                container["running"] = False
+                self._emit("die", container)
+                self._emit("stop", container)
+
+    def remove_container(self, container_id, force=False):
+        self._call()
+        with self.lock:
+            container = self._get(container_id)
+            if container["running"] and not force:
+                raise ContainerRuntimeError(f"You cannot remove a running container {container_id}", 409)
+            if container["running"]:
+                container["running"] = False
+                self._emit("kill", container)
+                self._emit("die", container)
+            del self.containers[container["id"]]
+            self._emit("destroy", container)
+
+    def events(self, labels=None, since=None):
+        """Subscribe to container events. The subscription starts right away."""
+        self._call()
+        subscriber = queue.Queue()
+        with self.lock:
+            self.subscribers.append(subscriber)
+
+        def stream():
+            try:
+                while True:
+                    raw = subscriber.get()
+                    if raw is None:
+                        raise ContainerRuntimeError("Event stream closed")
+                    event = parse_event(raw)
+                    if all_labels_match(event["labels"], labels):
+                        yield event
+            finally:
+                with self.lock:
+                    if subscriber in self.subscribers:
+                        self.subscribers.remove(subscriber)
+
+        return stream()
+
+    def replay_events(self, events):
+        """Apply and publish raw Docker events, e.g. recorded with
+        `docker events --format '{{json .}}'`"""
+        with self.lock:
+            for raw in events:
+                event = parse_event(raw)
+                container = self.containers.get(event["id"])
+                if container is not None:
+                    if event["action"] == "start":
+                        container["running"] = True
+                    elif event["action"] in ("die", "stop", "kill", "oom"):
+                        container["running"] = False
+                    elif event["action"] == "destroy":
+                        del self.containers[event["id"]]
+                for subscriber in self.subscribers:
+                    subscriber.put(raw)
+
+    def disconnect_events(self):
+        """End every event stream, as if the daemon connection was lost"""
+        with self.lock:
+            for subscriber in self.subscribers:
+                subscriber.put(None)
+
+    def _emit(self, action, container):
+        # Called with the lock held
+        raw = {
+            "Type": "container",
+            "Action": action,
+            "id": container["id"],
+            "Actor": {"ID": container["id"], "Attributes": dict(container["labels"], name=container["name"])},
+            "time": int(time.time()),
+        }
+        for subscriber in self.subscribers:
+            subscriber.put(raw)
+
+    def exec_run(self, container_id, command):
+        self._call()
+        with self.lock:
+            if not self._get(container_id)["running"]:
+                raise ContainerRuntimeError(f"Container {container_id} is not running", 409)
+
+    def logs(self, container_id):
+        self._call()
+        with self.lock:
+            self._get(container_id)
+        return ""
+
+
+def _bulk(items, fn, max_workers):
+    """Run ``fn(item)`` for every item on a bounded thread pool and report the outcome.
+
+    Returns {"results": [{"id", "ok", "error"}], "succeeded", "failed", "elapsed"}.
+    """
+    started = time.time()
+    items = list(dict.fromkeys(items))
+
+    def run(item):
+        try:
+            fn(item)
+            return {"id": item, "ok": True, "error": None}
+        except ContainerNotFound:
+            # Already gone, which is what we wanted
+            return {"id": item, "ok": True, "error": None}
+        except Exception as e:
+            return {"id": item, "ok": False, "error": str(e)}
+
+    if items:
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(items)))) as executor:
+            results = list(executor.map(run, items))
+    else:
+        results = []
+    succeeded = sum(1 for result in results if result["ok"])
+    return {
+        "results": results,
+        "succeeded": succeeded,
+        "failed": len(results) - succeeded,
+        "elapsed": time.time() - started,
+    }
+
+
+def remove_containers(runtime, container_ids, graceful=False, stop_timeout=10, max_workers=16):
+    """Remove many containers in parallel.
+
+    By default containers are force-removed, which kills them right away.
+    With ``graceful`` they are first given ``stop_timeout`` seconds to stop.
+    """
+    def remove(container_id):
+        if graceful:
+            try:
+                runtime.stop_container(container_id, timeout=stop_timeout)
+            except ContainerNotFound:
+                raise
+            except ContainerRuntimeError:
+                pass  # Force removal below still gets rid of it
+        runtime.remove_container(container_id, force=True)
+
+    return _bulk(container_ids, remove, max_workers)
+
+
+def remove_images(runtime, images, force=False, max_workers=8):
+    """Remove many images (by ID or tag) in parallel"""
+    return _bulk(images, lambda image: runtime.remove_image(image, force=force), max_workers)
+
+
+def wait_running(runtime, container_id, timeout=5, interval=0.1):
+    """Wait for a container that was just started to run, and return whether it does.
+
+    Returns False as soon as the container has exited or is gone, or once
+    ``timeout`` seconds have passed without it running.
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            state = runtime.inspect_container(container_id)["State"]
+        except ContainerNotFound:
+            return False
+        if state.get("Running") and not state.get("Restarting"):
+            return True
+        if state.get("Status") in ("exited", "dead") or time.monotonic() >= deadline:
+            return False
+        time.sleep(interval)
+
+
+def parse_event(raw):
+    """Turn a raw Docker event into {action, id, name, labels, time}"""
+    actor = raw.get("Actor") or {}
+    attributes = dict(actor.get("Attributes") or {})
+    return {
+        "action": (raw.get("Action") or raw.get("status") or "").split(":")[0],
+        "id": actor.get("ID") or raw.get("id"),
+        "name": attributes.pop("name", None),
+        "exit_code": attributes.pop("exitCode", None),
+        "labels": {key: value for key, value in attributes.items() if key not in ("image", "signal")},
+        "time": raw.get("time"),
+    }
+
+
+def all_labels_match(container_labels, labels):
+    return all(container_labels.get(key) == value for key, value in (labels or {}).items())
+
+
+def create_runtime(name=None):
+    """Create the runtime selected by CTF_CONTAINER_RUNTIME ("docker" or "fake")"""
+    name = name or os.environ.get("CTF_CONTAINER_RUNTIME", "docker")
+    if name == "fake":
+        return FakeRuntime(latency=float(os.environ.get("CTF_FAKE_RUNTIME_LATENCY", "0")))
+    if name != "docker":
+        raise ValueError(f"Unknown container runtime: {name}")
+
+    socket_path = DEFAULT_DOCKER_SOCKET
+    docker_host = os.environ.get("DOCKER_HOST", "")
+    if docker_host.startswith("unix://"):
+        socket_path = docker_host[len("unix://"):]
+    elif docker_host:
+        print(f"Warning: DOCKER_HOST={docker_host} is not a unix:// socket, using {socket_path}")
+    return DockerRuntime(socket_path=socket_path,
+                         pool_size=int(os.environ.get("CTF_DOCKER_POOL_SIZE", "16")))
@@ -0,0 +1,91 @@
+"""Database engine configuration.
+
+The database is chosen with DATABASE_URL, e.g. ``sqlite:///ctf.db`` (the
+default, relative to the instance folder) or
+``postgresql://ctf:secret@db/ctf`` for bigger events. Pool sizing applies to
+every backend. SQLite connections additionally get the pragmas below, so
+concurrent requests don't serialise on the rollback journal.
+"""
+import os
+import sqlite3
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine, make_url
+
+DEFAULT_DATABASE_URL = 'sqlite:///ctf.db'
+
+# Connections kept open per worker, and extra ones allowed under load
+POOL_SIZE = int(os.environ.get('CTF_DB_POOL_SIZE', '10'))
+MAX_OVERFLOW = int(os.environ.get('CTF_DB_MAX_OVERFLOW', '20'))
+# Seconds to wait for a free connection before failing the request
+POOL_TIMEOUT = float(os.environ.get('CTF_DB_POOL_TIMEOUT', '30'))
+# Reconnect after this many seconds, before a server or proxy drops the connection
+POOL_RECYCLE = int(os.environ.get('CTF_DB_POOL_RECYCLE', '1800'))
+
+SQLITE_JOURNAL_MODE = os.environ.get('CTF_SQLITE_JOURNAL_MODE', 'WAL')
+SQLITE_SYNCHRONOUS = os.environ.get('CTF_SQLITE_SYNCHRONOUS', 'NORMAL')
+# Milliseconds a writer waits for the lock before "database is locked"
+SQLITE_BUSY_TIMEOUT = int(os.environ.get('CTF_SQLITE_BUSY_TIMEOUT', '5000'))
+SQLITE_MMAP_SIZE = int(os.environ.get('CTF_SQLITE_MMAP_SIZE', str(256 * 1024 * 1024)))
+# Negative values are in KiB, so this is a 64 MiB page cache per connection
+SQLITE_CACHE_SIZE = int(os.environ.get('CTF_SQLITE_CACHE_SIZE', '-65536'))
+
+
+def database_url():
+    """Return the configured database URL"""
+    url = os.environ.get('DATABASE_URL', DEFAULT_DATABASE_URL)
+    # SQLAlchemy 1.4+ no longer accepts the postgres:// scheme many hosts hand out
+    if url.startswith('postgres://'):
+        url = 'postgresql://' + url[len('postgres://'):]
+    return url
+
+
+def is_memory_sqlite(url):
+    url = make_url(url)
+    return url.get_backend_name() == 'sqlite' and url.database in (None, '', ':memory:')
+
+
+def engine_options(url):
+    """Return SQLALCHEMY_ENGINE_OPTIONS for ``url``"""
+    backend = make_url(url).get_backend_name()
+    if is_memory_sqlite(url):
+        # Flask-SQLAlchemy uses a single shared connection for in-memory databases
+        return {}
+
+    options = {
+        'pool_size': POOL_SIZE,
+        'max_overflow': MAX_OVERFLOW,
+        'pool_timeout': POOL_TIMEOUT,
+    }
+    if backend == 'sqlite':
+        # Connections are handed between request threads by the pool. The sqlite3
+        # timeout is in seconds and is replaced by busy_timeout once connected.
+        options['connect_args'] = {'check_same_thread': False, 'timeout': SQLITE_BUSY_TIMEOUT / 1000}
+    else:
+        options['pool_recycle'] = POOL_RECYCLE
+        options['pool_pre_ping'] = True
+    return options
+
+
+def configure_app(app):
+    """Set the database URL and engine options on a Flask app"""
+    url = database_url()
+    app.config['SQLALCHEMY_DATABASE_URI'] = url
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(url)
+    return url
+
+
+@event.listens_for(Engine, 'connect')
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    if not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    cursor = dbapi_connection.cursor()
+    try:
+        # busy_timeout first, so switching the journal mode waits out other writers
+        cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT}")
+        cursor.execute(f"PRAGMA journal_mode={SQLITE_JOURNAL_MODE}")
+        cursor.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+        cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+        cursor.execute(f"PRAGMA cache_size={SQLITE_CACHE_SIZE}")
+    finally:
+        cursor.close()
@@ -0,0 +1,126 @@
+"""Server-sent events pushed to the players' browsers.
+
+Each worker has one EventBroadcaster. Every connected client has a bounded
+queue of encoded events, so publishing never blocks on a slow client. A
+client that falls ``max_queue`` events behind is disconnected instead of
+buffered without limit; its EventSource reconnects and starts again from a
+fresh snapshot.
+
+Every open stream holds a server thread, so a worker serves at most
+``max_subscriptions`` of them; ``subscribe`` refuses the rest, which then
+poll instead. A stream also ends after ``max_age`` seconds and its client
+reconnects, so a stream whose client went away without the keepalives
+failing gives its slot back.
+"""
+import collections
+import json
+import queue
+import threading
+import time
+
+# Sent in place of an event when a client has been idle, so proxies don't
+# close the connection
+KEEPALIVE = ": keepalive\n\n"
+
+
+def format_event(event, data):
+    """Encode an event in the text/event-stream format"""
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+class Subscription:
+    """The queue of events waiting to be sent to one client"""
+
+    def __init__(self, user_id, username, max_queue):
+        self.user_id = user_id
+        self.username = username
+        self.queue = queue.Queue(max_queue)
+        self.closed = False
+
+    def put(self, message):
+        """Queue an encoded event. Returns False if the client is too far behind."""
+        try:
+            self.queue.put_nowait(message)
+            return True
+        except queue.Full:
+            return False
+
+    def close(self):
+        self.closed = True
+        # Wake up a reader blocked on an empty queue
+        try:
+            self.queue.put_nowait(None)
+        except queue.Full:
+            pass
+
+    def messages(self, keepalive=15, max_age=None):
+        """Yield queued events until the subscription is closed or ``max_age``
+        seconds have passed, and KEEPALIVE after ``keepalive`` seconds without one"""
+        deadline = time.monotonic() + max_age if max_age else None
+        while not self.closed:
+            timeout = keepalive
+            if deadline is not None:
+                timeout = min(timeout, deadline - time.monotonic())
+                if timeout <= 0:
+                    break
+            try:
+                message = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                if deadline is None or time.monotonic() < deadline:
+                    yield KEEPALIVE
+                continue
+            if message is None:
+                break
+            yield message
+
+
+class EventBroadcaster:
+    """Fans events out to every subscribed client, or to the clients of one user"""
+
+    def __init__(self, max_queue=100, max_subscriptions=None):
+        self.max_queue = max_queue
+        self.max_subscriptions = max_subscriptions
+        self.lock = threading.Lock()
+        self.by_user = collections.defaultdict(set)  # username -> subscriptions
+
+    def __len__(self):
+        with self.lock:
+            return sum(len(subscriptions) for subscriptions in self.by_user.values())
+
+    def subscribe(self, user_id, username):
+        """Return a new subscription, or None if this worker serves as many streams as it may"""
+        subscription = Subscription(user_id, username, self.max_queue)
+        with self.lock:
+            if self.max_subscriptions is not None:
+                if sum(len(subscriptions) for subscriptions in self.by_user.values()) >= self.max_subscriptions:
+                    return None
+            self.by_user[username].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            subscriptions = self.by_user.get(subscription.username)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self.by_user[subscription.username]
+        subscription.close()
+
+    def users(self):
+        """Return {username: user_id} of the users with at least one client"""
+        with self.lock:
+            return {username: next(iter(subscriptions)).user_id
+                    for username, subscriptions in self.by_user.items()}
+
+    def publish(self, event, data, username=None):
+        """Send an event to every client, or only to the clients of ``username``"""
+        message = format_event(event, data)
+        with self.lock:
+            if username is None:
+                targets = [s for subscriptions in self.by_user.values() for s in subscriptions]
+            else:
+                targets = list(self.by_user.get(username, ()))
+        for subscription in targets:
+            if not subscription.put(message):
+                print(f"Dropping event stream of {subscription.username}: client is too far behind")
+                self.unsubscribe(subscription)
@@ -0,0 +1,91 @@
+import heapq
+import itertools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+
+class ExpiryScheduler:
+    """Calls ``expire_fn(key)`` when a key's deadline is reached.
+
+    Deadlines are kept in a min-heap and a single thread sleeps until the
+    earliest one, so keys fire on time without polling. Rescheduling or
+    cancelling a key is O(log n): the old heap entry is left in place and
+    skipped when it reaches the top. Due keys are handed to a bounded thread
+    pool so slow stops don't delay each other.
+    """
+
+    def __init__(self, expire_fn, max_workers=8):
+        self.expire_fn = expire_fn
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="expiry")
+        self.condition = threading.Condition()
+        self.heap = []
+        self.deadlines = {}
+        self.counter = itertools.count()
+        self.thread = None
+
+    def __len__(self):
+        with self.condition:
+            return len(self.deadlines)
+
+    def schedule(self, key, deadline):
+        """Set (or move) the deadline of ``key``"""
+        with self.condition:
+            self.deadlines[key] = deadline
+            heapq.heappush(self.heap, (deadline, next(self.counter), key))
+            # Wake the scheduler thread if this is now the earliest deadline
+            if self.heap[0][2] == key:
+                self.condition.notify()
+
+    def cancel(self, key):
+        with self.condition:
+            return self.deadlines.pop(key, None) is not None
+
+    def deadline(self, key):
+        with self.condition:
+            return self.deadlines.get(key)
+
+    def pop_due(self, now):
+        """Return the keys whose deadline is at or before ``now`` and forget them"""
+        due = []
+        with self.condition:
+            while self.heap and self.heap[0][0] <= now:
+                deadline, _, key = heapq.heappop(self.heap)
+                if self.deadlines.get(key) == deadline:
+                    del self.deadlines[key]
+                    due.append(key)
+            # Drop stale entries once they make up most of the heap
+            if len(self.heap) > 2 * len(self.deadlines) + 64:
+                self.heap = [entry for entry in self.heap if self.deadlines.get(entry[2]) == entry[0]]
+                heapq.heapify(self.heap)
+        return due
+
+    def _run(self, key):
+        try:
+            self.expire_fn(key)
+        except Exception as e:
+            print(f"Error expiring {key}: {e}")
+
+    def start(self):
+        """Start the scheduler thread"""
+        def scheduler_thread():
+            while True:
+                with self.condition:
+                    while True:
+                        # Skip entries that were cancelled or rescheduled
+                        while self.heap and self.deadlines.get(self.heap[0][2]) != self.heap[0][0]:
+                            heapq.heappop(self.heap)
+                        if not self.heap:
+                            self.condition.wait()
+                            continue
+                        delay = (self.heap[0][0] - datetime.now()).total_seconds()
+                        if delay <= 0:
+                            break
+                        self.condition.wait(delay)
+
+                for key in self.pop_due(datetime.now()):
+                    self.executor.submit(self._run, key)
+
+        self.thread = threading.Thread(target=scheduler_thread, daemon=True)
+        self.thread.start()
+        return self.thread
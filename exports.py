@@ -0,0 +1,62 @@
+"""Streaming CSV and NDJSON exports.
+
+Records are dicts produced by a generator. They are written out in chunks
+of about CHUNK_SIZE bytes, optionally gzip-compressed, so an export of any
+size is never held in memory as a whole.
+"""
+import csv
+import io
+import json
+import zlib
+
+CHUNK_SIZE = 64 * 1024
+
+# Export format -> MIME type
+EXPORT_FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+def ndjson_chunks(records):
+    buffer = io.StringIO()
+    for record in records:
+        buffer.write(json.dumps(record))
+        buffer.write("\n")
+        if buffer.tell() >= CHUNK_SIZE:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def csv_chunks(records, fields):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=fields, extrasaction='ignore')
+    writer.writeheader()
+    for record in records:
+        writer.writerow(record)
+        if buffer.tell() >= CHUNK_SIZE:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def export_chunks(records, fields, export_format):
+    """Return a generator of text chunks of the records in ``export_format``"""
+    if export_format == 'csv':
+        return csv_chunks(records, fields)
+    if export_format == 'ndjson':
+        return ndjson_chunks(records)
+    raise ValueError(f"Unknown export format: {export_format}")
+
+
+def gzip_chunks(chunks, level=6):
+    """Compress a stream of text chunks into a gzip stream"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode())
+        if data:
+            yield data
+    yield compressor.flush()
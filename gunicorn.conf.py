@@ -0,0 +1,30 @@
+# Gunicorn settings for serving the platform with several workers:
+#
+#   gunicorn -c gunicorn.conf.py app:app
+import os
+import subprocess
+import sys
+
+bind = os.environ.get('CTF_BIND', '0.0.0.0:5010')
+workers = int(os.environ.get('CTF_WORKERS', '4'))
+
+# Every live update stream (/events) holds a thread for as long as it is open,
+# so the workers must be threaded: sync workers would be taken up by the first
+# few streams. Each worker serves at most CTF_EVENTS_MAX_STREAMS streams, which
+# leaves the rest of its threads for ordinary requests.
+worker_class = 'gthread'
+threads = int(os.environ.get('CTF_THREADS', '32'))
+
+
+def on_starting(server):
+    """Set up the platform once, before any worker starts.
+
+    The setup runs in a separate process so the master never opens the
+    database or Docker connections the workers would inherit. The workers
+    skip it because CTF_SETUP_DONE is set, and start their own background
+    threads on their first request.
+    """
+    if not os.environ.get('CTF_SETUP_DONE'):
+        subprocess.run([sys.executable, "-m", "flask", "--app", "app", "setup"],
+                       cwd=os.path.dirname(os.path.abspath(__file__)), check=True)
+        os.environ['CTF_SETUP_DONE'] = '1'
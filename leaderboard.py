@@ -0,0 +1,190 @@
+import bisect
+import hashlib
+import json
+import threading
+import time
+from datetime import datetime
+
+
+class Leaderboard:
+    """In-memory leaderboard kept sorted by (points desc, solves desc, last solve asc).
+
+    ``load_all()`` returns the full board as (rows, last_solve_id, last_user_id),
+    where each row is (user_id, username, points, solved, last_solve_at).
+    ``load_since(last_solve_id, last_user_id)`` returns (new_users, new_solves):
+    users as (user_id, username) and solves as
+    (solve_id, user_id, points_awarded, solved_at). Changes made by other
+    workers are picked up with ``load_since`` at most every ``sync_interval``
+    seconds, so a read never has to aggregate submissions. New users start at
+    0 points and gain them through their solves; points from anything else
+    show up at the next ``rebuild()``.
+
+    Solve IDs can commit out of order (on PostgreSQL a transaction holding a
+    lower ID may commit after a higher one), so each sync re-reads the last
+    ``lookback`` IDs behind the newest one and skips the solves it has seen.
+    """
+
+    def __init__(self, load_all, load_since, sync_interval=2, lookback=100):
+        self.load_all = load_all
+        self.load_since = load_since
+        self.sync_interval = sync_interval
+        self.lookback = lookback
+        self.lock = threading.Lock()
+        self.entries = {}  # user_id -> entry dict
+        self.order = []  # sorted sort keys
+        self.last_solve_id = 0
+        self.last_user_id = 0
+        self.seen_solve_ids = set()  # IDs within lookback of last_solve_id that were counted
+        self.version = 0
+        self.synced_at = None
+        self.rendered = {}  # limit -> (version, body, etag)
+
+    @staticmethod
+    def _key(entry):
+        return (-entry["points"], -entry["solved"], entry["last_solve_at"] or datetime.max, entry["user_id"])
+
+    def _insert(self, entry):
+        # Called with the lock held
+        self.entries[entry["user_id"]] = entry
+        bisect.insort(self.order, self._key(entry))
+
+    def _remove(self, entry):
+        # Called with the lock held
+        index = bisect.bisect_left(self.order, self._key(entry))
+        del self.order[index]
+
+    def rebuild(self):
+        """Reload the whole board"""
+        rows, last_solve_id, last_user_id = self.load_all()
+        last_solve_id = last_solve_id or 0
+        # The solves in the lookback window that the board now includes
+        _, window = self.load_since(max(0, last_solve_id - self.lookback), last_user_id or 0)
+        with self.lock:
+            self.entries = {}
+            self.order = []
+            for user_id, username, points, solved, last_solve_at in rows:
+                self._insert({
+                    "user_id": user_id,
+                    "username": username,
+                    "points": points or 0,
+                    "solved": solved or 0,
+                    "last_solve_at": last_solve_at
+                })
+            self.last_solve_id = last_solve_id
+            self.last_user_id = last_user_id or 0
+            self.seen_solve_ids = {solve[0] for solve in window if solve[0] <= last_solve_id}
+            self.version += 1
+            self.synced_at = time.monotonic()
+
+    def sync(self, force=False):
+        """Apply users and solves added since the last sync"""
+        with self.lock:
+            if self.synced_at is None:
+                needs_rebuild = True
+            elif not force and time.monotonic() - self.synced_at < self.sync_interval:
+                return
+            else:
+                needs_rebuild = False
+                last_solve_id, last_user_id = self.last_solve_id, self.last_user_id
+        if needs_rebuild:
+            self.rebuild()
+            return
+
+        new_users, new_solves = self.load_since(max(0, last_solve_id - self.lookback), last_user_id)
+        with self.lock:
+            self.synced_at = time.monotonic()
+            changed = False
+            for user_id, username in new_users:
+                self.last_user_id = max(self.last_user_id, user_id)
+                if user_id not in self.entries:
+                    self._insert({"user_id": user_id, "username": username, "points": 0,
+                                  "solved": 0, "last_solve_at": None})
+                    changed = True
+            for solve_id, user_id, points_awarded, solved_at in new_solves:
+                # Skip solves already counted, by an earlier sync or a concurrent rebuild
+                if solve_id <= self.last_solve_id - self.lookback or solve_id in self.seen_solve_ids:
+                    continue
+                self.seen_solve_ids.add(solve_id)
+                self.last_solve_id = max(self.last_solve_id, solve_id)
+                entry = self.entries.get(user_id)
+                if entry is None:
+                    continue
+                self._remove(entry)
+                entry["points"] += points_awarded or 0
+                entry["solved"] += 1
+                entry["last_solve_at"] = solved_at
+                bisect.insort(self.order, self._key(entry))
+                changed = True
+            floor = self.last_solve_id - self.lookback
+            self.seen_solve_ids = {solve_id for solve_id in self.seen_solve_ids if solve_id > floor}
+            if changed:
+                self.version += 1
+
+    def invalidate(self):
+        """Make the next read sync, e.g. after this worker recorded a solve"""
+        with self.lock:
+            if self.synced_at is not None:
+                self.synced_at = 0
+
+    def top(self, limit=None):
+        """Return the first ``limit`` entries (all if None) with their ranks"""
+        self.sync()
+        with self.lock:
+            keys = self.order if limit is None else self.order[:limit]
+            return [dict(self.entries[key[3]], rank=index + 1) for index, key in enumerate(keys)]
+
+    def page(self, limit, after=None):
+        """Return (entries, total) for up to ``limit`` entries after ``after``.
+
+        ``after`` is (points, solved, last_solve_at, user_id) of the last entry
+        of the previous page. Paging by sort key rather than position keeps
+        pages from skipping or repeating users when the board changes between
+        requests.
+        """
+        self.sync()
+        with self.lock:
+            start = 0
+            if after is not None:
+                points, solved, last_solve_at, user_id = after
+                start = bisect.bisect_right(self.order, (-points, -solved, last_solve_at or datetime.max, user_id))
+            keys = self.order[start:start + limit]
+            entries = [dict(self.entries[key[3]], rank=start + index + 1) for index, key in enumerate(keys)]
+            return entries, len(self.order)
+
+    def rank(self, user_id):
+        """Return the user's 1-based rank in O(log n), or None for an unknown user"""
+        self.sync()
+        with self.lock:
+            entry = self.entries.get(user_id)
+            if entry is None:
+                return None
+            return bisect.bisect_left(self.order, self._key(entry)) + 1
+
+    def standing(self, user_id):
+        """Return a copy of the user's entry with its rank, or None for an unknown user"""
+        self.sync()
+        with self.lock:
+            entry = self.entries.get(user_id)
+            if entry is None:
+                return None
+            return dict(entry, rank=bisect.bisect_left(self.order, self._key(entry)) + 1)
+
+    def render(self, limit=10):
+        """Return (body, etag) of the public top ``limit`` as JSON, built once per version"""
+        self.sync()
+        with self.lock:
+            version = self.version
+            cached = self.rendered.get(limit)
+            if cached and cached[0] == version:
+                return cached[1], cached[2]
+        body = json.dumps([{
+            "username": entry["username"],
+            "points": entry["points"],
+            "solved_challenges": entry["solved"],
+            "rank": entry["rank"]
+        } for entry in self.top(limit)])
+        # A hash of the content, so every worker gives the same board the same ETag
+        etag = hashlib.sha1(body.encode()).hexdigest()
+        with self.lock:
+            self.rendered[limit] = (version, body, etag)
+        return body, etag
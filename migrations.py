@@ -0,0 +1,96 @@
+"""Schema migrations for existing databases.
+
+``db.create_all()`` creates missing tables but never alters existing ones,
+so changes to tables that already exist are listed here. Each migration is
+a version, a description and a list of steps: SQL strings or functions
+taking a connection. They run after ``create_all``, so new tables already
+exist, and must be safe to run on a database created from the current
+models, since a fresh database already has everything. Applied versions
+are recorded in the schema_version table.
+"""
+from datetime import datetime
+
+from sqlalchemy import text
+from sqlalchemy.exc import IntegrityError
+
+def widen_password_hash(conn):
+    """Make room for the longer hashes of the current hashing method"""
+    if conn.dialect.name == "postgresql":
+        conn.execute(text('ALTER TABLE "user" ALTER COLUMN password_hash TYPE VARCHAR(256)'))
+    elif conn.dialect.name in ("mysql", "mariadb"):
+        conn.execute(text("ALTER TABLE `user` MODIFY password_hash VARCHAR(256) NOT NULL"))
+    # SQLite doesn't enforce VARCHAR lengths
+
+
+MIGRATIONS = [
+    (1, "Token lookup and expiry indexes", [
+        "CREATE INDEX IF NOT EXISTS ix_token_token_is_active ON token (token, is_active)",
+        "CREATE INDEX IF NOT EXISTS ix_token_expires_at ON token (expires_at)",
+    ]),
+    (2, "Submission and user points indexes", [
+        # A user's solves, and whether they already solved a challenge
+        "CREATE INDEX IF NOT EXISTS ix_submission_user_correct_challenge "
+        "ON submission (user_id, is_correct, challenge_id)",
+        # Solve counts per challenge
+        "CREATE INDEX IF NOT EXISTS ix_submission_challenge_correct ON submission (challenge_id, is_correct)",
+        # A user's recent submissions
+        "CREATE INDEX IF NOT EXISTS ix_submission_user_submitted_at ON submission (user_id, submitted_at)",
+        # Recent submissions of everyone
+        "CREATE INDEX IF NOT EXISTS ix_submission_submitted_at ON submission (submitted_at)",
+        # Leaderboard order and rank
+        'CREATE INDEX IF NOT EXISTS ix_user_points ON "user" (points)',
+    ]),
+    (3, "Backfill solves from correct submissions", [
+        "INSERT INTO solve (user_id, challenge_id, points_awarded, solved_at) "
+        "SELECT user_id, challenge_id, MAX(points_awarded), MIN(submitted_at) FROM submission s "
+        "WHERE is_correct AND NOT EXISTS ("
+        "SELECT 1 FROM solve WHERE solve.user_id = s.user_id AND solve.challenge_id = s.challenge_id) "
+        "GROUP BY user_id, challenge_id",
+    ]),
+    (4, "Submission keyset pagination index", [
+        "CREATE INDEX IF NOT EXISTS ix_submission_submitted_at_id ON submission (submitted_at, id)",
+        # Superseded by the index above
+        "DROP INDEX IF EXISTS ix_submission_submitted_at",
+    ]),
+    (5, "Widen user.password_hash to 256 characters", [
+        widen_password_hash,
+    ]),
+]
+
+
+def _ensure_version_table(engine):
+    with engine.begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE IF NOT EXISTS schema_version ("
+            "version INTEGER PRIMARY KEY, description VARCHAR(200), applied_at TIMESTAMP)"
+        ))
+
+
+def applied_versions(engine):
+    _ensure_version_table(engine)
+    with engine.connect() as conn:
+        return {row[0] for row in conn.execute(text("SELECT version FROM schema_version"))}
+
+
+def run_migrations(engine):
+    """Apply pending migrations in order, each in its own transaction"""
+    applied = applied_versions(engine)
+    for version, description, steps in MIGRATIONS:
+        if version in applied:
+            continue
+        print(f"Applying migration {version}: {description}")
+        try:
+            with engine.begin() as conn:
+                for step in steps:
+                    if callable(step):
+                        step(conn)
+                    else:
+                        conn.execute(text(step))
+                conn.execute(
+                    text("INSERT INTO schema_version (version, description, applied_at) "
+                         "VALUES (:version, :description, :applied_at)"),
+                    {"version": version, "description": description, "applied_at": datetime.utcnow()}
+                )
+        except IntegrityError:
+            # Another worker applied it first and its transaction was rolled back here
+            print(f"Migration {version} was already applied by another process")
@@ -1,9 +1,16 @@
+import os
 from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime
 from werkzeug.security import generate_password_hash, check_password_hash
 
 db = SQLAlchemy()
 
+# Werkzeug hash method for passwords, e.g. "pbkdf2:sha256:600000" or "scrypt:32768:8:1".
+# Passwords hashed with other parameters are rehashed on the next login.
+PASSWORD_HASH_METHOD = os.environ.get('CTF_PASSWORD_HASH_METHOD', 'pbkdf2:sha256:600000')
+# The method as it appears at the start of a hash, with Werkzeug's defaults filled in
+PASSWORD_HASH_PREFIX = generate_password_hash('', method=PASSWORD_HASH_METHOD).split('$', 1)[0]
+
 # Association table for user achievements
 user_achievements = db.Table('user_achievements',
     db.Column('user_id', db.Integer, db.ForeignKey('user.id'), primary_key=True),
@@ -11,12 +18,15 @@ user_achievements = db.Table('user_achievements',
     db.Column('earned_at', db.DateTime, default=datetime.utcnow)
 )
 
+def hash_password(password):
+    return generate_password_hash(password, method=PASSWORD_HASH_METHOD)
+
 class User(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(80), unique=True, nullable=False)
-    password_hash = db.Column(db.String(128), nullable=False)
+    password_hash = db.Column(db.String(256), nullable=False)
     email = db.Column(db.String(120), unique=True, nullable=True)
-    points = db.Column(db.Integer, default=0)
+    points = db.Column(db.Integer, default=0, index=True)  # Leaderboard order and rank
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     last_login = db.Column(db.DateTime, default=datetime.utcnow)
     is_admin = db.Column(db.Boolean, default=False)
@@ -27,13 +37,17 @@ class User(db.Model):
                                   backref=db.backref('users', lazy='dynamic'))
     
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = hash_password(password)
         
     def check_password(self, password):
         return check_password_hash(self.password_hash, password)
     
+    def password_needs_rehash(self):
+        return self.password_hash.split('$', 1)[0] != PASSWORD_HASH_PREFIX
+    
     def add_points(self, points):
-        self.points += points
+        # A single UPDATE, so concurrent awards to the same user aren't lost
+        User.query.filter_by(id=self.id).update({User.points: db.func.coalesce(User.points, 0) + points})
         db.session.commit()
         
     def __repr__(self):
@@ -66,9 +80,39 @@ class Submission(db.Model):
     points_awarded = db.Column(db.Integer, default=0)
     submitted_at = db.Column(db.DateTime, default=datetime.utcnow)
     
+    # Existing databases get these from migrations.py
+    __table_args__ = (
+        # A user's solves, and whether they already solved a challenge
+        db.Index('ix_submission_user_correct_challenge', 'user_id', 'is_correct', 'challenge_id'),
+        # Solve counts per challenge
+        db.Index('ix_submission_challenge_correct', 'challenge_id', 'is_correct'),
+        # A user's recent submissions
+        db.Index('ix_submission_user_submitted_at', 'user_id', 'submitted_at'),
+        # Recent submissions of everyone, and keyset pagination over them
+        db.Index('ix_submission_submitted_at_id', 'submitted_at', 'id'),
+    )
+    
     def __repr__(self):
         return f'<Submission {self.id} by User {self.user_id}>'
 
+class Solve(db.Model):
+    """First correct submission of a challenge by a user"""
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    challenge_id = db.Column(db.Integer, db.ForeignKey('challenge.id'), nullable=False)
+    points_awarded = db.Column(db.Integer, nullable=False, default=0)
+    solved_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        # Decides which of several concurrent correct submissions awards the points
+        db.UniqueConstraint('user_id', 'challenge_id', name='uq_solve_user_challenge'),
+        # Solve counts per challenge
+        db.Index('ix_solve_challenge_id', 'challenge_id'),
+    )
+    
+    def __repr__(self):
+        return f'<Solve of Challenge {self.challenge_id} by User {self.user_id}>'
+
 class Hint(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     challenge_id = db.Column(db.Integer, db.ForeignKey('challenge.id'), nullable=False)
@@ -99,5 +143,22 @@ class Token(db.Model):
     # Relationship
     user = db.relationship('User', backref=db.backref('tokens', lazy=True))
     
+    # Existing databases get these from migrations.py
+    __table_args__ = (
+        # Token lookups filter on both columns
+        db.Index('ix_token_token_is_active', 'token', 'is_active'),
+        # Used by the pruning job
+        db.Index('ix_token_expires_at', 'expires_at'),
+    )
+    
     def __repr__(self):
         return f'<Token {self.token[:10]}... for User {self.user_id}>'
+
+class TokenRevocation(db.Model):
+    """Revocation generation of a user's signed session tokens"""
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    generation = db.Column(db.Integer, nullable=False, default=0)
+    revoked_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<TokenRevocation of User {self.user_id}: generation {self.generation}>'
@@ -0,0 +1,90 @@
+import time
+
+
+class PortAllocator:
+    """Leases host ports for challenge containers from a fixed range.
+
+    Leases live in the ``leases`` state store (see state_store.py) and a port
+    is only handed out once its lease has been added there atomically, so two
+    workers never publish containers on the same port. The ``free`` store
+    holds the ports that are probably free; reserving pops one from it, so
+    reserving and releasing a port is O(1) however full the range is. A port
+    that turns out to be leased after all is dropped from the free store when
+    it is popped. With memory stores this serves a single worker.
+    """
+
+    def __init__(self, start_port, end_port, leases, free, stale_after=60):
+        if end_port < start_port:
+            raise ValueError(f"Invalid port range {start_port}-{end_port}")
+        self.start_port = start_port
+        self.end_port = end_port
+        self.leases = leases
+        self.free = free
+        # A lease no container uses is only dropped by reconcile() once it is this
+        # old, so a port reserved for a container that is still starting is kept
+        self.stale_after = stale_after
+
+    def __contains__(self, port):
+        return self.start_port <= port <= self.end_port
+
+    def _lease(self, owner):
+        return {"owner": owner, "leased_at": time.time()}
+
+    def reserve(self, owner=None):
+        """Lease a free port to ``owner`` and return it"""
+        for refill in (True, False):
+            while True:
+                item = self.free.pop()
+                if item is None:
+                    break
+                port = int(item[0])
+                if port in self and self.leases.add(item[0], self._lease(owner)):
+                    return port
+            # The free store is empty on first use, or lost ports to a crash
+            if refill:
+                self.refill()
+        raise RuntimeError(f"No free ports left in range {self.start_port}-{self.end_port}")
+
+    def assign(self, port, owner):
+        """Move the lease of a reserved port to a new owner, e.g. once the container ID is known"""
+        if self.leases.get(str(port)) is not None:
+            self.leases.put(str(port), self._lease(owner))
+
+    def mark_used(self, port, owner=None):
+        """Lease a specific port, e.g. one already used by a running container"""
+        if port in self:
+            self.leases.put(str(port), self._lease(owner))
+
+    def release(self, port):
+        """Return a leased port to the free ports"""
+        if port in self:
+            self.leases.delete(str(port))
+            self.free.put(str(port), {})
+
+    def refill(self):
+        """Put every port in the range that isn't leased into the free store"""
+        leased = self.leases.load_all()
+        self.free.put_many({str(port): {} for port in range(self.start_port, self.end_port + 1)
+                            if str(port) not in leased})
+
+    def reconcile(self, used_ports):
+        """Sync the leases with the ports that are actually in use.
+
+        ``used_ports`` maps port -> owner. Stale leases missing from it are
+        released and ports that are in use but not leased are marked as used.
+        """
+        cutoff = time.time() - self.stale_after
+        for key, lease in self.leases.load_all().items():
+            if int(key) not in used_ports and lease.get("leased_at", 0) < cutoff:
+                self.leases.delete(key)
+        for port, owner in used_ports.items():
+            self.mark_used(port, owner)
+        self.refill()
+
+    def stats(self):
+        leased = len(self.leases.load_all())
+        return {
+            "range": f"{self.start_port}-{self.end_port}",
+            "free": self.end_port - self.start_port + 1 - leased,
+            "leased": leased
+        }
@@ -0,0 +1,124 @@
+import collections
+import secrets
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+
+class ProvisioningJob:
+    """A challenge container being built and started in the background"""
+
+    def __init__(self, user_id, challenge_id, fn):
+        self.id = secrets.token_urlsafe(16)
+        self.user_id = user_id
+        self.challenge_id = challenge_id
+        self.fn = fn
+        self.status = "queued"  # queued, building, starting, ready or failed
+        self.result = None
+        self.error = None
+        self.created_at = datetime.now()
+        self.finished_at = None
+
+    @property
+    def done(self):
+        return self.status in ("ready", "failed")
+
+    def set_status(self, status):
+        self.status = status
+
+    def to_dict(self):
+        data = {
+            "job_id": self.id,
+            "status": self.status,
+            "challenge": self.challenge_id,
+            "created_at": self.created_at.isoformat()
+        }
+        if self.result:
+            data.update(self.result)
+        if self.error:
+            data["error"] = self.error
+        return data
+
+
+class ProvisioningQueue:
+    """Runs provisioning jobs on a bounded pool of worker threads.
+
+    At most ``max_workers`` jobs run at once, and at most
+    ``per_challenge_limit`` of them for the same challenge, so a rush of
+    starts can't overload the Docker daemon. Other jobs wait in order.
+    """
+
+    def __init__(self, max_workers=4, per_challenge_limit=2, keep_finished=600):
+        self.max_workers = max_workers
+        self.per_challenge_limit = per_challenge_limit
+        self.keep_finished = keep_finished
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="provision")
+        self.lock = threading.Lock()
+        self.jobs = {}
+        self.pending = collections.deque()
+        self.running = 0
+        self.running_by_challenge = collections.Counter()
+        # Unfinished job of each (user, challenge) so repeated clicks share one job
+        self.open_jobs = {}
+
+    def submit(self, user_id, challenge_id, fn):
+        """Queue ``fn(job)`` and return the job. ``fn`` returns the job result dict."""
+        with self.lock:
+            self._prune()
+            job_id = self.open_jobs.get((user_id, challenge_id))
+            if job_id:
+                return self.jobs[job_id]
+
+            job = ProvisioningJob(user_id, challenge_id, fn)
+            self.jobs[job.id] = job
+            self.open_jobs[(user_id, challenge_id)] = job.id
+            self.pending.append(job)
+            self._dispatch()
+        return job
+
+    def get(self, job_id):
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def stats(self):
+        with self.lock:
+            return {"queued": len(self.pending), "running": self.running,
+                    "running_by_challenge": dict(self.running_by_challenge)}
+
+    def _dispatch(self):
+        # Called with the lock held; starts every pending job that fits in the limits
+        for job in list(self.pending):
+            if self.running >= self.max_workers:
+                break
+            if self.running_by_challenge[job.challenge_id] >= self.per_challenge_limit:
+                continue
+            self.pending.remove(job)
+            self.running += 1
+            self.running_by_challenge[job.challenge_id] += 1
+            self.executor.submit(self._run, job)
+
+    def _run(self, job):
+        try:
+            job.result = job.fn(job)
+            job.status = "ready"
+        except Exception as e:
+            print(f"Provisioning job {job.id} for {job.user_id}/{job.challenge_id} failed: {e}")
+            job.error = str(e)
+            job.status = "failed"
+        finally:
+            job.finished_at = time.time()
+            with self.lock:
+                self.running -= 1
+                self.running_by_challenge[job.challenge_id] -= 1
+                if self.running_by_challenge[job.challenge_id] <= 0:
+                    del self.running_by_challenge[job.challenge_id]
+                self.open_jobs.pop((job.user_id, job.challenge_id), None)
+                self._dispatch()
+
+    def _prune(self):
+        # Forget finished jobs once clients have had time to read their result
+        cutoff = time.time() - self.keep_finished
+        for job_id in [job_id for job_id, job in self.jobs.items()
+                       if job.finished_at and job.finished_at < cutoff]:
+            del self.jobs[job_id]
@@ -0,0 +1,126 @@
+"""Batched read queries for the admin and profile views.
+
+Each function runs a fixed number of queries per page of rows it returns,
+so these pages don't issue a lookup per row.
+"""
+import base64
+import binascii
+import json
+from datetime import datetime
+
+from sqlalchemy import tuple_
+
+from models import db, User, Challenge, Submission, Solve
+
+
+def recent_submissions(limit=100, user_id=None):
+    """Return (submission, username, challenge_name) rows, newest first.
+
+    The names are None when the user or challenge no longer exists.
+    """
+    return submission_page(filtered_submissions(user_id=user_id), limit)[0]
+
+
+def challenge_solve_counts():
+    """Return {challenge.id: number of users who solved it}"""
+    return dict(db.session.query(Solve.challenge_id, db.func.count(Solve.id)).group_by(Solve.challenge_id).all())
+
+
+def solved_challenges(user_id):
+    """Return the challenges a user solved, in the order they were solved"""
+    return Challenge.query.join(Solve, Solve.challenge_id == Challenge.id).filter(
+        Solve.user_id == user_id
+    ).order_by(Solve.solved_at).all()
+
+
+def encode_cursor(values):
+    """Encode the sort key of the last row of a page as an opaque cursor"""
+    return base64.urlsafe_b64encode(json.dumps(values, separators=(",", ":")).encode()).decode()
+
+
+def decode_cursor(cursor):
+    """Decode a cursor from encode_cursor; raises ValueError if it is malformed"""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (TypeError, UnicodeError, binascii.Error, json.JSONDecodeError) as e:
+        raise ValueError(f"Invalid cursor: {e}")
+    if not isinstance(values, list):
+        raise ValueError("Invalid cursor")
+    return values
+
+
+def _submission_query(entities, user_id=None, username=None, challenge=None, is_correct=None,
+                      since=None, until=None):
+    query = db.session.query(*entities).select_from(Submission).outerjoin(
+        User, Submission.user_id == User.id
+    ).outerjoin(
+        Challenge, Submission.challenge_id == Challenge.id
+    )
+    if user_id is not None:
+        query = query.filter(Submission.user_id == user_id)
+    if username is not None:
+        query = query.filter(User.username == username)
+    if challenge is not None:
+        query = query.filter(Challenge.challenge_id == challenge)
+    if is_correct is not None:
+        query = query.filter(Submission.is_correct == is_correct)
+    if since is not None:
+        query = query.filter(Submission.submitted_at >= since)
+    if until is not None:
+        query = query.filter(Submission.submitted_at < until)
+    return query
+
+
+def filtered_submissions(**filters):
+    """Return a query of (submission, username, challenge_name) rows.
+
+    The filters are user_id, username, challenge (a challenge's string ID,
+    e.g. "web-basic"), is_correct, and a since/until range of submitted_at.
+    """
+    return _submission_query((Submission, User.username, Challenge.name), **filters)
+
+
+def submission_page(query, limit, cursor=None):
+    """Return (rows, next_cursor) of the page after ``cursor``, newest first.
+
+    Pages are keyed on (submitted_at, id), so each one is an index range scan
+    however deep into the history it is. next_cursor is None on the last page.
+    """
+    if cursor:
+        values = decode_cursor(cursor)
+        try:
+            submitted_at, submission_id = datetime.fromisoformat(values[0]), int(values[1])
+        except (IndexError, TypeError, ValueError):
+            raise ValueError("Invalid cursor")
+        query = query.filter(tuple_(Submission.submitted_at, Submission.id) < (submitted_at, submission_id))
+    rows = query.order_by(Submission.submitted_at.desc(), Submission.id.desc()).limit(limit + 1).all()
+    if len(rows) <= limit:
+        return rows, None
+    last = rows[limit - 1][0]
+    return rows[:limit], encode_cursor([last.submitted_at.isoformat(), last.id])
+
+
+SUBMISSION_EXPORT_FIELDS = ['id', 'submitted_at', 'user_id', 'username', 'challenge', 'challenge_name',
+                            'flag', 'is_correct', 'points_awarded']
+
+
+def iter_rows(query, batch_size=1000):
+    """Yield the rows of a query through a server-side cursor, ``batch_size`` at a time.
+
+    The whole export reads from one snapshot. With SQLite in WAL mode that
+    snapshot doesn't block writers.
+    """
+    return query.execution_options(stream_results=True).yield_per(batch_size)
+
+
+def export_submissions(batch_size=1000, **filters):
+    """Yield every matching submission as a dict of SUBMISSION_EXPORT_FIELDS, oldest first"""
+    query = _submission_query((
+        Submission.id, Submission.submitted_at, Submission.user_id, User.username,
+        Challenge.challenge_id.label('challenge'), Challenge.name.label('challenge_name'),
+        Submission.flag, Submission.is_correct, Submission.points_awarded
+    ), **filters).order_by(Submission.id)
+    for row in iter_rows(query, batch_size):
+        record = row._asdict()
+        record['submitted_at'] = row.submitted_at.isoformat() if row.submitted_at else None
+        yield record
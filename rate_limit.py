@@ -0,0 +1,46 @@
+import threading
+import time
+
+
+class RateLimiter:
+    """Token bucket rate limiter with one bucket per key.
+
+    Each bucket holds up to ``burst`` tokens and refills at ``rate`` tokens
+    per second. Buckets that have refilled completely carry no state and are
+    dropped once more than ``max_keys`` are tracked.
+    """
+
+    def __init__(self, rate, burst, max_keys=100000):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self.lock = threading.Lock()
+        self.buckets = {}  # key -> (tokens, updated_at)
+
+    def _tokens(self, key, now):
+        # Called with the lock held
+        tokens, updated_at = self.buckets.get(key, (self.burst, now))
+        return min(self.burst, tokens + (now - updated_at) * self.rate)
+
+    def allow(self, key, cost=1):
+        """Take ``cost`` tokens from the key's bucket.
+
+        Returns (allowed, retry_after), where retry_after is the number of
+        seconds until the request would be allowed.
+        """
+        now = time.monotonic()
+        with self.lock:
+            tokens = self._tokens(key, now)
+            if tokens < cost:
+                self.buckets[key] = (tokens, now)
+                return False, (cost - tokens) / self.rate
+
+            self.buckets[key] = (tokens - cost, now)
+            if len(self.buckets) > self.max_keys:
+                self._prune(now)
+            return True, 0
+
+    def _prune(self, now):
+        # Called with the lock held
+        for key in [key for key in self.buckets if self._tokens(key, now) >= self.burst]:
+            del self.buckets[key]
@@ -0,0 +1,100 @@
+"""First-solve scoring.
+
+A Solve row exists for each (user, challenge) pair that was solved, and the
+unique constraint on it decides which of several concurrent correct
+submissions awards the points. Points are added with a single UPDATE so
+concurrent solves by the same user can't overwrite each other.
+"""
+import threading
+
+from sqlalchemy import func, insert, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+
+from models import db, User, Solve
+
+# Dialects whose INSERT can skip an existing solve without raising, and the
+# oldest server version that supports it (SQLite added ON CONFLICT in 3.24)
+_CONFLICT_INSERTS = {"sqlite": (sqlite.insert, (3, 24)), "postgresql": (postgresql.insert, (9, 5))}
+
+
+class SolveCache:
+    """Per-worker set of (user_id, challenge_id) pairs known to be solved.
+
+    Only committed solves are added, and solves are never undone, so a cached
+    pair is always right. A missing pair only means this worker hasn't seen
+    the solve; the unique constraint on Solve still decides. Cleared when it
+    grows past ``max_size`` entries.
+    """
+
+    def __init__(self, max_size=1000000):
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        self.solved = set()
+
+    def contains(self, user_id, challenge_id):
+        return (user_id, challenge_id) in self.solved
+
+    def add(self, user_id, challenge_id):
+        with self.lock:
+            if len(self.solved) >= self.max_size:
+                self.solved.clear()
+            self.solved.add((user_id, challenge_id))
+
+
+solve_cache = SolveCache()
+
+
+def _insert_solve(user_id, challenge_id, points):
+    """Insert a Solve unless it exists; returns True if it was inserted"""
+    values = {"user_id": user_id, "challenge_id": challenge_id, "points_awarded": points}
+    dialect = db.session.get_bind().dialect
+    conflict_insert, min_version = _CONFLICT_INSERTS.get(dialect.name, (None, None))
+    if conflict_insert is not None and (dialect.server_version_info or (0,)) >= min_version:
+        stmt = conflict_insert(Solve).values(**values).on_conflict_do_nothing()
+        return db.session.execute(stmt).rowcount == 1
+
+    try:
+        # Only the insert is rolled back if the solve already exists
+        with db.session.begin_nested():
+            db.session.execute(insert(Solve).values(**values))
+    except IntegrityError:
+        return False
+    return True
+
+
+def record_solve(user_id, challenge_id, points):
+    """Record a solve and award its points in the current transaction.
+
+    Returns the user's new point total if this is the user's first solve of
+    the challenge, or None if it was already solved. The caller commits.
+    """
+    if solve_cache.contains(user_id, challenge_id) or not _insert_solve(user_id, challenge_id, points):
+        solve_cache.add(user_id, challenge_id)
+        return None
+
+    stmt = update(User).where(User.id == user_id).values(points=func.coalesce(User.points, 0) + points)
+    # SQLAlchemy knows whether the server supports UPDATE ... RETURNING (SQLite 3.35+)
+    if db.session.get_bind().dialect.update_returning:
+        total = db.session.execute(stmt.returning(User.points),
+                                   execution_options={"synchronize_session": False}).scalar()
+    else:
+        # The write lock taken by the UPDATE keeps the total ours until the commit
+        db.session.execute(stmt, execution_options={"synchronize_session": False})
+        total = db.session.query(User.points).filter(User.id == user_id).scalar()
+    # Not cached until a later attempt conflicts, as this transaction can still roll back
+    return total
+
+
+def is_solved(user_id, challenge_id):
+    """Whether the user solved the challenge, from the cache when possible"""
+    if solve_cache.contains(user_id, challenge_id):
+        return True
+    if Solve.query.filter_by(user_id=user_id, challenge_id=challenge_id).first() is None:
+        return False
+    solve_cache.add(user_id, challenge_id)
+    return True
+
+
+def get_solve(user_id, challenge_id):
+    return Solve.query.filter_by(user_id=user_id, challenge_id=challenge_id).first()
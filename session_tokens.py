@@ -0,0 +1,106 @@
+"""Stateless session tokens.
+
+A token is ``v1.<claims>.<signature>``: URL-safe base64 of a JSON claims
+object and of its HMAC-SHA256 signature. The claims carry the user ID,
+username, admin flag, revocation generation and expiry, so a token can be
+verified without a database lookup. All of a user's tokens are revoked by
+bumping the user's generation (see TokenRevocations).
+"""
+import base64
+import hashlib
+import hmac
+import json
+import threading
+import time
+
+TOKEN_PREFIX = "v1."
+CAPABILITY_PREFIX = "cap1."
+
+
+def _b64encode(data):
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+
+def _b64decode(text):
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+def _sign(secret, payload):
+    return hmac.new(secret.encode(), payload.encode(), hashlib.sha256).digest()
+
+
+def is_signed_token(token):
+    return bool(token) and token.startswith(TOKEN_PREFIX)
+
+
+def encode_token(secret, user_id, username, is_admin, lifetime, generation=0):
+    """Create a signed token valid for ``lifetime`` seconds"""
+    now = int(time.time())
+    claims = {
+        "uid": user_id,
+        "usr": username,
+        "adm": bool(is_admin),
+        "gen": generation,
+        "iat": now,
+        "exp": now + int(lifetime)
+    }
+    payload = TOKEN_PREFIX + _b64encode(json.dumps(claims, separators=(",", ":")).encode())
+    return payload + "." + _b64encode(_sign(secret, payload))
+
+
+def decode_token(secret, token, now=None):
+    """Return the claims of a correctly signed, unexpired token, or None"""
+    if not is_signed_token(token):
+        return None
+    payload, _, signature = token.rpartition(".")
+    try:
+        if not hmac.compare_digest(_b64decode(signature), _sign(secret, payload)):
+            return None
+        claims = json.loads(_b64decode(payload[len(TOKEN_PREFIX):]))
+    except (ValueError, TypeError):
+        return None
+
+    if claims.get("exp", 0) < (now if now is not None else time.time()):
+        return None
+    return claims
+
+
+def encode_capability(key, username, challenge_id, expires_at):
+    """Create a capability that lets ``username`` into one challenge container.
+
+    It is signed with the container's own key, so challenge_template.py can
+    check it locally. ``expires_at`` is a Unix timestamp.
+    """
+    claims = {"usr": username, "cid": challenge_id, "exp": int(expires_at)}
+    payload = CAPABILITY_PREFIX + _b64encode(json.dumps(claims, separators=(",", ":")).encode())
+    return payload + "." + _b64encode(_sign(key, payload))
+
+
+class TokenRevocations:
+    """In-memory copy of the per-user token generations.
+
+    ``load_fn()`` returns {user_id: generation} from the database. It is
+    reloaded every ``refresh_interval`` seconds so revocations made by other
+    workers are picked up.
+    """
+
+    def __init__(self, load_fn, refresh_interval=30):
+        self.load_fn = load_fn
+        self.refresh_interval = refresh_interval
+        self.lock = threading.Lock()
+        self.generations = {}
+        self.loaded_at = None
+
+    def generation(self, user_id):
+        with self.lock:
+            if self.loaded_at is None or time.monotonic() - self.loaded_at > self.refresh_interval:
+                self.generations = dict(self.load_fn())
+                self.loaded_at = time.monotonic()
+            return self.generations.get(user_id, 0)
+
+    def set(self, user_id, generation):
+        with self.lock:
+            self.generations[user_id] = generation
+
+    def is_revoked(self, claims):
+        return claims.get("gen", 0) < self.generation(claims.get("uid"))
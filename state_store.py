@@ -0,0 +1,479 @@
+import contextlib
+import fcntl
+import json
+import os
+import socket
+import socketserver
+import sqlite3
+import threading
+from urllib.parse import urlparse
+
+
+class StateStoreError(Exception):
+    pass
+
+
+class StateStore:
+    """Shared key -> JSON document store for state that every worker must see.
+
+    Values are dicts of JSON-serializable values. Backends must be safe to use
+    from several threads and several processes at once.
+    """
+
+    def put(self, key, value):
+        raise NotImplementedError
+
+    def add(self, key, value):
+        """Store ``value`` unless ``key`` already exists, atomically. Returns whether it was stored."""
+        raise NotImplementedError
+
+    def put_many(self, items):
+        """Store every value of ``items`` ({key: value})"""
+        for key, value in items.items():
+            self.put(key, value)
+
+    def pop(self):
+        """Remove and return one (key, value), the oldest where the backend can
+        tell, or None if the store is empty. Two callers never get the same key."""
+        raise NotImplementedError
+
+    def delete(self, key):
+        raise NotImplementedError
+
+    def get(self, key):
+        raise NotImplementedError
+
+    def load_all(self):
+        """Return {key: value} of everything in the store"""
+        raise NotImplementedError
+
+
+class MemoryStateStore(StateStore):
+    """Process-local store, for running a single worker without persistence"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.items = {}
+
+    def put(self, key, value):
+        with self.lock:
+            self.items[key] = json.loads(json.dumps(value))
+
+    def add(self, key, value):
+        with self.lock:
+            if key in self.items:
+                return False
+            self.items[key] = json.loads(json.dumps(value))
+            return True
+
+    def put_many(self, items):
+        with self.lock:
+            self.items.update(json.loads(json.dumps(items)))
+
+    def pop(self):
+        with self.lock:
+            if not self.items:
+                return None
+            key = next(iter(self.items))
+            return key, self.items.pop(key)
+
+    def delete(self, key):
+        with self.lock:
+            self.items.pop(key, None)
+
+    def get(self, key):
+        with self.lock:
+            value = self.items.get(key)
+            return json.loads(json.dumps(value)) if value is not None else None
+
+    def load_all(self):
+        with self.lock:
+            return json.loads(json.dumps(self.items))
+
+
+class SQLiteStateStore(StateStore):
+    """Store backed by a SQLite table, shared by every process on the host"""
+
+    def __init__(self, path, table="container_state"):
+        self.path = path
+        self.table = table
+        self.local = threading.local()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(f"CREATE TABLE IF NOT EXISTS {self.table} (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+
+    def _connect(self):
+        # One connection per thread, as sqlite3 connections can't be shared
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self.local.conn = conn
+        return conn
+
+    def put(self, key, value):
+        with self._connect() as conn:
+            conn.execute(f"INSERT OR REPLACE INTO {self.table} (key, value) VALUES (?, ?)",
+                         (key, json.dumps(value)))
+
+    def add(self, key, value):
+        with self._connect() as conn:
+            cursor = conn.execute(f"INSERT OR IGNORE INTO {self.table} (key, value) VALUES (?, ?)",
+                                  (key, json.dumps(value)))
+            return cursor.rowcount == 1
+
+    def put_many(self, items):
+        with self._connect() as conn:
+            conn.executemany(f"INSERT OR REPLACE INTO {self.table} (key, value) VALUES (?, ?)",
+                             [(key, json.dumps(value)) for key, value in items.items()])
+
+    def pop(self):
+        conn = self._connect()
+        with conn:
+            # Take the write lock up front, so nobody pops the same row in between
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(f"SELECT key, value FROM {self.table} ORDER BY rowid LIMIT 1").fetchone()
+            if row is None:
+                return None
+            conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (row[0],))
+        return row[0], json.loads(row[1])
+
+    def delete(self, key):
+        with self._connect() as conn:
+            conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+
+    def get(self, key):
+        row = self._connect().execute(f"SELECT value FROM {self.table} WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def load_all(self):
+        rows = self._connect().execute(f"SELECT key, value FROM {self.table}").fetchall()
+        return {key: json.loads(value) for key, value in rows}
+
+
+class FileStateStore(StateStore):
+    """Store kept in a single JSON file, guarded by an flock on a lock file.
+
+    Every write rewrites the whole file, so this is meant for small
+    deployments. Writes go to a temporary file that is renamed into place, so
+    readers never see a half-written file.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock_path = path + ".lock"
+        self.thread_lock = threading.Lock()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+
+    @contextlib.contextmanager
+    def _locked(self, exclusive):
+        with self.thread_lock:
+            fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o600)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+                yield
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+                os.close(fd)
+
+    def _read(self):
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except ValueError as e:
+            raise StateStoreError(f"Corrupt state file {self.path}: {e}")
+
+    def _write(self, items):
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(items, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+    def put(self, key, value):
+        with self._locked(exclusive=True):
+            items = self._read()
+            items[key] = value
+            self._write(items)
+
+    def add(self, key, value):
+        with self._locked(exclusive=True):
+            items = self._read()
+            if key in items:
+                return False
+            items[key] = value
+            self._write(items)
+            return True
+
+    def put_many(self, items):
+        with self._locked(exclusive=True):
+            stored = self._read()
+            stored.update(items)
+            self._write(stored)
+
+    def pop(self):
+        with self._locked(exclusive=True):
+            items = self._read()
+            if not items:
+                return None
+            key = next(iter(items))
+            value = items.pop(key)
+            self._write(items)
+            return key, value
+
+    def delete(self, key):
+        with self._locked(exclusive=True):
+            items = self._read()
+            if items.pop(key, None) is not None:
+                self._write(items)
+
+    def get(self, key):
+        with self._locked(exclusive=False):
+            return self._read().get(key)
+
+    def load_all(self):
+        with self._locked(exclusive=False):
+            return self._read()
+
+
+class RESPConnection:
+    """Minimal client for the Redis serialization protocol (RESP2)"""
+
+    def __init__(self, host, port, db=0, password=None, timeout=5):
+        self.sock = socket.create_connection((host, port), timeout=timeout)
+        self.reader = self.sock.makefile("rb")
+        if password:
+            self.command("AUTH", password)
+        if db:
+            self.command("SELECT", db)
+
+    def close(self):
+        try:
+            self.reader.close()
+            self.sock.close()
+        except OSError:
+            pass
+
+    def command(self, *args):
+        parts = [f"*{len(args)}\r\n".encode()]
+        for arg in args:
+            data = arg if isinstance(arg, bytes) else str(arg).encode()
+            parts.append(b"$%d\r\n%s\r\n" % (len(data), data))
+        self.sock.sendall(b"".join(parts))
+        return self.read_reply()
+
+    def read_reply(self):
+        line = self.reader.readline()
+        if not line:
+            raise ConnectionError("Connection closed by server")
+        kind, payload = line[:1], line[1:-2]
+        if kind == b"+":
+            return payload.decode()
+        if kind == b"-":
+            raise StateStoreError(payload.decode())
+        if kind == b":":
+            return int(payload)
+        if kind == b"$":
+            length = int(payload)
+            if length < 0:
+                return None
+            data = self.reader.read(length + 2)
+            return data[:-2]
+        if kind == b"*":
+            count = int(payload)
+            if count < 0:
+                return None
+            return [self.read_reply() for _ in range(count)]
+        raise StateStoreError(f"Unexpected reply from server: {line!r}")
+
+
+class RedisStateStore(StateStore):
+    """Store kept in one hash on a Redis-compatible server, shared across hosts"""
+
+    def __init__(self, host="127.0.0.1", port=6379, db=0, password=None, key="ctf:containers"):
+        self.host = host
+        self.port = port
+        self.db = db
+        self.password = password
+        self.key = key
+        self.lock = threading.Lock()
+        self.conn = None
+
+    def _command(self, *args):
+        with self.lock:
+            # Reconnect once if the server dropped the connection
+            for attempt in range(2):
+                try:
+                    if self.conn is None:
+                        self.conn = RESPConnection(self.host, self.port, self.db, self.password)
+                    return self.conn.command(*args)
+                except (OSError, ConnectionError) as e:
+                    if self.conn is not None:
+                        self.conn.close()
+                        self.conn = None
+                    if attempt:
+                        raise StateStoreError(f"Redis command {args[0]} failed: {e}")
+
+    def put(self, key, value):
+        self._command("HSET", self.key, key, json.dumps(value))
+
+    def add(self, key, value):
+        return self._command("HSETNX", self.key, key, json.dumps(value)) == 1
+
+    def put_many(self, items):
+        if items:
+            args = [arg for key, value in items.items() for arg in (key, json.dumps(value))]
+            self._command("HSET", self.key, *args)
+
+    def pop(self):
+        # A hash has no atomic pop, so pick a field and keep it only if our HDEL removed it
+        while True:
+            reply = self._command("HRANDFIELD", self.key, 1, "WITHVALUES")
+            if not reply:
+                return None
+            if self._command("HDEL", self.key, reply[0]) == 1:
+                return reply[0].decode(), json.loads(reply[1])
+
+    def delete(self, key):
+        self._command("HDEL", self.key, key)
+
+    def get(self, key):
+        value = self._command("HGET", self.key, key)
+        return json.loads(value) if value is not None else None
+
+    def load_all(self):
+        reply = self._command("HGETALL", self.key) or []
+        return {reply[i].decode(): json.loads(reply[i + 1]) for i in range(0, len(reply), 2)}
+
+
+class RESPServer(socketserver.ThreadingTCPServer):
+    """Small in-memory stand-in for a Redis server.
+
+    It supports just the hash commands RedisStateStore uses, so several
+    workers (or hosts) can share state without installing Redis.
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address):
+        self.data = {}
+        self.data_lock = threading.Lock()
+        super().__init__(address, RESPHandler)
+
+    def execute(self, args):
+        name = args[0].decode().upper()
+        with self.data_lock:
+            if name == "PING":
+                return "+PONG"
+            if name in ("SELECT", "AUTH"):
+                return "+OK"
+            if name == "HSET":
+                table = self.data.setdefault(args[1], {})
+                added = 0
+                for i in range(2, len(args) - 1, 2):
+                    added += args[i] not in table
+                    table[args[i]] = args[i + 1]
+                return added
+            if name == "HSETNX":
+                table = self.data.setdefault(args[1], {})
+                if args[2] in table:
+                    return 0
+                table[args[2]] = args[3]
+                return 1
+            if name == "HDEL":
+                table = self.data.get(args[1], {})
+                removed = sum(1 for field in args[2:] if table.pop(field, None) is not None)
+                return removed
+            if name == "HRANDFIELD":
+                table = self.data.get(args[1], {})
+                reply = []
+                with_values = len(args) > 3 and args[3].upper() == b"WITHVALUES"
+                for field, value in list(table.items())[:int(args[2])]:
+                    reply.extend([field, value] if with_values else [field])
+                return reply
+            if name == "HGET":
+                return self.data.get(args[1], {}).get(args[2])
+            if name == "HGETALL":
+                reply = []
+                for field, value in self.data.get(args[1], {}).items():
+                    reply.extend([field, value])
+                return reply
+            if name == "DEL":
+                return sum(1 for key in args[1:] if self.data.pop(key, None) is not None)
+        return StateStoreError(f"unknown command '{name}'")
+
+
+class RESPHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            if not line.startswith(b"*"):
+                self.wfile.write(b"-ERR expected an array\r\n")
+                return
+            args = []
+            for _ in range(int(line[1:-2])):
+                length = int(self.rfile.readline()[1:-2])
+                args.append(self.rfile.read(length + 2)[:-2])
+            self.wfile.write(self.encode(self.server.execute(args)))
+
+    def encode(self, value):
+        if isinstance(value, StateStoreError):
+            return f"-ERR {value}\r\n".encode()
+        if isinstance(value, str):
+            return f"{value}\r\n".encode()
+        if isinstance(value, int):
+            return f":{value}\r\n".encode()
+        if value is None:
+            return b"$-1\r\n"
+        if isinstance(value, list):
+            return b"*%d\r\n" % len(value) + b"".join(self.encode(item) for item in value)
+        return b"$%d\r\n%s\r\n" % (len(value), value)
+
+
+def create_state_store(default_path, namespace="container"):
+    """Create the store selected by CTF_STATE_BACKEND (sqlite, file, redis or memory).
+
+    Stores of different namespaces share the backend but not their keys.
+    """
+    backend = os.environ.get("CTF_STATE_BACKEND", "sqlite")
+    if backend == "sqlite":
+        return SQLiteStateStore(os.environ.get("CTF_STATE_PATH", default_path + ".db"), table=f"{namespace}_state")
+    if backend == "file":
+        path = os.environ.get("CTF_STATE_PATH", default_path + ".json")
+        if namespace != "container":
+            root, ext = os.path.splitext(path)
+            path = f"{root}.{namespace}{ext}"
+        return FileStateStore(path)
+    if backend == "redis":
+        url = urlparse(os.environ.get("CTF_STATE_REDIS_URL", "redis://127.0.0.1:6379/0"))
+        return RedisStateStore(
+            host=url.hostname or "127.0.0.1",
+            port=url.port or 6379,
+            db=int(url.path.lstrip("/") or 0),
+            password=url.password,
+            key=f"ctf:{namespace}s"
+        )
+    if backend == "memory":
+        return MemoryStateStore()
+    raise ValueError(f"Unknown state backend: {backend}")
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Local Redis-compatible server for the CTF state store")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6379)
+    args = parser.parse_args()
+
+    server = RESPServer((args.host, args.port))
+    print(f"State server listening on {args.host}:{args.port}")
+    server.serve_forever()
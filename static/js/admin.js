@@ -36,6 +36,21 @@ document.addEventListener('DOMContentLoaded', function() {
     const refreshSubmissions = document.getElementById('refresh-submissions');
     const refreshStats = document.getElementById('refresh-stats');
 
+    // Pagination: the lists are loaded a page at a time, following the server's cursor
+    const moreUsers = document.getElementById('more-users');
+    const moreSubmissions = document.getElementById('more-submissions');
+    let usersCursor = null;
+    let submissionsCursor = null;
+
+    // Export buttons
+    const exportScoreboard = document.getElementById('export-scoreboard');
+    const exportSubmissions = document.getElementById('export-submissions');
+
+    // Server-side submission filters
+    const submissionUserFilter = document.getElementById('submission-user-filter');
+    const submissionChallengeFilter = document.getElementById('submission-challenge-filter');
+    const submissionCorrectFilter = document.getElementById('submission-correct-filter');
+
     // Add challenge button and modal
     const addChallengeBtn = document.getElementById('add-challenge');
     const addChallengeModal = document.getElementById('add-challenge-modal');
@@ -136,6 +151,42 @@ document.addEventListener('DOMContentLoaded', function() {
         });
     }
 
+    // Load more buttons
+    if (moreUsers) {
+        moreUsers.addEventListener('click', function() {
+            loadUsers(true);
+        });
+    }
+
+    if (moreSubmissions) {
+        moreSubmissions.addEventListener('click', function() {
+            loadSubmissions(true);
+        });
+    }
+
+    if (exportScoreboard) {
+        exportScoreboard.addEventListener('click', function() {
+            downloadExport('/admin/export/scoreboard?format=csv', 'scoreboard.csv');
+        });
+    }
+
+    if (exportSubmissions) {
+        exportSubmissions.addEventListener('click', function() {
+            const params = submissionFilterParams();
+            params.set('format', 'csv');
+            downloadExport(`/admin/export/submissions?${params}`, 'submissions.csv');
+        });
+    }
+
+    // Reload submissions from the first page when a filter changes
+    [submissionUserFilter, submissionChallengeFilter, submissionCorrectFilter].forEach(filter => {
+        if (filter) {
+            filter.addEventListener('change', function() {
+                loadSubmissions();
+            });
+        }
+    });
+
     // Add challenge modal
     if (addChallengeBtn) {
         addChallengeBtn.addEventListener('click', function() {
@@ -303,9 +354,18 @@ document.addEventListener('DOMContentLoaded', function() {
         loadStats();
     }
 
-    async function loadUsers() {
+    // Set a load more button's cursor and show it only if there is another page
+    function updateLoadMore(button, cursor) {
+        if (button) button.classList.toggle('hidden', !cursor);
+        return cursor;
+    }
+
+    async function loadUsers(append = false) {
         try {
-            const response = await fetch('/admin/users', {
+            const params = new URLSearchParams();
+            if (append && usersCursor) params.set('cursor', usersCursor);
+
+            const response = await fetch(`/admin/users?${params}`, {
                 headers: {
                     'Authorization': adminData.token
                 }
@@ -313,8 +373,9 @@ document.addEventListener('DOMContentLoaded', function() {
 
             if (response.ok) {
                 const users = await response.json();
-                renderUsersTable(users);
-                updateStats('users', users.length);
+                renderUsersTable(users, append);
+                usersCursor = updateLoadMore(moreUsers, response.headers.get('X-Next-Cursor'));
+                updateStats('users', response.headers.get('X-Total-Count') || users.length);
             } else {
                 const data = await response.json();
                 showError('Failed to load users: ' + (data.error || 'Unknown error'));
@@ -349,9 +410,32 @@ document.addEventListener('DOMContentLoaded', function() {
         }
     }
 
-    async function loadSubmissions() {
+    // Query parameters for the submission filters that are set
+    function submissionFilterParams() {
+        const params = new URLSearchParams();
+        if (submissionUserFilter && submissionUserFilter.value) params.set('user', submissionUserFilter.value);
+        if (submissionChallengeFilter && submissionChallengeFilter.value) params.set('challenge', submissionChallengeFilter.value);
+        if (submissionCorrectFilter && submissionCorrectFilter.value) params.set('correct', submissionCorrectFilter.value);
+        return params;
+    }
+
+    // Exports are downloaded through a plain link, authenticated by the ctf_admin_token
+    // cookie, so the browser streams them to disk instead of holding them in memory
+    function downloadExport(url, filename) {
+        const link = document.createElement('a');
+        link.href = url;
+        link.download = filename;
+        document.body.appendChild(link);
+        link.click();
+        link.remove();
+    }
+
+    async function loadSubmissions(append = false) {
         try {
-            const response = await fetch('/admin/submissions', {
+            const params = submissionFilterParams();
+            if (append && submissionsCursor) params.set('cursor', submissionsCursor);
+
+            const response = await fetch(`/admin/submissions?${params}`, {
                 headers: {
                     'Authorization': adminData.token
                 }
@@ -359,9 +443,12 @@ document.addEventListener('DOMContentLoaded', function() {
 
             if (response.ok) {
                 const submissions = await response.json();
-                renderSubmissionsTable(submissions);
-                updateStats('submissions', submissions.length);
-                updateStats('solves', submissions.filter(s => s.is_correct).length);
+                renderSubmissionsTable(submissions, append);
+                submissionsCursor = updateLoadMore(moreSubmissions, response.headers.get('X-Next-Cursor'));
+                if (!append) {
+                    updateStats('submissions', submissions.length);
+                    updateStats('solves', submissions.filter(s => s.is_correct).length);
+                }
             } else {
                 const data = await response.json();
                 showError('Failed to load submissions: ' + (data.error || 'Unknown error'));
@@ -446,11 +533,11 @@ document.addEventListener('DOMContentLoaded', function() {
         });
     }
 
-    function renderUsersTable(users) {
+    function renderUsersTable(users, append = false) {
         if (!usersTable) return;
 
         const tbody = usersTable.querySelector('tbody');
-        tbody.innerHTML = '';
+        if (!append) tbody.innerHTML = '';
 
         users.forEach(user => {
             const row = document.createElement('tr');
@@ -522,11 +609,11 @@ document.addEventListener('DOMContentLoaded', function() {
         });
     }
 
-    function renderSubmissionsTable(submissions) {
+    function renderSubmissionsTable(submissions, append = false) {
         if (!submissionsTable) return;
 
         const tbody = submissionsTable.querySelector('tbody');
-        tbody.innerHTML = '';
+        if (!append) tbody.innerHTML = '';
 
         submissions.forEach(submission => {
             const row = document.createElement('tr');
@@ -217,6 +217,86 @@ document.addEventListener('DOMContentLoaded', function () {
 
         // Save to localStorage
         localStorage.setItem('ctf_user', JSON.stringify(userData));
+
+        // Receive live updates instead of polling
+        connectEvents();
+    }
+
+    // Live updates pushed by the server over server-sent events (see /events)
+    let eventSource = null;
+    let eventsRetryTimer = null;
+    let leaderboardRows = [];
+
+    function connectEvents() {
+        if (eventSource || !window.EventSource) return;
+        eventsRetryTimer = null;
+
+        // Authenticated by the ctf_token cookie set at login
+        eventSource = new EventSource('/events');
+
+        eventSource.addEventListener('leaderboard', function (e) {
+            const update = JSON.parse(e.data);
+            const rows = update.reset ? [] : leaderboardRows.slice();
+            update.rows.forEach(row => {
+                rows[row.rank - 1] = row;
+            });
+            leaderboardRows = rows.slice(0, update.size);
+            renderLeaderboardRows();
+        });
+
+        eventSource.addEventListener('profile', function (e) {
+            const profile = JSON.parse(e.data);
+            userData.points = profile.points;
+            localStorage.setItem('ctf_user', JSON.stringify(userData));
+
+            const pointsDisplay = document.getElementById('user-points');
+            if (pointsDisplay) {
+                pointsDisplay.textContent = profile.points;
+            }
+            const rankDisplay = document.getElementById('user-rank');
+            if (rankDisplay) {
+                rankDisplay.textContent = profile.rank ? `#${profile.rank}` : 'N/A';
+            }
+        });
+
+        eventSource.addEventListener('container', function (e) {
+            const status = JSON.parse(e.data);
+            const listener = window.containerStatusListener;
+            if (listener && listener.containerId === status.container_id) {
+                listener.update(status);
+            }
+        });
+
+        eventSource.addEventListener('expiring', function (e) {
+            const warning = JSON.parse(e.data);
+            showInfoMessage(`Your ${warning.challenge} container expires in ${Math.round(warning.remaining)} seconds`);
+        });
+
+        eventSource.onerror = function () {
+            // The browser reconnects by itself unless the server refused the stream,
+            // e.g. because the session expired or the server serves too many streams.
+            // Status checks then fall back to polling until the stream is tried again.
+            if (eventSource && eventSource.readyState === EventSource.CLOSED) {
+                console.log('Live updates unavailable, falling back to polling');
+                eventSource = null;
+                eventsRetryTimer = setTimeout(connectEvents, 60000);
+            }
+        };
+    }
+
+    function disconnectEvents() {
+        if (eventsRetryTimer) {
+            clearTimeout(eventsRetryTimer);
+            eventsRetryTimer = null;
+        }
+        if (eventSource) {
+            eventSource.close();
+            eventSource = null;
+        }
+    }
+
+    function eventsConnected() {
+        return eventSource !== null && eventSource.readyState !== EventSource.CLOSED;
     }
 
     // Function to show success message with confetti effect
@@ -719,9 +799,11 @@ document.addEventListener('DOMContentLoaded', function () {
         playSuccessSound();
         showCelebration();
 
-        // Update user profile and leaderboard
-        loadUserProfile();
-        loadLeaderboard();
+        // Update user profile and leaderboard, unless they are pushed to us
+        if (!eventsConnected()) {
+            loadUserProfile();
+            loadLeaderboard();
+        }
     }
 
     // Function to load leaderboard just to get user rank
@@ -749,6 +831,28 @@ document.addEventListener('DOMContentLoaded', function () {
         }
     }
 
+    function leaderboardRowsHtml(rows) {
+        if (rows.length === 0) {
+            return '<tr><td colspan="4">No users found</td></tr>';
+        }
+        return rows.map(user => `
+            <tr class="${user.username === userData.username ? 'current-user' : ''}">
+                <td>${user.rank}</td>
+                <td>${user.username}</td>
+                <td>${user.points}</td>
+                <td>${user.solved_challenges}</td>
+            </tr>
+        `).join('');
+    }
+
+    // Update the leaderboard table, if it is showing, from leaderboardRows
+    function renderLeaderboardRows() {
+        const tableBody = document.getElementById('leaderboard-rows');
+        if (tableBody) {
+            tableBody.innerHTML = leaderboardRowsHtml(leaderboardRows);
+        }
+    }
+
     // Function to load leaderboard
     async function loadLeaderboard() {
         try {
@@ -791,9 +895,9 @@ document.addEventListener('DOMContentLoaded', function () {
                 }
             }
 
-            // Fetch leaderboard data
+            // Fetch leaderboard data; later changes are pushed to leaderboardRows
             const response = await fetch('/leaderboard');
-            const leaderboardData = await response.json();
+            leaderboardRows = await response.json();
 
             // Update the leaderboard section with the data
             if (leaderboardSection) {
@@ -819,18 +923,8 @@ document.addEventListener('DOMContentLoaded', function () {
                                         <th>Challenges Solved</th>
                                     </tr>
                                 </thead>
-                                <tbody>
-                                    ${leaderboardData.length > 0 ?
-                        leaderboardData.map(user => `
-                                            <tr class="${user.username === userData.username ? 'current-user' : ''}">
-                                                <td>${user.rank}</td>
-                                                <td>${user.username}</td>
-                                                <td>${user.points}</td>
-                                                <td>${user.solved_challenges}</td>
-                                            </tr>
-                                        `).join('') :
-                        '<tr><td colspan="4">No users found</td></tr>'
-                    }
+                                <tbody id="leaderboard-rows">
+                                    ${leaderboardRowsHtml(leaderboardRows)}
                                 </tbody>
                             </table>
                         </div>
@@ -905,6 +999,7 @@ document.addEventListener('DOMContentLoaded', function () {
         if (authSection) authSection.classList.remove('hidden');
         if (challengeSection) challengeSection.classList.add('hidden');
         if (welcomeMessage) welcomeMessage.textContent = '';
+        disconnectEvents();
 
         // Clear localStorage
         localStorage.removeItem('ctf_user');
@@ -1097,17 +1192,7 @@ document.addEventListener('DOMContentLoaded', function () {
                         </div>
                     </div>
                 `;
-
-                // Simulate progress for better UX
-                setTimeout(() => {
-                    document.getElementById('step-building').classList.add('completed');
-                }, 800);
-                setTimeout(() => {
-                    document.getElementById('step-starting').classList.add('completed');
-                }, 1600);
-                setTimeout(() => {
-                    document.getElementById('step-configuring').classList.add('completed');
-                }, 2400);
+                // Progress of the steps is reported by the provisioning job
             }
 
             const response = await fetch(`/challenge/${challengeId}/start`, {
@@ -1121,10 +1206,15 @@ document.addEventListener('DOMContentLoaded', function () {
                 })
             });
 
-            const data = await response.json();
+            let data = await response.json();
             console.log('Challenge start response:', data);
 
-            if (response.ok) {
+            // The container is built in the background, wait for the job to finish
+            if (response.status === 202 && data.job_id) {
+                data = await waitForProvisioningJob(data.job_id);
+            }
+
+            if (response.ok && data.status !== 'failed') {
                 // Get challenge details for better UI
                 let challengeName = challengeId;
                 let challengeDescription = '';
@@ -1170,6 +1260,40 @@ document.addEventListener('DOMContentLoaded', function () {
         }
     }
 
+    // Poll a provisioning job until its container is ready or it failed
+    async function waitForProvisioningJob(jobId) {
+        const steps = {
+            building: 'step-building',
+            starting: 'step-starting',
+            ready: 'step-configuring'
+        };
+
+        while (true) {
+            const response = await fetch(`/jobs/${jobId}`, {
+                headers: {
+                    'Authorization': userData.token
+                }
+            });
+            const job = await response.json();
+
+            if (!response.ok) {
+                return { status: 'failed', error: job.error || 'Provisioning job not found' };
+            }
+
+            // Mark the steps that are done
+            const order = ['building', 'starting', 'ready'];
+            order.slice(0, order.indexOf(job.status)).forEach(status => {
+                const step = document.getElementById(steps[status]);
+                if (step) step.classList.add('completed');
+            });
+
+            if (job.status === 'ready' || job.status === 'failed') {
+                return job;
+            }
+            await new Promise(resolve => setTimeout(resolve, 500));
+        }
+    }
+
     // Function to show error message
     function showErrorMessage(message) {
         const errorMessage = document.createElement('div');
@@ -1277,6 +1401,13 @@ document.addEventListener('DOMContentLoaded', function () {
                     </div>
 
                     <div class="challenge-controls">
+                        <button id="extend-challenge" class="btn-extend" data-container="${data.containerId}">
+                            <svg xmlns="http://www.w3.org/2000/svg" width="16" height="16" viewBox="0 0 24 24" fill="none" stroke="currentColor" stroke-width="2" stroke-linecap="round" stroke-linejoin="round">
+                                <circle cx="12" cy="12" r="10"></circle>
+                                <polyline points="12 6 12 12 16 14"></polyline>
+                            </svg>
+                            Extend Time
+                        </button>
                         <button id="stop-challenge" class="btn-danger" data-container="${data.containerId}">
                             <svg xmlns="http://www.w3.org/2000/svg" width="16" height="16" viewBox="0 0 24 24" fill="none" stroke="currentColor" stroke-width="2" stroke-linecap="round" stroke-linejoin="round">
                                 <rect x="3" y="3" width="18" height="18" rx="2" ry="2"></rect>
@@ -1324,6 +1455,7 @@ document.addEventListener('DOMContentLoaded', function () {
                     // Stop any running timers
                     if (window.statusCheckInterval) clearInterval(window.statusCheckInterval);
                     if (window.localTimerInterval) clearInterval(window.localTimerInterval);
+                    window.containerStatusListener = null;
                 });
             }
 
@@ -1334,6 +1466,7 @@ document.addEventListener('DOMContentLoaded', function () {
                     // Stop any running timers
                     if (window.statusCheckInterval) clearInterval(window.statusCheckInterval);
                     if (window.localTimerInterval) clearInterval(window.localTimerInterval);
+                    window.containerStatusListener = null;
                 }
             });
 
@@ -1415,9 +1548,11 @@ document.addEventListener('DOMContentLoaded', function () {
                                         stopChallenge(data.containerId, true);
                                     }, 3000);
 
-                                    // Update the leaderboard and user profile
-                                    loadLeaderboard();
-                                    loadUserProfile();
+                                    // Update the leaderboard and user profile, unless they are pushed to us
+                                    if (!eventsConnected()) {
+                                        loadLeaderboard();
+                                        loadUserProfile();
+                                    }
                                 } else {
                                     // Already solved
                                     showInfoMessage(result.message);
@@ -1499,6 +1634,7 @@ document.addEventListener('DOMContentLoaded', function () {
                     // Stop any running timers
                     if (window.statusCheckInterval) clearInterval(window.statusCheckInterval);
                     if (window.localTimerInterval) clearInterval(window.localTimerInterval);
+                    window.containerStatusListener = null;
                 });
             }
         }
@@ -1509,6 +1645,7 @@ document.addEventListener('DOMContentLoaded', function () {
         let statusCheckInterval = null;
         let localTimerInterval = null;
         let lastRemainingSeconds = timeout;
+        let totalSeconds = timeout;
 
         // Find the container ID from the stop button
         const stopBtn = document.getElementById('stop-challenge');
@@ -1524,7 +1661,7 @@ document.addEventListener('DOMContentLoaded', function () {
             countdownEl.textContent = `${minutes}:${seconds.toString().padStart(2, '0')}`;
 
             // Update progress bar
-            const percentRemaining = (remainingSeconds / timeout) * 100;
+            const percentRemaining = Math.min(100, (remainingSeconds / totalSeconds) * 100);
             progressBar.style.width = `${percentRemaining}%`;
 
             // Change color as time runs out
@@ -1560,6 +1697,44 @@ document.addEventListener('DOMContentLoaded', function () {
             lastRemainingSeconds = remainingSeconds;
         };
 
+        // Update the countdown from a status of the container, as sent by
+        // /challenge/<id>/status or pushed as a container event
+        const applyStatus = (data) => {
+            // Update UI with server-provided remaining time
+            if (data.timeout) totalSeconds = data.timeout;
+            updateUI(Math.max(0, data.remaining));
+            updateExtendButton(data.extensions, data.max_extensions);
+
+            // If container is no longer running, stop checking
+            if (data.status === 'stopped' || data.status === 'expired' || data.status === 'not_found') {
+                console.log(`Container ${containerId} is ${data.status}, stopping status checks`);
+                clearInterval(statusCheckInterval);
+                clearInterval(localTimerInterval);
+                window.containerStatusListener = null;
+
+                // If the container was stopped but the UI is still showing, update it
+                countdownEl.textContent = data.status === 'expired' ? 'Expired' : 'Stopped';
+                progressBar.style.width = '0%';
+
+                // Show the expired/stopped message
+                const timeoutInfo = document.getElementById('timeout-info');
+                const challengeContent = document.getElementById('challenge-content');
+                const challengeExpired = document.getElementById('challenge-expired');
+
+                if (timeoutInfo) {
+                    timeoutInfo.classList.add('expired');
+                }
+
+                if (challengeContent && challengeExpired) {
+                    // Add fading effect to the challenge content
+                    challengeContent.classList.add('fading');
+
+                    // Show the expired message immediately
+                    challengeExpired.style.display = 'block';
+                }
+            }
+        };
+
         // Function to check container status from the server
         const checkContainerStatus = async () => {
             if (!containerId) return;
@@ -1568,72 +1743,54 @@ document.addEventListener('DOMContentLoaded', function () {
                 const response = await fetch(`/challenge/${containerId}/status`);
 
                 if (response.ok) {
-                    const data = await response.json();
-
-                    // Update UI with server-provided remaining time
-                    updateUI(Math.max(0, data.remaining));
-
-                    // If container is no longer running, stop checking
-                    if (data.status === 'stopped' || data.status === 'expired' || data.status === 'not_found') {
-                        console.log(`Container ${containerId} is ${data.status}, stopping status checks`);
-                        clearInterval(statusCheckInterval);
-                        clearInterval(localTimerInterval);
-
-                        // If the container was stopped but the UI is still showing, update it
-                        if (data.status === 'stopped' || data.status === 'not_found' || data.status === 'expired') {
-                            countdownEl.textContent = data.status === 'expired' ? 'Expired' : 'Stopped';
-                            progressBar.style.width = '0%';
-
-                            // Show the expired/stopped message
-                            const timeoutInfo = document.getElementById('timeout-info');
-                            const challengeContent = document.getElementById('challenge-content');
-                            const challengeExpired = document.getElementById('challenge-expired');
-
-                            if (timeoutInfo) {
-                                timeoutInfo.classList.add('expired');
-                            }
-
-                            if (challengeContent && challengeExpired) {
-                                // Add fading effect to the challenge content
-                                challengeContent.classList.add('fading');
-
-                                // Show the expired message immediately
-                                challengeExpired.style.display = 'block';
-                            }
-                        }
-                    }
-                } else {
+                    applyStatus(await response.json());
+                } else if (response.status === 404) {
                     // If we get a 404, the container is gone
-                    if (response.status === 404) {
-                        console.log(`Container ${containerId} not found, stopping status checks`);
-                        clearInterval(statusCheckInterval);
-                        clearInterval(localTimerInterval);
-                        countdownEl.textContent = 'Stopped';
-                        progressBar.style.width = '0%';
-
-                        // Show the expired/stopped message
-                        const timeoutInfo = document.getElementById('timeout-info');
-                        const challengeContent = document.getElementById('challenge-content');
-                        const challengeExpired = document.getElementById('challenge-expired');
-
-                        if (timeoutInfo) {
-                            timeoutInfo.classList.add('expired');
-                        }
-
-                        if (challengeContent && challengeExpired) {
-                            // Add fading effect to the challenge content
-                            challengeContent.classList.add('fading');
-
-                            // Show the expired message immediately
-                            challengeExpired.style.display = 'block';
-                        }
-                    }
+                    applyStatus({ status: 'not_found', remaining: 0 });
                 }
             } catch (error) {
                 console.error('Error checking container status:', error);
             }
         };
 
+        // Extending the challenge moves its expiry time on the server
+        const extendBtn = document.getElementById('extend-challenge');
+        const updateExtendButton = (extensions, maxExtensions) => {
+            if (extendBtn && maxExtensions !== undefined && extensions >= maxExtensions) {
+                extendBtn.disabled = true;
+                extendBtn.title = 'No more extensions available';
+            }
+        };
+
+        if (extendBtn && containerId) {
+            extendBtn.addEventListener('click', async function () {
+                extendBtn.disabled = true;
+                try {
+                    const response = await fetch(`/challenge/${containerId}/extend`, {
+                        method: 'POST',
+                        headers: {
+                            'Authorization': userData.token
+                        }
+                    });
+                    const data = await response.json();
+
+                    if (response.ok) {
+                        totalSeconds = data.timeout;
+                        updateUI(Math.max(0, data.remaining));
+                        extendBtn.disabled = false;
+                        updateExtendButton(data.extensions, data.max_extensions);
+                    } else {
+                        alert('Could not extend the challenge: ' + (data.error || 'Unknown error'));
+                        extendBtn.disabled = false;
+                        updateExtendButton(data.extensions, data.max_extensions);
+                    }
+                } catch (error) {
+                    console.error('Error extending challenge:', error);
+                    extendBtn.disabled = false;
+                }
+            });
+        }
+
         // Function for local time updates between server checks
         const updateLocalTimer = () => {
             // Only update locally if we have a valid last remaining time
@@ -1644,8 +1801,12 @@ document.addEventListener('DOMContentLoaded', function () {
         };
 
         // Start both timers
-        // 1. Check with server every 5 seconds
-        statusCheckInterval = setInterval(checkContainerStatus, 5000);
+        // 1. Follow status changes pushed by the server, or check with the
+        //    server every 5 seconds while live updates are unavailable
+        window.containerStatusListener = containerId ? { containerId: containerId, update: applyStatus } : null;
+        statusCheckInterval = setInterval(() => {
+            if (!eventsConnected()) checkContainerStatus();
+        }, 5000);
         window.statusCheckInterval = statusCheckInterval;
 
         // 2. Update locally every second for smoother countdown
@@ -1661,6 +1822,7 @@ document.addEventListener('DOMContentLoaded', function () {
             clearInterval(localTimerInterval);
             window.statusCheckInterval = null;
             window.localTimerInterval = null;
+            window.containerStatusListener = null;
         };
     }
 
@@ -1787,6 +1949,7 @@ document.addEventListener('DOMContentLoaded', function () {
                 // Stop any running timers
                 if (window.statusCheckInterval) clearInterval(window.statusCheckInterval);
                 if (window.localTimerInterval) clearInterval(window.localTimerInterval);
+                window.containerStatusListener = null;
             } else {
                 // Remove stopping overlay
                 const overlay = document.querySelector('.stopping-overlay');
@@ -0,0 +1,13 @@
+import os
+import sys
+import tempfile
+
+# The platform is a set of top-level modules, not a package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Tests that import app run it against a scratch database and the fake
+# container runtime, and set the database up themselves
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'test.db')
+os.environ.setdefault('CTF_CONTAINER_RUNTIME', 'fake')
+os.environ.setdefault('CTF_STATE_BACKEND', 'memory')
+os.environ['CTF_SETUP_DONE'] = '1'
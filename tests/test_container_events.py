@@ -0,0 +1,111 @@
+import threading
+import time
+
+import pytest
+
+from container_events import ContainerEventMonitor
+from container_runtime import FakeRuntime
+
+LABELS = {"ctf.managed": "true"}
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("Timed out waiting for the event monitor")
+        time.sleep(0.01)
+
+
+def raw_event(action, container_id, labels=LABELS):
+    return {
+        "Type": "container",
+        "Action": action,
+        "id": container_id,
+        "Actor": {"ID": container_id, "Attributes": dict(labels, name=f"fake_{container_id[:12]}")},
+        "time": int(time.time()),
+    }
+
+
+class Recorder:
+    """Keeps the running state of containers the way app.py does, from a
+    listing on resync and from events in between"""
+
+    def __init__(self, runtime):
+        self.runtime = runtime
+        self.lock = threading.Lock()
+        self.running = {}
+        self.events = []
+        self.resyncs = 0
+
+    def on_event(self, event):
+        with self.lock:
+            self.events.append((event["action"], event["id"]))
+            if event["action"] == "start":
+                self.running[event["id"]] = True
+            elif event["action"] in ("die", "stop", "kill", "oom"):
+                self.running[event["id"]] = False
+            elif event["action"] == "destroy":
+                self.running.pop(event["id"], None)
+
+    def resync(self):
+        containers = self.runtime.list_containers(all=True, labels=LABELS)
+        with self.lock:
+            self.running = {c["id"]: c["running"] for c in containers}
+            self.resyncs += 1
+
+
+@pytest.fixture
+def monitored():
+    runtime = FakeRuntime()
+    runtime.images["img"] = {"id": "sha256:img", "labels": {}}
+    recorder = Recorder(runtime)
+    monitor = ContainerEventMonitor(runtime, recorder.on_event, recorder.resync, labels=LABELS,
+                                    reconnect_delay=0.2, max_reconnect_delay=0.2)
+    monitor.start()
+    wait_for(lambda: monitor.connected)
+    return runtime, recorder, monitor
+
+
+def test_replayed_events_update_state(monitored):
+    runtime, recorder, monitor = monitored
+    container_id = runtime.run_container("img", labels=LABELS)
+    wait_for(lambda: recorder.running.get(container_id) is True)
+
+    runtime.replay_events([raw_event("die", container_id)])
+    wait_for(lambda: recorder.running.get(container_id) is False)
+    assert runtime.containers[container_id]["running"] is False
+
+    runtime.replay_events([raw_event("destroy", container_id)])
+    wait_for(lambda: container_id not in recorder.running)
+    assert container_id not in runtime.containers
+
+
+def test_events_of_other_containers_are_filtered(monitored):
+    runtime, recorder, monitor = monitored
+    runtime.replay_events([raw_event("start", "unmanaged", labels={})])
+    container_id = runtime.run_container("img", labels=LABELS)
+    wait_for(lambda: container_id in recorder.running)
+    assert ("start", "unmanaged") not in recorder.events
+
+
+def test_resync_after_disconnect(monitored):
+    runtime, recorder, monitor = monitored
+    stopped = runtime.run_container("img", labels=LABELS)
+    wait_for(lambda: recorder.running.get(stopped) is True)
+
+    runtime.disconnect_events()
+    wait_for(lambda: not monitor.connected)
+
+    # Changes while the stream is down reach nobody as events
+    runtime.containers[stopped]["running"] = False
+    started = runtime.run_container("img", labels=LABELS)
+    assert ("start", started) not in recorder.events
+
+    # The reconnect lists the containers again and picks them up
+    wait_for(lambda: monitor.connected and recorder.resyncs == 2)
+    assert recorder.running == {stopped: False, started: True}
+
+    # And events flow again on the new stream
+    runtime.replay_events([raw_event("die", started)])
+    wait_for(lambda: recorder.running.get(started) is False)
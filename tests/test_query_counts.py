@@ -0,0 +1,90 @@
+"""The admin, profile and leaderboard views run a constant number of queries,
+however many users, challenges and submissions there are."""
+import threading
+
+import pytest
+from sqlalchemy import event
+
+from app import app, issue_token, leaderboard_cache
+from migrations import run_migrations
+from models import db, User, Challenge, Submission, Solve
+
+EXPECTED_QUERIES = {
+    '/admin/submissions': 1,
+    '/admin/challenges': 2,
+    '/admin/users': 3,
+    '/user/profile': 5,
+    '/leaderboard': 2,
+}
+
+
+def seed(start, users, challenges, admin):
+    """Add users, challenges and submissions, with every user and the admin solving every challenge"""
+    new_challenges = [Challenge(name=f"Challenge {start + i}", description="Query count check", category="misc",
+                                difficulty="easy", points=100, challenge_id=f"count-{start + i}")
+                      for i in range(challenges)]
+    new_users = [User(username=f"count-{start + i}", password_hash="x") for i in range(users)]
+    db.session.add_all(new_challenges + new_users)
+    db.session.flush()
+    for user in new_users + [admin]:
+        for challenge in new_challenges:
+            db.session.add(Submission(user_id=user.id, challenge_id=challenge.id, flag="wrong",
+                                      is_correct=False, points_awarded=0))
+            db.session.add(Submission(user_id=user.id, challenge_id=challenge.id, flag="right",
+                                      is_correct=True, points_awarded=challenge.points))
+            db.session.add(Solve(user_id=user.id, challenge_id=challenge.id, points_awarded=challenge.points))
+        user.points = (user.points or 0) + challenges * 100
+    db.session.commit()
+
+
+def count_queries(client, token):
+    """Return {view: statements run by the view}, each with a fresh leaderboard sync, the worst case"""
+    counts = {}
+    statements = [0]
+    # Background threads share the engine, only the statements of the request count
+    thread = threading.get_ident()
+
+    def count_statement(conn, cursor, statement, parameters, context, executemany):
+        if threading.get_ident() == thread:
+            statements[0] += 1
+
+    engine = db.engine
+    event.listen(engine, 'before_cursor_execute', count_statement)
+    try:
+        for view in EXPECTED_QUERIES:
+            leaderboard_cache.invalidate()
+            statements[0] = 0
+            response = client.get(view, headers={'Authorization': token})
+            assert response.status_code == 200, f"{view}: {response.status_code}"
+            counts[view] = statements[0]
+    finally:
+        event.remove(engine, 'before_cursor_execute', count_statement)
+    return counts
+
+
+@pytest.fixture(scope="module")
+def counts():
+    """Query counts of every view with little data and with ten times as much"""
+    with app.app_context():
+        db.create_all()
+        run_migrations(db.engine)
+        admin = User(username="count-admin", password_hash="x", is_admin=True)
+        db.session.add(admin)
+        db.session.commit()
+        token = issue_token(admin)
+
+        client = app.test_client()
+        # The first request starts the background services
+        client.get('/leaderboard')
+        seed(0, users=5, challenges=3, admin=admin)
+        small = count_queries(client, token)
+        seed(100, users=50, challenges=30, admin=admin)
+        large = count_queries(client, token)
+    return small, large
+
+
+@pytest.mark.parametrize("view", EXPECTED_QUERIES)
+def test_query_count(counts, view):
+    small, large = counts
+    assert small[view] == EXPECTED_QUERIES[view]
+    assert large[view] == EXPECTED_QUERIES[view]
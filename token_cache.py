@@ -0,0 +1,80 @@
+import collections
+import threading
+import time
+
+# Returned by TokenCache.get when a token isn't cached at all
+MISSING = object()
+
+
+class TokenCache:
+    """Bounded LRU cache of token -> identity with a TTL per entry.
+
+    Unknown tokens are cached as None for ``negative_ttl`` seconds so
+    repeated requests with a bad token don't each hit the database. Entries
+    are also indexed by user ID so all tokens of a user can be dropped when
+    the user changes.
+    """
+
+    def __init__(self, max_size=10000, ttl=60, negative_ttl=5):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.lock = threading.Lock()
+        self.entries = collections.OrderedDict()  # token -> (expires, identity)
+        self.by_user = collections.defaultdict(set)
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, token):
+        """Return the cached identity (None for a known-bad token), or MISSING"""
+        with self.lock:
+            entry = self.entries.get(token)
+            if entry is None:
+                self.misses += 1
+                return MISSING
+            expires, identity = entry
+            if expires < time.monotonic():
+                self._remove(token)
+                self.misses += 1
+                return MISSING
+            self.entries.move_to_end(token)
+            self.hits += 1
+            return identity
+
+    def put(self, token, identity, ttl=None):
+        """Cache an identity dict (with at least ``user_id``), or None for an unknown token"""
+        if ttl is None:
+            ttl = self.ttl if identity is not None else self.negative_ttl
+        with self.lock:
+            self._remove(token)
+            self.entries[token] = (time.monotonic() + ttl, identity)
+            if identity is not None:
+                self.by_user[identity["user_id"]].add(token)
+            while len(self.entries) > self.max_size:
+                self._remove(next(iter(self.entries)))
+
+    def invalidate(self, token):
+        with self.lock:
+            self._remove(token)
+
+    def invalidate_user(self, user_id):
+        """Drop every cached token of a user"""
+        with self.lock:
+            for token in list(self.by_user.get(user_id, ())):
+                self._remove(token)
+
+    def stats(self):
+        with self.lock:
+            return {"size": len(self.entries), "hits": self.hits, "misses": self.misses}
+
+    def _remove(self, token):
+        # Called with the lock held
+        entry = self.entries.pop(token, None)
+        if entry is None or entry[1] is None:
+            return
+        user_id = entry[1]["user_id"]
+        tokens = self.by_user.get(user_id)
+        if tokens is not None:
+            tokens.discard(token)
+            if not tokens:
+                del self.by_user[user_id]
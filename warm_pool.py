@@ -0,0 +1,89 @@
+import collections
+import threading
+
+
+class WarmPool:
+    """Keeps idle challenge containers ready so starting a challenge is instant.
+
+    ``start_fn(challenge_id)`` starts a neutral container and returns a dict
+    describing it (at least ``container_id`` and ``port``). ``discard_fn(entry)``
+    stops and removes one. Containers are claimed with ``claim`` and the pool
+    is refilled by a background thread.
+    """
+
+    def __init__(self, start_fn, discard_fn, default_size=0, sizes=None):
+        self.start_fn = start_fn
+        self.discard_fn = discard_fn
+        self.default_size = default_size
+        self.sizes = dict(sizes or {})
+        self.challenge_ids = set()
+        self.idle = collections.defaultdict(collections.deque)
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.thread = None
+
+    def target_size(self, challenge_id):
+        return self.sizes.get(challenge_id, self.default_size)
+
+    @property
+    def enabled(self):
+        return self.default_size > 0 or any(size > 0 for size in self.sizes.values())
+
+    def claim(self, challenge_id):
+        """Take an idle container for this challenge, or None if there is none"""
+        with self.lock:
+            idle = self.idle.get(challenge_id)
+            entry = idle.popleft() if idle else None
+
+        # Top the pool back up in the background
+        if challenge_id in self.challenge_ids:
+            self.wakeup.set()
+        return entry
+
+    def discard(self, entry):
+        try:
+            self.discard_fn(entry)
+        except Exception as e:
+            print(f"Error discarding pool container {entry.get('container_id')}: {e}")
+
+    def stats(self):
+        with self.lock:
+            return {
+                challenge_id: {"idle": len(self.idle[challenge_id]), "target": self.target_size(challenge_id)}
+                for challenge_id in sorted(self.challenge_ids)
+            }
+
+    def fill_once(self):
+        """Start containers until every challenge is at its target size"""
+        for challenge_id in sorted(self.challenge_ids):
+            while True:
+                with self.lock:
+                    missing = self.target_size(challenge_id) - len(self.idle[challenge_id])
+                if missing <= 0:
+                    break
+
+                entry = self.start_fn(challenge_id)
+                with self.lock:
+                    self.idle[challenge_id].append(entry)
+                print(f"Warm pool: {challenge_id} has {len(self.idle[challenge_id])} idle container(s)")
+
+    def start(self, challenge_ids, refill_interval=30):
+        """Start the background thread that keeps the pool filled"""
+        self.challenge_ids = {c for c in challenge_ids if self.target_size(c) > 0}
+        if not self.challenge_ids:
+            return None
+
+        def refill_thread():
+            while True:
+                try:
+                    self.fill_once()
+                except Exception as e:
+                    print(f"Error filling warm pool: {e}")
+                # Wait until a container is claimed, or re-check periodically
+                self.wakeup.wait(refill_interval)
+                self.wakeup.clear()
+
+        self.thread = threading.Thread(target=refill_thread, daemon=True)
+        self.thread.start()
+        print(f"Started warm pool for {len(self.challenge_ids)} challenge(s)")
+        return self.thread